@@ -0,0 +1,131 @@
+"""Messages broadcast to every worker process, used to invalidate the
+in-process caches.
+
+`LocalBroadcast` only reaches the current process: it is enough with a
+single worker and in tests. `PostgresBroadcast` relies on LISTEN/NOTIFY so
+that every worker (and the one-off commands) share the channels. Pick one
+with `BROADCAST_BACKEND`.
+"""
+
+import logging
+import select
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Callable
+from sqlalchemy import text
+from .config import BROADCAST_BACKEND
+
+logger = logging.getLogger(__name__)
+
+# Called with the message, or None when messages may have been lost
+type Subscriber = Callable[[str | None], None]
+
+
+class Broadcast(ABC):
+    def __init__(self):
+        self._subscribers: dict[str, list[Subscriber]] = defaultdict(list)
+
+    def subscribe(self, channel: str, callback: Subscriber):
+        self._subscribers[channel].append(callback)
+
+    @abstractmethod
+    def publish(self, channel: str, message: str): ...
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def _dispatch(self, channel: str, message: str | None):
+        for callback in self._subscribers.get(channel, []):
+            try:
+                callback(message)
+            except Exception:
+                logger.exception(f"Broadcast subscriber of '{channel}'")
+
+
+class LocalBroadcast(Broadcast):
+    def publish(self, channel: str, message: str):
+        self._dispatch(channel, message)
+
+
+class PostgresBroadcast(Broadcast):
+    """Messages are sent with NOTIFY and received by a thread LISTENing on
+    a dedicated connection, reconnecting (and telling the subscribers that
+    messages may have been lost) when it is closed.
+    """
+
+    def __init__(self, engine, reconnect_delay: float = 1):
+        super().__init__()
+        self.engine = engine
+        self.reconnect_delay = reconnect_delay
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def publish(self, channel: str, message: str):
+        with self.engine.connect() as connection:
+            connection.execute(
+                text("SELECT pg_notify(:channel, :message)"),
+                {"channel": channel, "message": message},
+            )
+            connection.commit()
+
+    def start(self):
+        if self._thread is None and self._subscribers:
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._listen, name="broadcast", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            try:
+                self._listen_once()
+            except Exception:
+                logger.exception("Broadcast listener connection lost")
+            if self._stopping.is_set():
+                break
+            for channel in self._subscribers:
+                self._dispatch(channel, None)
+            self._stopping.wait(self.reconnect_delay)
+
+    def _listen_once(self):
+        # A connection of its own, outside of the pool
+        connection = self.engine.raw_connection()
+        connection.detach()
+        try:
+            connection.dbapi_connection.autocommit = True
+            cursor = connection.cursor()
+            for channel in self._subscribers:
+                cursor.execute(f'LISTEN "{channel}"')
+            dbapi_connection = connection.dbapi_connection
+            while not self._stopping.is_set():
+                readable, _, _ = select.select([dbapi_connection], [], [], 1)
+                if not readable:
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notify = dbapi_connection.notifies.pop(0)
+                    self._dispatch(notify.channel, notify.payload)
+        finally:
+            connection.close()
+
+
+def create_broadcast() -> Broadcast:
+    if BROADCAST_BACKEND == "postgres":
+        from .database import engine
+
+        return PostgresBroadcast(engine)
+    return LocalBroadcast()
+
+
+broadcast = create_broadcast()
@@ -19,3 +19,101 @@ JWT_COOKIE_NAME = os.getenv("JWT_COOKIE_NAME")
 JWT_ACCESS_TOKEN_EXPIRE_MINUTES = int(
   os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES")
 )
+
+# Maximum amount of worker threads used to run the (synchronous) handlers
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+# Database connections pool: connections kept open and opened on top of them
+# under load, seconds a request waits for a free one before failing with a
+# 503, checking connections before use (pre-ping), seconds after which they
+# are replaced (-1 to never replace them). Handlers hold a connection while
+# they run: DB_POOL_SIZE + DB_MAX_OVERFLOW below THREADPOOL_SIZE has requests
+# wait for one.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_PRE_PING = False if os.getenv("DB_POOL_PRE_PING") == "False" else True
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Seconds to open a connection, milliseconds after which the server cancels
+# a statement (0 to disable)
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "30000"))
+
+# Time budget of the solver used to rate the difficulty of a new puzzle,
+# and of the rating done again off the request path when it is exceeded
+DIFFICULTY_SOLVER_TIMEOUT = float(
+    os.getenv("DIFFICULTY_SOLVER_TIMEOUT", "0.05")
+)
+DIFFICULTY_BACKGROUND_TIMEOUT = float(
+    os.getenv("DIFFICULTY_BACKGROUND_TIMEOUT", "5")
+)
+
+# Puzzles uniqueness verification: grids having more cells than
+# UNIQUENESS_INLINE_MAX_CELLS are checked in a pool of worker processes
+UNIQUENESS_TIMEOUT = float(os.getenv("UNIQUENESS_TIMEOUT", "2"))
+UNIQUENESS_INLINE_MAX_CELLS = int(
+    os.getenv("UNIQUENESS_INLINE_MAX_CELLS", "225")
+)
+UNIQUENESS_POOL_SIZE = int(os.getenv("UNIQUENESS_POOL_SIZE", "2"))
+
+# Most items a batch endpoint takes (games ids, game states)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "200"))
+
+# Bulk imports of games: worker processes validating the games and deriving
+# their clues and difficulty, and lines of the input per transaction
+IMPORT_POOL_SIZE = int(
+    os.getenv("IMPORT_POOL_SIZE", str(os.cpu_count() or 1))
+)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# Rows fetched per round trip by the server-side cursors of the exports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+# Games created from images: largest upload (bytes) and source image
+# (pixels), and largest grid side
+IMAGE_MAX_SIZE = int(os.getenv("IMAGE_MAX_SIZE", "10485760"))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "25000000"))
+IMAGE_GRID_MAX_SIZE = int(os.getenv("IMAGE_GRID_MAX_SIZE", "100"))
+
+# Games thumbnails: largest side (pixels), and directory and size (bytes, 0
+# to disable) of their cache on disk
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "128"))
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", "thumbnails")
+THUMBNAIL_CACHE_MAX_SIZE = int(
+    os.getenv("THUMBNAIL_CACHE_MAX_SIZE", "67108864")
+)
+
+# Per-process cache of the authenticated users identities (0 to disable)
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+
+# Per-process cache of the games details and goal grids (0 to disable)
+GAME_CACHE_SIZE = int(os.getenv("GAME_CACHE_SIZE", "256"))
+GAME_CACHE_TTL = float(os.getenv("GAME_CACHE_TTL", "300"))
+
+# How the caches invalidations reach the other worker processes: "local"
+# (single worker) or "postgres" (LISTEN/NOTIFY). Games are checked against
+# their version anyway, the users identities aren't.
+BROADCAST_BACKEND = os.getenv("BROADCAST_BACKEND", "local")
+
+# Time budget of the grid-wide deduction looking for a hint
+HINT_SOLVER_TIMEOUT = float(os.getenv("HINT_SOLVER_TIMEOUT", "0.2"))
+
+# Game states played over WebSocket are written at most every
+# GAMESTATE_FLUSH_INTERVAL milliseconds
+GAMESTATE_FLUSH_INTERVAL = int(os.getenv("GAMESTATE_FLUSH_INTERVAL", "500"))
+
+# Password hashing: bcrypt cost factor (existing hashes are upgraded on login)
+# and size of the dedicated worker pool and of its waiting queue
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_POOL_SIZE = int(os.getenv("PASSWORD_POOL_SIZE", "2"))
+PASSWORD_QUEUE_SIZE = int(os.getenv("PASSWORD_QUEUE_SIZE", "16"))
+
+# Serve the in-process metrics on /internal/metrics (keep it off the public
+# network), recording the requests latency and queries
+METRICS_ENABLED = True if os.getenv("METRICS_ENABLED") == "True" else False
+
+# SQL statements slower than SLOW_QUERY_THRESHOLD milliseconds (0 to disable)
+# are counted, and logged with a SLOW_QUERY_SAMPLE_RATE probability
+SLOW_QUERY_THRESHOLD = int(os.getenv("SLOW_QUERY_THRESHOLD", "200"))
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_SAMPLE_RATE", "0.1"))
@@ -1,13 +1,57 @@
-from ..config import DATABASE_URL, DB_ECHO_LOG
-from sqlmodel import SQLModel, create_engine
+from typing import Annotated
+from fastapi import Depends
+from ..config import (
+    DATABASE_URL,
+    DB_CONNECT_TIMEOUT,
+    DB_ECHO_LOG,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_TIMEOUT,
+)
+from sqlmodel import Session, create_engine
 from ..models import *
+from .migrate import migrate
+from .pool import TimedQueuePool, register_pool_metrics
+
+
+def get_connect_args():
+    connect_args = {"connect_timeout": DB_CONNECT_TIMEOUT}
+    if DB_STATEMENT_TIMEOUT > 0:
+        # Queries running longer are cancelled by the server
+        connect_args["options"] = (
+            f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"
+        )
+    return connect_args
 
 
 engine = create_engine(
     url=DATABASE_URL,
     echo=DB_ECHO_LOG,
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    pool_recycle=DB_POOL_RECYCLE,
+    connect_args=get_connect_args(),
 )
+register_pool_metrics(engine)
 
 
 def init_db():
-    SQLModel.metadata.create_all(engine)
+    # The schema is the one of the migrations, not SQLModel.metadata
+    migrate(engine)
+
+
+def get_session():
+    # Handlers using this dependency are plain `def` functions: FastAPI runs
+    # them in its (bounded) thread pool so that blocking psycopg2 calls never
+    # stall the event loop.
+    with Session(engine) as session:
+        yield session
+
+
+SessionDep = Annotated[Session, Depends(get_session)]
@@ -0,0 +1,62 @@
+"""One-off command generating the clues (and dimensions) of the games having
+missing or stale clues (i.e. generated from another content).
+
+Run from the project's root with `python -m app.database.backfill_clues`.
+"""
+
+import argparse
+from sqlmodel import Session, select
+from . import engine
+from ..config import DIFFICULTY_BACKGROUND_TIMEOUT
+from ..models.game import Game, bump_catalog_version, invalidate_cached_game
+from ..uniqueness import shutdown_pool
+
+
+def backfill_clues(batch_size: int = 100, rate: bool = False):
+    updated_count = 0
+    last_id = 0
+    with Session(engine) as session:
+        while True:
+            # Iterate by id batches, committing each of them
+            games = session.exec(
+                select(Game)
+                .where(Game.id > last_id)
+                .order_by(Game.id)
+                .limit(batch_size)
+            ).all()
+            if len(games) == 0:
+                break
+            updated_ids = []
+            for game in games:
+                if not game.has_stale_clues:
+                    continue
+                game.update_clues()
+                if rate:
+                    # Not on a request path: with the larger budget
+                    game.update_difficulty(DIFFICULTY_BACKGROUND_TIMEOUT)
+                    game.update_uniqueness()
+                game.bump_version()
+                session.add(game)
+                updated_ids.append(game.id)
+            last_id = games[-1].id
+            if len(updated_ids) > 0:
+                bump_catalog_version(session)
+            session.commit()
+            for id in updated_ids:
+                invalidate_cached_game(id)
+            updated_count += len(updated_ids)
+    return updated_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument(
+        "--rate",
+        action="store_true",
+        help="also update the difficulty and uniqueness of updated games",
+    )
+    args = parser.parse_args()
+    count = backfill_clues(args.batch_size, args.rate)
+    shutdown_pool()
+    print(f"{count} game(s) updated.")
@@ -0,0 +1,59 @@
+"""One-off command rewriting the games and game states contents stored as
+nested lists in the compact format (see `app.models.compact`).
+
+Run from the project's root with `python -m app.database.compact_contents`.
+"""
+
+import argparse
+from sqlalchemy import tuple_
+from sqlalchemy.orm.attributes import flag_modified
+from sqlmodel import Session, select
+from . import engine
+from ..models.game import Game
+from ..models.gamestate import GameState
+
+
+def compact_games(session: Session, batch_size: int):
+    last_id = 0
+    while True:
+        games = session.exec(
+            select(Game)
+            .where(Game.id > last_id)
+            .order_by(Game.id)
+            .limit(batch_size)
+        ).all()
+        if len(games) == 0:
+            break
+        for game in games:
+            flag_modified(game, "content")  # Written back compacted
+            session.add(game)
+        last_id = games[-1].id
+        session.commit()
+
+
+def compact_game_states(session: Session, batch_size: int):
+    last_key = (0, 0)
+    while True:
+        game_states = session.exec(
+            select(GameState)
+            .where(tuple_(GameState.game_id, GameState.user_id) > last_key)
+            .order_by(GameState.game_id, GameState.user_id)
+            .limit(batch_size)
+        ).all()
+        if len(game_states) == 0:
+            break
+        for game_state in game_states:
+            flag_modified(game_state, "current_content")
+            session.add(game_state)
+        last_key = (game_states[-1].game_id, game_states[-1].user_id)
+        session.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    with Session(engine) as session:
+        compact_games(session, args.batch_size)
+        compact_game_states(session, args.batch_size)
+    print("Contents compacted.")
@@ -0,0 +1,242 @@
+"""Query plans check: calls every route of the API and EXPLAINs each query
+they run with sequential scans disabled, so that the planner uses an index
+whenever one can serve the query. Queries still scanning a whole table lack
+an index: they are reported and make the command fail.
+
+The routes are called against the configured database, as a throwaway user
+whose games and game states are deleted at the end: use a development or
+test database.
+
+Run from the project's root with `python -m app.database.explain_check`.
+tests/test_query_plans.py runs it along with the tests.
+"""
+
+import secrets
+import sys
+import orjson
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, event
+from sqlmodel import Session
+
+# Tables whose sequential scans are expected (a single row)
+IGNORED_TABLES = {"catalog"}
+
+EXPLAINED_STATEMENTS = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+CONTENT = [
+    [None, [0, 0, 0, 1.0], None],
+    [[255, 0, 0, 1.0], [0, 0, 0, 1.0], [255, 0, 0, 1.0]],
+    [None, [0, 0, 0, 1.0], None],
+]
+
+
+def get_scanned_tables(plan: dict):
+    """Tables read with a sequential scan by the JSON `plan`."""
+    tables = []
+    if plan.get("Node Type") == "Seq Scan":
+        tables.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        tables.extend(get_scanned_tables(child))
+    return tables
+
+
+class PlanChecker:
+    """Collects the statements run through `engine` whose plan has a
+    sequential scan, with the scanned tables.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.statements_count = 0
+        self.seq_scans: dict[str, set[str]] = {}
+
+    def __enter__(self):
+        event.listen(self.engine, "after_cursor_execute", self._explain)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, "after_cursor_execute", self._explain)
+
+    def _explain(
+        self, connection, cursor, statement, parameters, context, executemany
+    ):
+        if executemany or not statement.lstrip().upper().startswith(
+            EXPLAINED_STATEMENTS
+        ):
+            return
+        self.statements_count += 1
+        # Another cursor of the same connection (and transaction): the
+        # statement's results haven't been fetched yet
+        explain_cursor = cursor.connection.cursor()
+        try:
+            explain_cursor.execute("SET LOCAL enable_seqscan = off")
+            explain_cursor.execute(
+                f"EXPLAIN (FORMAT JSON) {statement}", parameters
+            )
+            plan = explain_cursor.fetchone()[0]
+            explain_cursor.execute("RESET enable_seqscan")
+        finally:
+            explain_cursor.close()
+        if isinstance(plan, (str, bytes)):
+            plan = orjson.loads(plan)
+        tables = set(get_scanned_tables(plan[0]["Plan"])) - IGNORED_TABLES
+        if tables:
+            self.seq_scans.setdefault(statement, set()).update(tables)
+
+
+def check(response, status_code: int = 200):
+    if response.status_code != status_code:
+        raise RuntimeError(
+            f"{response.request.method} {response.request.url.path}: "
+            f"{response.status_code} {response.text}"
+        )
+    return response
+
+
+def call_routes(client: TestClient, engine: Engine):
+    from ..config import JWT_COOKIE_NAME
+    from ..models.game import Game, GameImport
+
+    def get(url, **kwargs):
+        return check(client.get(url, **kwargs))
+
+    name = f"explain-{secrets.token_hex(4)}"
+    password = secrets.token_hex(16)
+    user = {"pseudo": name, "username": f"{name}@example.com"}
+    user_id = check(
+        client.post("/user", json={**user, "password": password}), 201
+    ).json()["id"]
+    response = check(
+        client.post(
+            "/login", data={"username": user["username"], "password": password}
+        ),
+    )
+    client.cookies.set(JWT_COOKIE_NAME, response.cookies.get(JWT_COOKIE_NAME))
+    get("/login")
+    get("/user/me")
+    get(f"/user/{user_id}")
+    for sort in ("id", "pseudo"):
+        response = get("/users", params={"sort": sort, "limit": 1})
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is not None:
+            get("/users", params={"sort": sort, "limit": 1, "cursor": cursor})
+    check(
+        client.put(f"/user/{user_id}", json={**user, "password": password}),
+    )
+
+    game_ids = [
+        check(
+            client.post("/game", json={"name": name, "content": CONTENT}),
+            201,
+        ).json()["id"]
+        for _ in range(2)
+    ]
+    game_id = game_ids[0]
+    for sort in ("id", "name", "difficulty"):
+        for order in ("asc", "desc"):
+            params = {"sort": sort, "order": order, "limit": 1}
+            response = get("/games", params=params)
+            cursor = response.headers["X-Next-Cursor"]
+            get("/games", params={**params, "cursor": cursor})
+            get("/games/me", params=params)
+            get(f"/user/{user_id}/games", params=params)
+    get(
+        "/games",
+        params={
+            "difficulty_min": 1,
+            "difficulty_max": 5,
+            "rows_min": 1,
+            "columns_max": 10,
+        },
+    )
+    get("/games", params={"creator_id": user_id})
+    get(f"/game/{game_id}")
+    get(f"/game/{game_id}/thumbnail")
+    get("/games/batch", params={"id": game_ids})
+    check(
+        client.post(
+            "/games/import",
+            params={"import_id": name},
+            content=orjson.dumps({"name": name, "content": CONTENT}),
+        ),
+    )
+    get("/games/export", params={"since": "2000-01-01T00:00:00Z"})
+    get("/games/export", params={"creator_id": user_id})
+    imported_ids = [
+        game["id"]
+        for game in get("/games/me").json()
+        if game["id"] not in game_ids
+    ]
+    check(
+        client.put(
+            f"/game/{game_ids[1]}", json={"name": name, "content": CONTENT}
+        ),
+    )
+
+    check(
+        client.post(
+            f"/gamestate/{game_id}", json={"current_content": CONTENT}
+        ),
+        201,
+    )
+    get(f"/gamestate/{game_id}")
+    check(
+        client.put(f"/gamestate/{game_id}", json={"current_content": CONTENT}),
+    )
+    check(
+        client.patch(
+            f"/gamestate/{game_id}",
+            json={"changes": [{"row": 0, "col": 0, "value": False}]},
+        ),
+    )
+    get(f"/gamestate/{game_id}/progress")
+    get(f"/gamestate/{game_id}/hint")
+    with client.websocket_connect(f"/gamestate/{game_id}/ws") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"changes": [{"row": 0, "col": 0, "value": None}]})
+        websocket.receive_json()
+    for is_completed in (None, True, False):
+        params = {"limit": 1}
+        if is_completed is not None:
+            params["is_completed"] = is_completed
+        get("/gamestatescompletion", params=params)
+    check(
+        client.put(
+            "/gamestates/batch",
+            json=[
+                {"game_id": id, "current_content": CONTENT} for id in game_ids
+            ],
+        ),
+    )
+    get("/gamestates/batch", params={"game_id": game_ids})
+    get("/gamestates/export", params={"is_completed": False})
+    check(client.delete(f"/gamestate/{game_ids[1]}"), 204)
+
+    # The game still has a game state, the user still has a game
+    check(client.delete(f"/game/{game_id}"), 204)
+    for id in imported_ids:
+        check(client.delete(f"/game/{id}"), 204)
+    check(client.delete(f"/user/{user_id}"), 204)
+    with Session(engine) as session:
+        session.delete(session.get(GameImport, (user_id, name)))
+        game = session.get(Game, game_ids[1])
+        if game is not None:
+            session.delete(game)
+        session.commit()
+
+
+def main():
+    from . import engine
+    from ..main import app
+
+    with PlanChecker(engine) as checker, TestClient(app) as client:
+        call_routes(client, engine)
+    print(f"{checker.statements_count} statement(s) explained.")
+    for statement, tables in checker.seq_scans.items():
+        print(f"\nSequential scan of {", ".join(sorted(tables))}:")
+        print(statement)
+    return 1 if checker.seq_scans else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
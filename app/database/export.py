@@ -0,0 +1,52 @@
+"""Command exporting the games, or the game states of a user, as JSON lines
+(see app/export.py). Exported games can be imported back with
+app.database.import_games.
+
+Run from the project's root with `python -m app.database.export games.jsonl`
+(`--since` with the greatest "updated_at" of a previous export only exports
+the games created or changed since).
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from sqlmodel import Session
+from . import engine
+from ..export import (
+    iter_json_lines,
+    select_exported_game_states,
+    select_exported_games,
+)
+from ..models.game import Game
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "path", nargs="?", help="output file (the standard output if none)"
+    )
+    parser.add_argument("--since", type=datetime.fromisoformat)
+    parser.add_argument("--creator-id", type=int)
+    parser.add_argument(
+        "--user-id", type=int, help="export the game states of this user"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="keep the contents in the compact format",
+    )
+    args = parser.parse_args()
+    if args.user_id is None:
+        statement = select_exported_games(args.since)
+        if args.creator_id is not None:
+            statement = statement.where(Game.creator_id == args.creator_id)
+        content_field = "content"
+    else:
+        statement = select_exported_game_states(args.user_id)
+        content_field = "current_content"
+    output = sys.stdout.buffer if args.path is None else open(args.path, "wb")
+    with output, Session(engine) as session:
+        for line in iter_json_lines(
+            session, statement, content_field, args.compact
+        ):
+            output.write(line)
@@ -0,0 +1,50 @@
+"""Command importing the games of a JSON lines file (one game per line, as
+sent to `POST /game`), see app/games_import.py. Running it again on the same
+file resumes an interrupted import.
+
+Run from the project's root with
+`python -m app.database.import_games games.jsonl`.
+"""
+
+import argparse
+from pathlib import Path
+from sqlmodel import Session
+from . import engine
+from ..config import IMPORT_BATCH_SIZE
+from ..games_import import import_games, shutdown_pool
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", type=Path)
+    parser.add_argument(
+        "--creator-id", type=int, help="user to make the creator of the games"
+    )
+    parser.add_argument(
+        "--import-id",
+        help="id of the import to resume (the file's name by default)",
+    )
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument(
+        "--uniqueness",
+        action="store_true",
+        help="also check the uniqueness of the games (slow)",
+    )
+    args = parser.parse_args()
+    with args.path.open("rb") as file, Session(engine) as session:
+        result = import_games(
+            file,
+            session,
+            args.creator_id,
+            args.import_id or args.path.name,
+            args.uniqueness,
+            args.batch_size,
+        )
+    shutdown_pool()
+    for error in result["errors"]:
+        print(f"Line {error["line"]}: {error["detail"]}")
+    print(
+        f"{result["imported_count"]} game(s) imported, "
+        f"{result["errors_count"]} line(s) rejected, "
+        f"{result["resumed_lines_count"]} line(s) skipped (previous run)."
+    )
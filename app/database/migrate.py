@@ -0,0 +1,101 @@
+"""Database schema migrations.
+
+Migrations are the SQL files of app/database/migrations, named after their
+version (`0006_gamestate_primary_key.sql`). Pending ones are applied in
+version order, each in its own transaction, and recorded in the
+"schema_migration" table.
+
+Run from the project's root with `python -m app.database.migrate`.
+"""
+
+import argparse
+import re
+from pathlib import Path
+from sqlalchemy import Engine, text
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+MIGRATION_NAME_PATTERN = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+# Key of the advisory lock held while migrating, so that workers starting
+# together don't apply the same migration twice
+MIGRATION_LOCK_KEY = 0x70696372
+
+
+def get_migrations(directory: Path = MIGRATIONS_DIR):
+    """Return the (version, name, path) of the migrations, by version."""
+    migrations = {}
+    for path in directory.glob("*.sql"):
+        match = MIGRATION_NAME_PATTERN.match(path.name)
+        if match is None:
+            raise ValueError(f"Invalid migration name ({path.name}).")
+        version = int(match.group(1))
+        if version in migrations:
+            raise ValueError(f"Duplicated migration version ({version}).")
+        migrations[version] = (version, match.group(2), path)
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def migrate(engine: Engine, dry_run: bool = False):
+    """Apply the pending migrations, returning their names."""
+    applied_names = []
+    with engine.connect() as connection:
+        connection.execute(
+            text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+        )
+        try:
+            connection.execute(
+                text(
+                    'CREATE TABLE IF NOT EXISTS "schema_migration" ('
+                    '"version" INT PRIMARY KEY NOT NULL, '
+                    '"name" VARCHAR(128) NOT NULL, '
+                    '"applied_at" TIMESTAMPTZ NOT NULL DEFAULT NOW())'
+                )
+            )
+            connection.commit()
+            applied_versions = set(
+                connection.execute(
+                    text('SELECT "version" FROM "schema_migration"')
+                ).scalars()
+            )
+            connection.commit()
+            for version, name, path in get_migrations():
+                if version in applied_versions:
+                    continue
+                applied_names.append(path.name)
+                if dry_run:
+                    continue
+                with connection.begin():
+                    # Migrations may rewrite whole tables
+                    connection.execute(text("SET LOCAL statement_timeout = 0"))
+                    # Plain SQL scripts, run as they are (without any
+                    # parameters substitution)
+                    connection.connection.cursor().execute(path.read_text())
+                    connection.execute(
+                        text(
+                            'INSERT INTO "schema_migration" '
+                            '("version", "name") VALUES (:version, :name)'
+                        ),
+                        {"version": version, "name": name},
+                    )
+        finally:
+            connection.execute(
+                text("SELECT pg_advisory_unlock(:key)"),
+                {"key": MIGRATION_LOCK_KEY},
+            )
+            connection.commit()
+    return applied_names
+
+
+if __name__ == "__main__":
+    from . import engine
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only list the pending migrations",
+    )
+    args = parser.parse_args()
+    names = migrate(engine, args.dry_run)
+    verb = "Pending" if args.dry_run else "Applied"
+    print(f"{verb} migrations: {", ".join(names) if names else "none"}.")
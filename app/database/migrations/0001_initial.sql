@@ -1,8 +1,7 @@
-BEGIN;
+-- Schema of the databases created with the former init.sql, which are
+-- adopted as they are. Everything added since is in the next migrations.
 
-DROP TABLE IF EXISTS "game", "user", "gamestate";
-
-CREATE TABLE "user" (
+CREATE TABLE IF NOT EXISTS "user" (
   "id" SERIAL PRIMARY KEY NOT NULL UNIQUE,
   "pseudo" VARCHAR(32) NOT NULL UNIQUE,
   "username" VARCHAR(254) NOT NULL UNIQUE CHECK (
@@ -13,24 +12,21 @@ CREATE TABLE "user" (
   "updated_at" TIMESTAMPTZ
 );
 
-CREATE TABLE "game" (
+CREATE TABLE IF NOT EXISTS "game" (
   "id" SERIAL PRIMARY KEY NOT NULL UNIQUE,
   "name" VARCHAR(64) NOT NULL,
   "difficulty" INT NOT NULL,
   "content" JSONB,
   "clues" JSONB,
-	"created_at" TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  "created_at" TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   "updated_at" TIMESTAMPTZ,
   "creator_id" INT REFERENCES "user"("id")
 );
 
-
-CREATE TABLE "gamestate" (
+CREATE TABLE IF NOT EXISTS "gamestate" (
   "id" SERIAL PRIMARY KEY NOT NULL UNIQUE,
   "user_id" INT NOT NULL REFERENCES "user"("id") ON DELETE CASCADE,
   "game_id" INT NOT NULL REFERENCES "game"("id") ON DELETE CASCADE,
   "is_completed" BOOLEAN NOT NULL DEFAULT FALSE,
   "current_content" JSONB
 );
-
-COMMIT;
\ No newline at end of file
@@ -0,0 +1,12 @@
+-- Columns derived from the content when a game is written: hash of the
+-- content the clues were generated from, size of the grid and uniqueness of
+-- its solution. They are NULL on existing games until
+-- `python -m app.database.backfill_clues` is run.
+-- (IF NOT EXISTS: databases created from the models, before there were
+-- migrations, may already have them.)
+
+ALTER TABLE "game"
+  ADD COLUMN IF NOT EXISTS "content_hash" CHAR(64),
+  ADD COLUMN IF NOT EXISTS "uniqueness" VARCHAR(16),
+  ADD COLUMN IF NOT EXISTS "rows_count" INT,
+  ADD COLUMN IF NOT EXISTS "columns_count" INT;
@@ -0,0 +1,4 @@
+-- Mismatching cells per row of the game states, maintained by PATCH
+-- /gamestate/{id} (NULL until the next full update)
+
+ALTER TABLE "gamestate" ADD COLUMN IF NOT EXISTS "row_mismatches" JSONB;
@@ -0,0 +1,12 @@
+-- Versions of the game details and of the games lists, used to build their
+-- ETag
+
+ALTER TABLE "game"
+  ADD COLUMN IF NOT EXISTS "version" INT NOT NULL DEFAULT 1;
+
+CREATE TABLE IF NOT EXISTS "catalog" (
+  "id" INT PRIMARY KEY NOT NULL CHECK ("id" = 1),
+  "version" BIGINT NOT NULL DEFAULT 1
+);
+INSERT INTO "catalog" ("id", "version") VALUES (1, 1)
+  ON CONFLICT DO NOTHING;
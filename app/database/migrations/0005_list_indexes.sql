@@ -0,0 +1,12 @@
+-- Keyset pagination of the games lists (see app/pagination.py), and lists
+-- of the game states of a user
+
+CREATE INDEX IF NOT EXISTS "ix_game_name_id" ON "game" ("name", "id");
+CREATE INDEX IF NOT EXISTS "ix_game_difficulty_id"
+  ON "game" ("difficulty", "id");
+CREATE INDEX IF NOT EXISTS "ix_game_creator_id_id"
+  ON "game" ("creator_id", "id");
+CREATE INDEX IF NOT EXISTS "ix_gamestate_user_id_is_completed_game_id"
+  ON "gamestate" ("user_id", "is_completed", "game_id");
+CREATE INDEX IF NOT EXISTS "ix_gamestate_user_id_game_id"
+  ON "gamestate" ("user_id", "game_id");
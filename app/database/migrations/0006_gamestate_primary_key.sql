@@ -0,0 +1,13 @@
+-- Game states are identified by their game and user, as in the GameState
+-- model: the surrogate id goes (along with its constraints and sequence),
+-- keeping the latest of the duplicated game states if any. The primary key
+-- also serves the lookups (and cascaded deletes) by game.
+
+DELETE FROM "gamestate" AS "older"
+  USING "gamestate" AS "newer"
+  WHERE "older"."game_id" = "newer"."game_id"
+    AND "older"."user_id" = "newer"."user_id"
+    AND "older"."id" < "newer"."id";
+
+ALTER TABLE "gamestate" DROP COLUMN "id";
+ALTER TABLE "gamestate" ADD PRIMARY KEY ("game_id", "user_id");
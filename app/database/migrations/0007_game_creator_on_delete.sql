@@ -0,0 +1,7 @@
+-- Games outlive their creator (as the ORM did it, setting creator_id to
+-- NULL), without loading them when the user is deleted
+
+ALTER TABLE "game"
+  DROP CONSTRAINT "game_creator_id_fkey",
+  ADD CONSTRAINT "game_creator_id_fkey"
+    FOREIGN KEY ("creator_id") REFERENCES "user"("id") ON DELETE SET NULL;
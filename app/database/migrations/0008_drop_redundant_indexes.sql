@@ -0,0 +1,5 @@
+-- Prefixes of "ix_game_name_id" and "ix_game_difficulty_id", which serve the
+-- same lookups
+
+DROP INDEX IF EXISTS "ix_game_name";
+DROP INDEX IF EXISTS "ix_game_difficulty";
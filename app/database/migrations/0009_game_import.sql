@@ -0,0 +1,8 @@
+-- Progress of the resumable bulk imports of games (see app/games_import.py)
+
+CREATE TABLE "gameimport" (
+  "id" VARCHAR(255) PRIMARY KEY NOT NULL,
+  "lines_count" INT NOT NULL DEFAULT 0,
+  "imported_count" INT NOT NULL DEFAULT 0,
+  "updated_at" TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,7 @@
+-- "updated_at" is set on creation too, so that the games created or changed
+-- since a given time can be exported incrementally
+
+UPDATE "game" SET "updated_at" = "created_at" WHERE "updated_at" IS NULL;
+ALTER TABLE "game" ALTER COLUMN "updated_at" SET DEFAULT NOW();
+
+CREATE INDEX "ix_game_updated_at_id" ON "game" ("updated_at", "id");
@@ -0,0 +1,4 @@
+-- Incremented by every write of a game state, so that the copies played over
+-- WebSocket only write it back if it hasn't changed since they loaded it
+
+ALTER TABLE "gamestate" ADD COLUMN "version" INT NOT NULL DEFAULT 1;
@@ -0,0 +1,9 @@
+-- Imports are identified by their creator and id, so that users choosing
+-- the same id (e.g. a file name) don't share their progress. Imports without
+-- a creator (python -m app.database.import_games without --creator-id) have
+-- 0, as do the existing ones, whose creator isn't known.
+
+ALTER TABLE "gameimport" ADD COLUMN "creator_id" INT NOT NULL DEFAULT 0;
+ALTER TABLE "gameimport"
+  DROP CONSTRAINT "gameimport_pkey",
+  ADD PRIMARY KEY ("creator_id", "id");
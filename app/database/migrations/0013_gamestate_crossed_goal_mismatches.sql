@@ -0,0 +1,12 @@
+-- Crossed (False) cells of a goal are only matched by crossed cells, as
+-- before the per row counters: the counters of the game states of such goals
+-- are dropped (recomputed by the next update) and their live copies reloaded
+
+UPDATE "gamestate"
+  SET "row_mismatches" = NULL, "version" = "version" + 1
+  WHERE "row_mismatches" IS NOT NULL
+    AND "game_id" IN (
+      SELECT "id" FROM "game"
+      WHERE "content" @? '$.palette[*] ? (@ == false)'
+        OR "content" @? '$[*][*] ? (@ == false)'
+    );
@@ -0,0 +1,4 @@
+-- Games lists filtered by size (rows_min/rows_max, columns_min/columns_max)
+
+CREATE INDEX "ix_game_rows_count_id" ON "game" ("rows_count", "id");
+CREATE INDEX "ix_game_columns_count_id" ON "game" ("columns_count", "id");
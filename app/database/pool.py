@@ -0,0 +1,66 @@
+"""Connection pool of the engine, timing how long connections are waited for.
+
+Requests needing a connection while all of them are checked out wait for one
+(up to DB_POOL_TIMEOUT seconds). The waits and timeouts are exposed by the
+internal metrics endpoint along with the pool usage.
+"""
+
+import time
+from threading import Lock
+from sqlalchemy import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from .. import metrics
+
+_waiting_count = 0
+_waiting_lock = Lock()
+
+pool_wait_duration = metrics.summary(
+    "db_pool_wait_seconds",
+    "Time spent getting a connection from the pool (opening it included).",
+)
+pool_timeouts = metrics.counter(
+    "db_pool_timeouts_total",
+    "Connections not obtained within DB_POOL_TIMEOUT.",
+)
+metrics.gauge(
+    "db_pool_waiting",
+    "Threads getting a connection from the pool.",
+    lambda: _waiting_count,
+)
+
+
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        global _waiting_count
+        with _waiting_lock:
+            _waiting_count += 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_timeouts.inc()
+            raise
+        finally:
+            pool_wait_duration.observe(time.perf_counter() - start)
+            with _waiting_lock:
+                _waiting_count -= 1
+
+
+def register_pool_metrics(engine: Engine):
+    # engine.pool is read each time, it is replaced by engine.dispose()
+    metrics.gauge(
+        "db_pool_size",
+        "Connections kept in the pool.",
+        lambda: engine.pool.size(),
+    )
+    metrics.gauge(
+        "db_pool_checked_out",
+        "Connections in use.",
+        lambda: engine.pool.checkedout(),
+    )
+    metrics.gauge(
+        "db_pool_overflow",
+        "Connections in use beyond the pool size.",
+        lambda: max(engine.pool.overflow(), 0),
+    )
@@ -0,0 +1,65 @@
+"""Difficulty rating of the puzzles.
+
+Puzzles are rated inline within DIFFICULTY_SOLVER_TIMEOUT. The ones taking
+longer get the hardest rating for the time being and are rated again in the
+solver process pool (see app/uniqueness.py), within
+DIFFICULTY_BACKGROUND_TIMEOUT. The new rating is written to the game unless
+its content changed meanwhile.
+"""
+
+import logging
+from datetime import datetime, timezone
+from sqlalchemy import update
+from sqlmodel import Session
+from .config import DIFFICULTY_BACKGROUND_TIMEOUT
+from .database import engine
+from .models import Clues
+from .models.game import Game, bump_catalog_version, invalidate_cached_game
+from .solver import Solver, get_difficulty
+from .uniqueness import get_pool
+
+logger = logging.getLogger(__name__)
+
+
+def rate_difficulty(clues: Clues, timeout: float):
+    solver = Solver.from_clues(clues, timeout=timeout)
+    return get_difficulty(solver.solve().stats)
+
+
+def save_difficulty(game_id: int, content_hash: str, difficulty: int):
+    with Session(engine) as session:
+        result = session.exec(
+            update(Game)
+            .where(Game.id == game_id)
+            .where(Game.content_hash == content_hash)
+            .where(Game.difficulty != difficulty)
+            .values(
+                difficulty=difficulty,
+                version=Game.version + 1,
+                updated_at=datetime.now(timezone.utc),
+            )
+        )
+        if result.rowcount == 0:  # Same rating, or game changed meanwhile
+            return
+        bump_catalog_version(session)
+        session.commit()
+    invalidate_cached_game(game_id)
+
+
+def schedule_rating(game: Game):
+    """Rate the (saved) `game` again off the request path."""
+    game_id = game.id
+    content_hash = game.content_hash
+    future = get_pool().submit(
+        rate_difficulty, game.clues, DIFFICULTY_BACKGROUND_TIMEOUT
+    )
+
+    def save(future):
+        if future.cancelled():  # Shutting down
+            return
+        try:
+            save_difficulty(game_id, content_hash, future.result())
+        except Exception:
+            logger.exception(f"Difficulty rating of game {game_id}")
+
+    future.add_done_callback(save)
@@ -0,0 +1,51 @@
+"""Conditional GETs: strong ETags, `If-None-Match` and `Cache-Control`.
+
+Responses are cacheable by browsers and shared caches but must be
+revalidated on every use (`no-cache`): a 304 is cheap to produce and a
+cache never serves a puzzle that changed since it was stored.
+"""
+
+import hashlib
+import orjson
+from fastapi import Request, Response, status
+
+PUBLIC_CACHE_CONTROL = "public, no-cache"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+# Representations whose URL changes along with them
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def get_etag(*parts) -> str:
+    """Strong ETag of the representation identified by `parts`."""
+    digest = hashlib.sha256(orjson.dumps(parts)).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def is_not_modified(request: Request, etag: str):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in tags
+
+
+def set_cache_headers(
+    response: Response, etag: str, cache_control: str = PUBLIC_CACHE_CONTROL
+):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+def get_not_modified_response(
+    etag: str,
+    cache_control: str = PUBLIC_CACHE_CONTROL,
+    vary: str | None = None,
+):
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_cache_headers(response, etag, cache_control)
+    if vary is not None:
+        response.headers["Vary"] = vary
+    return response
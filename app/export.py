@@ -0,0 +1,99 @@
+"""Streaming exports of games and game states as JSON lines.
+
+Rows are read through server-side cursors (`yield_per`), EXPORT_BATCH_SIZE
+at a time, and written one line each: memory use doesn't depend on the
+size of the tables. Exported games can be imported back (see
+app/games_import.py) and exported game states sent to
+`PUT /gamestates/batch`.
+"""
+
+from datetime import datetime
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlalchemy import type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import Session, select
+from .config import EXPORT_BATCH_SIZE
+from .database import engine
+from .models.compact import decode_content, is_compact
+from .models.game import Game
+from .models.gamestate import GameState
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def select_exported_games(since: datetime | None = None):
+    """Select the games to export, those created or changed after `since`
+    if given (the greatest "updated_at" of the previous export).
+    """
+    statement = select(
+        Game.id,
+        Game.name,
+        # As stored: not decoded unless required
+        type_coerce(Game.content, JSONB).label("content"),
+        Game.clues,
+        Game.difficulty,
+        Game.uniqueness,
+        Game.rows_count,
+        Game.columns_count,
+        Game.creator_id,
+        Game.version,
+        Game.updated_at,
+    ).order_by(Game.id)
+    if since is not None:
+        statement = statement.where(Game.updated_at > since)
+    return statement
+
+
+def select_exported_game_states(
+    user_id: int, is_completed: bool | None = None
+):
+    statement = (
+        select(
+            GameState.game_id,
+            type_coerce(GameState.current_content, JSONB).label(
+                "current_content"
+            ),
+            GameState.is_completed,
+        )
+        .where(GameState.user_id == user_id)
+        .order_by(GameState.game_id)
+    )
+    if is_completed is not None:
+        statement = statement.where(GameState.is_completed == is_completed)
+    return statement
+
+
+def iter_json_lines(
+    session: Session, statement, content_field: str, compact: bool = False
+):
+    """Lines of the rows of `statement`, their `content_field` being in the
+    compact format if `compact` (when stored that way), as nested lists
+    otherwise.
+    """
+    result = session.exec(
+        statement.execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for row in result:
+        values = row._asdict()
+        content = values[content_field]
+        if not compact and is_compact(content):
+            values[content_field] = decode_content(content)
+        yield orjson.dumps(values) + b"\n"
+
+
+def get_streaming_response(
+    statement, content_field: str, compact: bool = False
+):
+    """Response streaming the lines of `statement` (see `iter_json_lines`),
+    read with a session of its own: the request's one is closed before the
+    response is sent.
+    """
+
+    def iter_lines():
+        with Session(engine) as session:
+            yield from iter_json_lines(
+                session, statement, content_field, compact
+            )
+
+    return StreamingResponse(iter_lines(), media_type=NDJSON_MEDIA_TYPE)
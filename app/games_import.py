@@ -0,0 +1,230 @@
+"""Bulk import of games from JSON lines (one `GameInput` per line).
+
+Lines are validated and their clues and difficulty derived in a pool of
+worker processes, then inserted with multi-row INSERTs, one transaction per
+batch. The progress of an import having an id is committed along with each
+batch: importing the same input again with the same id resumes it.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from typing import AsyncIterable, Iterable
+from pydantic import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select
+from .config import (
+    DIFFICULTY_BACKGROUND_TIMEOUT,
+    IMPORT_POOL_SIZE,
+    UNIQUENESS_TIMEOUT,
+)
+from .models.game import Game, GameImport, GameInput, bump_catalog_version
+from .solver import get_uniqueness
+
+# Length of the "name" column
+NAME_MAX_LENGTH = 64
+# Rejected lines detailed in the import result
+ERRORS_MAX_COUNT = 100
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=IMPORT_POOL_SIZE,
+            # Forking a multi-threaded server process is unsafe
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def derive_game(line: bytes, check_uniqueness: bool = False):
+    """Validate a line and derive the game's columns (in a worker process).
+
+    Return the columns values and None, or None and the validation errors.
+    """
+    try:
+        game = Game.model_validate(GameInput.model_validate_json(line))
+        if len(game.name) > NAME_MAX_LENGTH:
+            raise ValueError(
+                f"Name is longer than {NAME_MAX_LENGTH} characters."
+            )
+        game.update_clues()
+    except ValidationError as error:
+        return None, error.errors(
+            include_url=False, include_context=False, include_input=False
+        )
+    except ValueError as error:
+        return None, str(error)
+    # Already in a worker: with the budget of app.difficulty's ratings and
+    # not through app.uniqueness's pool
+    game.update_difficulty(DIFFICULTY_BACKGROUND_TIMEOUT)
+    if check_uniqueness and game.clues is not None:
+        game.uniqueness = get_uniqueness(game.clues, UNIQUENESS_TIMEOUT)
+    return game.model_dump(exclude={"id", "version", "creator_id"}), None
+
+
+class GameImporter:
+    """Import of games created by `creator_id`, fed by batches of lines
+    (see `import_lines`). `import_id`, if any, identifies the import (of
+    this creator) whose progress is recorded: lines already consumed by a
+    previous run are skipped.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        creator_id: int | None,
+        import_id: str | None = None,
+        check_uniqueness: bool = False,
+    ):
+        self.session = session
+        self.creator_id = creator_id
+        self.import_id = import_id
+        self.check_uniqueness = check_uniqueness
+        # Lines consumed, including the ones skipped when resuming
+        self.lines_count = 0
+        self.imported_count = 0
+        self.resumed_lines_count = 0
+        self.errors_count = 0
+        self.errors = []
+        if import_id is not None:
+            self.resumed_lines_count = self._get_progress()
+
+    @property
+    def _import_key(self):
+        # Creator id of GameImport (0 without creator) and import id
+        creator_id = 0 if self.creator_id is None else self.creator_id
+        return creator_id, self.import_id
+
+    def _get_progress(self):
+        creator_id, import_id = self._import_key
+        self.session.exec(
+            pg_insert(GameImport)
+            .values(
+                creator_id=creator_id,
+                id=import_id,
+                updated_at=datetime.now(timezone.utc),
+            )
+            .on_conflict_do_nothing()
+        )
+        self.session.commit()
+        return self.session.exec(
+            select(GameImport.lines_count)
+            .where(GameImport.creator_id == creator_id)
+            .where(GameImport.id == import_id)
+        ).one()
+
+    def import_lines(self, lines: list[bytes]):
+        """Import the next lines of the input, in one transaction."""
+        # Lines consumed by a previous run of the import
+        skipped_count = min(
+            len(lines), max(0, self.resumed_lines_count - self.lines_count)
+        )
+        self.lines_count += skipped_count
+        lines = lines[skipped_count:]
+        if len(lines) == 0:
+            return
+
+        numbered_lines = [
+            (number, line)
+            for number, line in enumerate(lines, self.lines_count + 1)
+            if line.strip()
+        ]
+        pool = get_pool()
+        derived = pool.map(
+            partial(derive_game, check_uniqueness=self.check_uniqueness),
+            [line for _, line in numbered_lines],
+            chunksize=max(1, len(numbered_lines) // (4 * IMPORT_POOL_SIZE)),
+        )
+        rows = []
+        for (number, _), (values, error) in zip(numbered_lines, derived):
+            if error is not None:
+                self.errors_count += 1
+                if len(self.errors) < ERRORS_MAX_COUNT:
+                    self.errors.append({"line": number, "detail": error})
+                continue
+            rows.append({**values, "creator_id": self.creator_id})
+
+        connection = self.session.connection()
+        if len(rows) > 0:
+            # Executed as multi-row INSERTs by the driver
+            connection.execute(insert(Game), rows)
+            bump_catalog_version(self.session)
+        if self.import_id is not None:
+            creator_id, import_id = self._import_key
+            result = connection.execute(
+                update(GameImport)
+                .where(GameImport.creator_id == creator_id)
+                .where(GameImport.id == import_id)
+                .where(GameImport.lines_count == self.lines_count)
+                .values(
+                    lines_count=self.lines_count + len(lines),
+                    imported_count=GameImport.imported_count + len(rows),
+                    updated_at=datetime.now(timezone.utc),
+                )
+            )
+            if result.rowcount == 0:
+                self.session.rollback()
+                raise ValueError(
+                    f"Import '{self.import_id}' is being run concurrently."
+                )
+        self.session.commit()
+        self.lines_count += len(lines)
+        self.imported_count += len(rows)
+
+    def get_result(self):
+        return {
+            "lines_count": self.lines_count,
+            "resumed_lines_count": min(
+                self.resumed_lines_count, self.lines_count
+            ),
+            "imported_count": self.imported_count,
+            "errors_count": self.errors_count,
+            "errors": self.errors,
+        }
+
+
+def import_games(
+    lines: Iterable[bytes],
+    session: Session,
+    creator_id: int | None,
+    import_id: str | None = None,
+    check_uniqueness: bool = False,
+    batch_size: int = 1000,
+):
+    """Import the games of `lines` (see `GameImporter`), `batch_size` lines
+    per transaction.
+    """
+    importer = GameImporter(session, creator_id, import_id, check_uniqueness)
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == batch_size:
+            importer.import_lines(batch)
+            batch = []
+    importer.import_lines(batch)
+    return importer.get_result()
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]):
+    """Lines of a body received as `chunks` (e.g. `Request.stream()`)."""
+    remainder = b""
+    async for chunk in chunks:
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line
+    if remainder:
+        yield remainder
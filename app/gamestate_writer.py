@@ -0,0 +1,285 @@
+"""Game states played over a WebSocket (see `/gamestate/{id}/ws`).
+
+Cell changes are applied to an in-memory copy of the game state and
+acknowledged right away. The copies having changed are written to the
+database together, every GAMESTATE_FLUSH_INTERVAL milliseconds and when
+their last connection closes, so that a fast player's clicks end up in a
+handful of writes.
+
+Every write stores the whole state in a single transaction: a failed write
+is retried at the next flush, and a crash loses at most the changes of the
+last interval. Copies are per process, so writes are checked against the
+version of the game state: if it was written meanwhile (by an HTTP update,
+a copy in another worker or a change of its game), the copy is reloaded and
+the changes it hadn't written yet are applied again on top of it.
+"""
+
+import asyncio
+import logging
+from typing import Callable
+from sqlalchemy import update
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+from .config import GAMESTATE_FLUSH_INTERVAL
+from .database import engine
+from .models import Content
+from .models.game import get_current_game
+from .models.gamestate import CellChange, GameState
+from .models.grid import PaletteGrid
+
+logger = logging.getLogger(__name__)
+
+# Writes of a flush, a game state written meanwhile being reloaded between
+# each of them
+FLUSH_ATTEMPTS = 3
+
+
+def load_game_state(session: Session, game_id: int, user_id: int):
+    """Return the game state (detached from `session`) and its goal, or None
+    if either doesn't exist.
+    """
+    game_state = session.exec(
+        select(GameState)
+        .where(GameState.game_id == game_id)
+        .where(GameState.user_id == user_id)
+    ).one_or_none()
+    game = get_current_game(game_id, session)
+    if game_state is None or game is None:
+        return None
+    session.expunge(game_state)
+    return game_state, game.goal
+
+
+class LiveGameState:
+    def __init__(
+        self, game_state: GameState, goal_content: Content | PaletteGrid
+    ):
+        self.game_state = game_state
+        self.goal_content = goal_content
+        self.connections_count = 0
+        self.is_dirty = False
+        # Applied since the last write
+        self.pending_changes: list[CellChange] = []
+
+    @property
+    def key(self):
+        return (self.game_state.game_id, self.game_state.user_id)
+
+    @property
+    def is_completed(self):
+        return self.game_state.is_completed
+
+    def apply_changes(self, changes: list[CellChange]):
+        # Raise an IndexError if a change is out of the grid
+        try:
+            self.game_state.apply_changes(changes, self.goal_content)
+        except ValueError:
+            pass  # Applied, but the grid no longer matches the goal's
+        self.pending_changes.extend(changes)
+        self.is_dirty = True
+        return self.game_state.is_completed
+
+    def rebase(
+        self,
+        game_state: GameState,
+        goal_content: Content | PaletteGrid,
+        changes: list[CellChange],
+    ):
+        """Replace the game state by the one reloaded from the database,
+        applying `changes` to it again (the ones out of its grid are
+        dropped).
+        """
+        self.game_state = game_state
+        self.goal_content = goal_content
+        self.pending_changes = []
+        for change in changes:
+            try:
+                game_state.apply_changes([change], goal_content)
+            except IndexError:
+                continue
+            except ValueError:
+                pass  # Applied, but the grid no longer matches the goal's
+            self.pending_changes.append(change)
+        self.is_dirty = len(self.pending_changes) > 0
+
+
+class GameStateWriter:
+    def __init__(
+        self, session_factory: Callable[[], Session], interval: float
+    ):
+        self.session_factory = session_factory
+        self.interval = interval  # Seconds
+        self._live_game_states: dict[tuple[int, int], LiveGameState] = {}
+        # Writes are serialized so that an older snapshot never overwrites
+        # a newer one
+        self._write_lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def get(self, game_id: int, user_id: int):
+        return self._live_game_states.get((game_id, user_id))
+
+    async def open(self, game_id: int, user_id: int, load: Callable):
+        """Return the live game state, `load()` being called (in a worker
+        thread) to get the game state and its goal if it isn't live yet.
+        Return None if `load` returns None.
+        """
+        live_game_state = self._live_game_states.get((game_id, user_id))
+        if live_game_state is None:
+            loaded = await run_in_threadpool(load)
+            if loaded is None:
+                return None
+            # Another connection may have opened it meanwhile
+            live_game_state = self._live_game_states.setdefault(
+                (game_id, user_id), LiveGameState(*loaded)
+            )
+        live_game_state.connections_count += 1
+        return live_game_state
+
+    async def close(self, live_game_state: LiveGameState):
+        live_game_state.connections_count -= 1
+        if live_game_state.connections_count == 0:
+            await self.flush([live_game_state])
+            if live_game_state.connections_count == 0 and (
+                not live_game_state.is_dirty
+            ):
+                self._live_game_states.pop(live_game_state.key, None)
+
+    async def flush(
+        self, live_game_states: list[LiveGameState] | None = None
+    ):
+        async with self._write_lock:
+            if live_game_states is None:
+                live_game_states = list(self._live_game_states.values())
+            # The states reloaded because they were written meanwhile are
+            # written again right away
+            for _ in range(FLUSH_ATTEMPTS):
+                live_game_states = await self._flush(live_game_states)
+                if len(live_game_states) == 0:
+                    break
+
+    async def _flush(self, live_game_states: list[LiveGameState]):
+        """Write the dirty states, returning the ones reloaded (and dirty
+        again) because they were written meanwhile.
+        """
+        dirty = [state for state in live_game_states if state.is_dirty]
+        if len(dirty) == 0:
+            return []
+        # Snapshot on the event loop thread, where changes are applied (they
+        # replace the content and counters instead of mutating them)
+        values = [
+            (
+                state.key,
+                state.game_state.version,
+                {
+                    "current_content": state.game_state.current_content,
+                    "row_mismatches": state.game_state.row_mismatches,
+                    "is_completed": state.game_state.is_completed,
+                },
+            )
+            for state in dirty
+        ]
+        written_changes = {}
+        for state in dirty:
+            state.is_dirty = False
+            written_changes[state.key] = state.pending_changes
+            state.pending_changes = []
+        try:
+            stale_keys = await run_in_threadpool(self._write, values)
+        except Exception:
+            logger.exception("Game states flush failed, retrying later")
+            for state in dirty:
+                state.is_dirty = True
+                state.pending_changes = (
+                    written_changes[state.key] + state.pending_changes
+                )
+            return []
+
+        stale = [state for state in dirty if state.key in stale_keys]
+        for state in dirty:
+            if state.key not in stale_keys:
+                state.game_state.version += 1
+        rebased = []
+        if len(stale) > 0:
+            try:
+                loaded = await run_in_threadpool(
+                    self._load, [state.key for state in stale]
+                )
+            except Exception:
+                logger.exception("Game states reload failed, retrying later")
+                loaded = {}
+            for state in stale:
+                changes = written_changes[state.key] + state.pending_changes
+                if state.key not in loaded:
+                    # Reloaded at the next flush
+                    state.pending_changes = changes
+                    state.is_dirty = True
+                    continue
+                if loaded[state.key] is None:
+                    logger.warning(
+                        "Game state %s deleted while played, changes "
+                        "dropped",
+                        state.key,
+                    )
+                    state.pending_changes = []
+                    state.is_dirty = False
+                    continue
+                state.rebase(*loaded[state.key], changes)
+                if state.is_dirty:
+                    rebased.append(state)
+        # States that were closed while dirty can go now
+        for state in dirty:
+            if state.connections_count == 0 and not state.is_dirty:
+                self._live_game_states.pop(state.key, None)
+        return rebased
+
+    def start(self):
+        if self._task is None:
+            # Bound to the running event loop
+            self._write_lock = asyncio.Lock()
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Let the running flush finish, then write what is left
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except TimeoutError:
+                pass
+            await self.flush()
+
+    def _write(self, values: list):
+        """Write the game states that are still at the version they were
+        read at, returning the keys of the others.
+        """
+        stale_keys = set()
+        with self.session_factory() as session:
+            for (game_id, user_id), version, state_values in values:
+                result = session.exec(
+                    update(GameState)
+                    .where(GameState.game_id == game_id)
+                    .where(GameState.user_id == user_id)
+                    .where(GameState.version == version)
+                    .values(**state_values, version=version + 1)
+                )
+                if result.rowcount == 0:
+                    stale_keys.add((game_id, user_id))
+            session.commit()
+        return stale_keys
+
+    def _load(self, keys: list[tuple[int, int]]):
+        with self.session_factory() as session:
+            return {key: load_game_state(session, *key) for key in keys}
+
+
+writer = GameStateWriter(
+    lambda: Session(engine), GAMESTATE_FLUSH_INTERVAL / 1000
+)
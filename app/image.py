@@ -0,0 +1,118 @@
+"""Conversion of images to puzzles.
+
+The image is downsampled to the grid size (averaging the source pixels of
+each cell), then its colors are quantized to a small palette with k-means,
+computed on arrays. Transparent cells are left empty, as well as the color
+covering the border of the image if the background is removed.
+"""
+
+from io import BytesIO
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from .models.grid import PaletteGrid
+
+# Cells more transparent than this (out of 255) are left empty
+ALPHA_THRESHOLD = 128
+MAX_COLORS_COUNT = 16
+KMEANS_ITERATIONS = 20
+
+
+def kmeans(pixels: np.ndarray, clusters_count: int, seed: int = 0):
+    """Cluster the RGB `pixels` (n x 3 array) into at most `clusters_count`
+    colors, returning the colors and the cluster of each pixel.
+    """
+    rng = np.random.default_rng(seed)
+    distinct = np.unique(pixels, axis=0).astype(np.float64)
+    clusters_count = min(clusters_count, len(distinct))
+    # k-means++ initialization: each center is picked among the pixels with
+    # a probability proportional to its distance to the closest center
+    centers = np.empty((clusters_count, 3), dtype=np.float32)
+    centers[0] = distinct[rng.integers(len(distinct))]
+    distances = ((distinct - centers[0]) ** 2).sum(axis=1)
+    for i in range(1, clusters_count):
+        centers[i] = distinct[
+            rng.choice(len(distinct), p=distances / distances.sum())
+        ]
+        distances = np.minimum(
+            distances, ((distinct - centers[i]) ** 2).sum(axis=1)
+        )
+
+    labels = None
+    for _ in range(KMEANS_ITERATIONS):
+        new_labels = (
+            ((pixels[:, None, :] - centers[None, :, :]) ** 2)
+            .sum(axis=2)
+            .argmin(axis=1)
+        )
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=clusters_count)
+        for channel in range(3):
+            sums = np.bincount(
+                labels, weights=pixels[:, channel], minlength=clusters_count
+            )
+            # Empty clusters keep their center
+            np.divide(
+                sums, counts, out=centers[:, channel], where=counts > 0
+            )
+    return centers, labels
+
+
+def image_to_grid(
+    data: bytes,
+    rows_count: int,
+    columns_count: int,
+    colors_count: int,
+    remove_background: bool = True,
+    max_pixels: int | None = None,
+):
+    """Convert the image file `data` to a grid of `colors_count` colors at
+    most. Raise a ValueError if it isn't a supported image, or has more than
+    `max_pixels` pixels.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        raise ValueError("Invalid or unsupported image.")
+    if max_pixels is not None and image.width * image.height > max_pixels:
+        raise ValueError(f"Image has more than {max_pixels} pixels.")
+    # JPEG images are decoded at a reduced scale when possible
+    image.draft("RGB", (2 * columns_count, 2 * rows_count))
+    try:
+        cells = image.convert("RGBA").resize(
+            (columns_count, rows_count), Image.Resampling.BOX
+        )
+    except OSError:
+        raise ValueError("Invalid or truncated image.")
+    cells = np.asarray(cells, dtype=np.float32).reshape(-1, 4)
+
+    filled = cells[:, 3] >= ALPHA_THRESHOLD
+    indices = np.zeros(rows_count * columns_count, dtype=np.uint8)
+    palette = [None]
+    if filled.any():
+        pixels = cells[filled, :3]
+        centers, labels = kmeans(
+            pixels, colors_count + 1 if remove_background else colors_count
+        )
+        colors = np.rint(centers).astype(np.int64)
+        kept = np.ones(len(colors), dtype=bool)
+        if remove_background:
+            border = np.zeros((rows_count, columns_count), dtype=bool)
+            border[[0, -1], :] = True
+            border[:, [0, -1]] = True
+            border_labels = labels[border.reshape(-1)[filled]]
+            if len(border_labels) > 0:
+                kept[np.bincount(border_labels).argmax()] = False
+        # Palette indices of the clusters (0 for the removed one), colors
+        # equal once rounded sharing the same index
+        palette_indices = np.zeros(len(colors), dtype=np.uint8)
+        lookup = {}
+        for cluster in np.flatnonzero(kept).tolist():
+            color = tuple(colors[cluster].tolist())
+            if color not in lookup:
+                lookup[color] = len(palette)
+                palette.append([*color, 1.0])
+            palette_indices[cluster] = lookup[color]
+        indices[filled] = palette_indices[labels]
+    return PaletteGrid(palette, indices.reshape(rows_count, columns_count))
@@ -0,0 +1,156 @@
+"""Requests and SQL queries instrumentation.
+
+`InstrumentationMiddleware` records, per route, the requests latency and
+responses size, along with the amount of queries and the database time of
+each request. The engine hooks (see `instrument_engine`) time every
+statement, adding it to the request being handled, and log a sample of the
+slow ones.
+
+The per request counters live in a context variable: handlers run in
+worker threads with a copy of the request's context, which shares them.
+"""
+
+import logging
+import random
+from contextvars import ContextVar
+from time import perf_counter
+from sqlalchemy import Engine, event
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# Routes that didn't match (404s): paths would make unbounded labels
+UNMATCHED_ROUTE = "unmatched"
+
+requests_total = metrics.counter(
+    "http_requests_total",
+    "Requests handled, by route and status code.",
+    ("method", "route", "status"),
+)
+request_duration = metrics.histogram(
+    "http_request_duration_seconds",
+    "Requests latency, up to the end of the response.",
+    label_names=("method", "route"),
+)
+request_queries = metrics.histogram(
+    "http_request_queries",
+    "SQL statements executed per request.",
+    QUERIES_BUCKETS,
+    ("method", "route"),
+)
+request_db_duration = metrics.histogram(
+    "http_request_db_seconds",
+    "Time spent executing SQL statements per request.",
+    label_names=("method", "route"),
+)
+response_size = metrics.histogram(
+    "http_response_size_bytes",
+    "Responses body size.",
+    SIZE_BUCKETS,
+    ("method", "route"),
+)
+query_duration = metrics.histogram(
+    "db_query_duration_seconds", "SQL statements execution time."
+)
+slow_queries = metrics.counter(
+    "db_slow_queries_total",
+    "SQL statements slower than SLOW_QUERY_THRESHOLD (logged or not).",
+)
+
+
+class RequestStats:
+    __slots__ = ("request", "queries_count", "db_duration")
+
+    def __init__(self, request: str):
+        self.request = request
+        self.queries_count = 0
+        self.db_duration = 0.0
+
+
+_request_stats: ContextVar[RequestStats | None] = ContextVar(
+    "request_stats", default=None
+)
+
+
+class InstrumentationMiddleware:
+    """Pure ASGI middleware (it doesn't buffer nor wrap the responses)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(f"{scope["method"]} {scope["path"]}")
+        token = _request_stats.set(stats)
+        status_code = 500
+        size = 0
+
+        async def send_and_measure(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_and_measure)
+        finally:
+            duration = perf_counter() - start
+            _request_stats.reset(token)
+            # Set by the router once matched
+            route = scope.get("route")
+            labels = (
+                scope["method"],
+                UNMATCHED_ROUTE if route is None else route.path,
+            )
+            requests_total.inc(labels=(*labels, str(status_code)))
+            request_duration.observe(duration, labels)
+            request_queries.observe(stats.queries_count, labels)
+            request_db_duration.observe(stats.db_duration, labels)
+            response_size.observe(size, labels)
+
+
+def instrument_engine(
+    engine: Engine,
+    slow_query_threshold: float = 0,
+    slow_query_sample_rate: float = 1,
+):
+    """Time the statements executed through `engine`. Statements slower than
+    `slow_query_threshold` seconds (0 to disable) are counted and logged
+    with a `slow_query_sample_rate` probability.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(connection, cursor, statement, parameters, context, many):
+        connection.info.setdefault("query_start", []).append(perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(connection, cursor, statement, parameters, context, many):
+        duration = perf_counter() - connection.info["query_start"].pop()
+        query_duration.observe(duration)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries_count += 1
+            stats.db_duration += duration
+        if 0 < slow_query_threshold <= duration:
+            slow_queries.inc()
+            if random.random() < slow_query_sample_rate:
+                # Without the parameters, which may be sensitive
+                logger.warning(
+                    "Slow query (%.1f ms, %s): %s",
+                    duration * 1000,
+                    "no request" if stats is None else stats.request,
+                    " ".join(statement.split()),
+                )
+
+    @event.listens_for(engine, "handle_error")
+    def discard_query(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
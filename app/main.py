@@ -1,18 +1,66 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from anyio import to_thread
+from fastapi import FastAPI, Request, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from fastapi.middleware.cors import CORSMiddleware
 from . import config
+from .broadcast import broadcast
+from .database import engine
+from .games_import import shutdown_pool as shutdown_import_pool
+from .gamestate_writer import writer
+from .instrumentation import InstrumentationMiddleware, instrument_engine
+from .pagination import NEXT_CURSOR_HEADER
+from .security import shutdown_password_pool
+from .uniqueness import shutdown_pool
 
 # from .database import init_db
-from .routers import game, user, gamestate
+from .routers import game, user, gamestate, metrics
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Handlers are synchronous and run in anyio's thread pool: bound it so
+    # that a burst of requests queues instead of spawning unlimited threads.
+    limiter = to_thread.current_default_thread_limiter()
+    limiter.total_tokens = config.THREADPOOL_SIZE
+    broadcast.start()
+    writer.start()
+    yield
+    await writer.stop()
+    broadcast.stop()
+    shutdown_pool()
+    shutdown_import_pool()
+    shutdown_password_pool()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=config.ALLOWED_ORIGINS,
     allow_credentials=True,
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
+if config.METRICS_ENABLED:
+    app.add_middleware(InstrumentationMiddleware)
+if config.METRICS_ENABLED or config.SLOW_QUERY_THRESHOLD > 0:
+    instrument_engine(
+        engine,
+        config.SLOW_QUERY_THRESHOLD / 1000,
+        config.SLOW_QUERY_SAMPLE_RATE,
+    )
+
+
+@app.exception_handler(PoolTimeoutError)
+async def handle_pool_timeout(request: Request, error: PoolTimeoutError):
+    # No database connection got free within DB_POOL_TIMEOUT
+    return ORJSONResponse(
+        {"detail": "Server is busy, retry later."},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
+
 
 # @app.get("/")
 # async def root():
@@ -22,9 +70,9 @@ app.add_middleware(
 app.include_router(game.router)
 app.include_router(user.router)
 app.include_router(gamestate.router)
+if config.METRICS_ENABLED:
+    app.include_router(metrics.router)
 
 
 # if __name__ == "__main__":
 #     init_db()
-
-# TODO: Define some indexes ? (https://sqlmodel.tiangolo.com/tutorial/indexes/)
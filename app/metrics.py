@@ -0,0 +1,273 @@
+"""In-process metrics, exposed by the internal metrics endpoint (as JSON or
+in the Prometheus text format).
+
+Metrics are registered once at import time and updated from any thread.
+Values are per worker process. Counters and histograms can have labels,
+given as a tuple of values matching their `label_names` (keep their
+cardinality low: routes templates, not paths).
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from typing import Callable
+
+# Seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry: dict[str, "Counter | Summary | Gauge | Histogram"] = {}
+
+
+def _format_value(value: float):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape_label_value(value):
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def _format_labels(names: tuple[str, ...], values: tuple):
+    if len(names) == 0:
+        return ""
+    labels = ",".join(
+        f'{name}="{_escape_label_value(value)}"'
+        for name, value in zip(names, values)
+    )
+    return f"{{{labels}}}"
+
+
+def _get_header(name: str, description: str, type: str):
+    return [f"# HELP {name} {description}", f"# TYPE {name} {type}"]
+
+
+class Counter:
+    def __init__(
+        self, name: str, description: str, label_names: tuple[str, ...] = ()
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values: dict[tuple, float] = {}
+        self._lock = Lock()
+
+    @property
+    def value(self):
+        return self._values.get((), 0)
+
+    def inc(self, amount: float = 1, labels: tuple = ()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        if len(self.label_names) == 0:
+            return self.value
+        with self._lock:
+            return {" ".join(labels): v for labels, v in self._values.items()}
+
+    def render(self):
+        lines = _get_header(self.name, self.description, "counter")
+        with self._lock:
+            values = dict(self._values) if self._values else {(): 0}
+        for labels, value in values.items():
+            lines.append(
+                f"{self.name}{_format_labels(self.label_names, labels)} "
+                f"{_format_value(value)}"
+            )
+        return lines
+
+
+class Summary:
+    """Count, sum and maximum of observed values (durations in seconds)."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of the block (or decorated function)."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return {"count": self.count, "sum": self.sum, "max": self.max}
+
+    def render(self):
+        snapshot = self.snapshot()
+        return [
+            *_get_header(self.name, self.description, "summary"),
+            f"{self.name}_count {snapshot["count"]}",
+            f"{self.name}_sum {_format_value(snapshot["sum"])}",
+            *_get_header(
+                f"{self.name}_max", f"Maximum of {self.name}.", "gauge"
+            ),
+            f"{self.name}_max {_format_value(snapshot["max"])}",
+        ]
+
+
+class Gauge:
+    """Value read from `callback` when the metrics are collected."""
+
+    def __init__(self, name: str, description: str, callback: Callable):
+        self.name = name
+        self.description = description
+        self.callback = callback
+
+    def snapshot(self):
+        return self.callback()
+
+    def render(self):
+        return [
+            *_get_header(self.name, self.description, "gauge"),
+            f"{self.name} {_format_value(self.snapshot())}",
+        ]
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self, buckets_count: int):
+        # Per bucket (not cumulative), the last one being +Inf
+        self.counts = [0] * (buckets_count + 1)
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram:
+    """Observed values counted in buckets (upper bounds), as in Prometheus."""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        label_names: tuple[str, ...] = (),
+    ):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.label_names = label_names
+        self._series: dict[tuple, _HistogramSeries] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, labels: tuple = ()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = _HistogramSeries(
+                    len(self.buckets)
+                )
+            series.counts[index] += 1
+            series.count += 1
+            series.sum += value
+
+    @contextmanager
+    def time(self, labels: tuple = ()):
+        """Observe the duration of the block (or decorated function)."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, labels)
+
+    def _copy_series(self):
+        with self._lock:
+            return [
+                (labels, list(series.counts), series.count, series.sum)
+                for labels, series in self._series.items()
+            ]
+
+    def snapshot(self):
+        snapshots = {
+            " ".join(labels): {"count": count, "sum": sum}
+            for labels, _, count, sum in self._copy_series()
+        }
+        if len(self.label_names) == 0:
+            return snapshots.get("", {"count": 0, "sum": 0.0})
+        return snapshots
+
+    def render(self):
+        lines = _get_header(self.name, self.description, "histogram")
+        label_names = (*self.label_names, "le")
+        for labels, counts, count, sum in self._copy_series():
+            cumulative_count = 0
+            for bound, bucket_count in zip(
+                (*self.buckets, float("inf")), counts
+            ):
+                cumulative_count += bucket_count
+                bucket_labels = _format_labels(
+                    label_names, (*labels, _format_value(bound))
+                )
+                lines.append(
+                    f"{self.name}_bucket{bucket_labels} {cumulative_count}"
+                )
+            series_labels = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_count{series_labels} {count}")
+            lines.append(
+                f"{self.name}_sum{series_labels} {_format_value(sum)}"
+            )
+        return lines
+
+
+def _register(metric):
+    if metric.name in _registry:
+        raise ValueError(f"Metric '{metric.name}' is already registered.")
+    _registry[metric.name] = metric
+    return metric
+
+
+def counter(name: str, description: str, label_names: tuple[str, ...] = ()):
+    return _register(Counter(name, description, label_names))
+
+
+def summary(name: str, description: str):
+    return _register(Summary(name, description))
+
+
+def gauge(name: str, description: str, callback: Callable):
+    return _register(Gauge(name, description, callback))
+
+
+def histogram(
+    name: str,
+    description: str,
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    label_names: tuple[str, ...] = (),
+):
+    return _register(Histogram(name, description, buckets, label_names))
+
+
+def collect():
+    return {name: metric.snapshot() for name, metric in _registry.items()}
+
+
+def render_prometheus():
+    """Metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,108 @@
+"""Compact storage and wire format of the contents.
+
+A content is stored as a palette of its distinct cell values (index 0 being
+None) and one string per row, each character encoding the palette index of a
+cell (see `PaletteGrid.to_compact`):
+
+    {"palette": [null, [0, 0, 0, 1.0], false], "rows": ["0110", "2112"]}
+
+Contents that can't be encoded that way (ragged rows, too many colors) are
+kept as nested lists, and both formats are read transparently.
+"""
+
+from fastapi import Request
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.types import TypeDecorator
+from .grid import PaletteGrid
+from . import Content
+
+COMPACT_MEDIA_TYPE = "application/vnd.picross.compact+json"
+
+
+def is_compact(value):
+    return isinstance(value, dict) and "palette" in value and "rows" in value
+
+
+def encode_content(content: Content | None):
+    """Return the compact content, or None if it can't be encoded."""
+    if content is None or any(row is None for row in content):
+        return None
+    try:
+        grid = PaletteGrid.from_content(content)
+    except (TypeError, ValueError):
+        return None
+    return grid.to_compact()
+
+
+def decode_content(compact: dict) -> Content:
+    return PaletteGrid.from_compact(compact).to_content()
+
+
+def decode_if_compact(value):
+    """Pydantic "before" validator accepting compact contents as input."""
+    if not is_compact(value):
+        return value
+    try:
+        return decode_content(value)
+    except (IndexError, TypeError):
+        raise ValueError("Invalid compact content.")
+
+
+def accepts_compact(request: Request):
+    return COMPACT_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def get_json_response(model: BaseModel, status_code: int = 200):
+    """Response of `model`. Returning the model itself would have FastAPI
+    go through `jsonable_encoder`, which is very slow on the contents.
+    The route's `status_code` doesn't apply to it, it must be given here.
+    """
+    return ORJSONResponse(model.model_dump(mode="json"), status_code)
+
+
+def get_json_list_response(models: list[BaseModel]):
+    return ORJSONResponse([model.model_dump(mode="json") for model in models])
+
+
+def dump_compact(model: BaseModel, field: str):
+    """Data of `model` having its `field` content in compact format."""
+    data = model.model_dump(mode="json")
+    compact = encode_content(data[field])
+    if compact is not None:
+        data[field] = compact
+    return data
+
+
+def get_compact_response(model: BaseModel, field: str):
+    return ORJSONResponse(
+        dump_compact(model, field),
+        media_type=COMPACT_MEDIA_TYPE,
+        headers={"Vary": "Accept"},
+    )
+
+
+def get_compact_list_response(models: list[BaseModel], field: str):
+    return ORJSONResponse(
+        [dump_compact(model, field) for model in models],
+        media_type=COMPACT_MEDIA_TYPE,
+        headers={"Vary": "Accept"},
+    )
+
+
+class CompactContentType(TypeDecorator):
+    """JSONB column storing a content in the compact format when possible."""
+
+    impl = JSONB
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or is_compact(value):
+            return value
+        return encode_content(value) or value
+
+    def process_result_value(self, value, dialect):
+        if is_compact(value):
+            return decode_content(value)
+        return value
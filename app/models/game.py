@@ -1,86 +1,211 @@
-import copy
-from random import randint
-from sqlalchemy import Column
-from sqlmodel import Field, SQLModel, Relationship
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import orjson
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    String,
+    type_coerce,
+    update,
+)
+from sqlalchemy.orm import joinedload, load_only
+from sqlmodel import Field, SQLModel, Relationship, Session, select
 from sqlalchemy.dialects.postgresql import JSONB
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, field_validator
 from .gamestate import GameState
 from .user import User, UserSummary
-from . import ClueLine, Clues, LineContent, Content
+from .grid import PaletteGrid
+from .compact import (
+    CompactContentType,
+    decode_content,
+    decode_if_compact,
+    encode_content,
+    is_compact,
+)
+from . import Clues, Content
+from ..broadcast import broadcast
+from .. import metrics
+from ..cache import TTLCache
+from ..config import DIFFICULTY_SOLVER_TIMEOUT, GAME_CACHE_SIZE, GAME_CACHE_TTL
+from ..solver import Solver, Uniqueness, get_difficulty
+from ..uniqueness import check_uniqueness
+
+update_clues_duration = metrics.histogram(
+    "game_update_clues_seconds", "Duration of the games clues updates."
+)
+
+
+def get_content_hash(content: Content | None):
+    if content is None:
+        return None
+    return hashlib.sha256(orjson.dumps(content)).hexdigest()
 
 
 class Game(SQLModel, table=True):
+    # Keyset pagination of the games lists (see app/pagination.py)
+    __table_args__ = (
+        Index("ix_game_name_id", "name", "id"),
+        Index("ix_game_difficulty_id", "difficulty", "id"),
+        Index("ix_game_creator_id_id", "creator_id", "id"),
+        # Size filters of the games lists
+        Index("ix_game_rows_count_id", "rows_count", "id"),
+        Index("ix_game_columns_count_id", "columns_count", "id"),
+        # Incremental exports (see app/export.py)
+        Index("ix_game_updated_at_id", "updated_at", "id"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
-    name: str = Field(index=True)
-    difficulty: int | None = Field(default=None, index=True)
-    content: Content | None = Field(default=None, sa_column=Column(JSONB))
+    name: str
+    difficulty: int | None = None
+    content: Content | None = Field(
+        default=None, sa_column=Column(CompactContentType)
+    )
     clues: Clues | None = Field(default=None, sa_column=Column(JSONB))
-    creator_id: int | None = Field(default=None, foreign_key="user.id")
+    # Hash of the content the clues were generated from
+    content_hash: str | None = Field(
+        default=None, sa_column=Column(String(64))
+    )
+    uniqueness: Uniqueness | None = Field(
+        default=None, sa_column=Column(String(16))
+    )
+    rows_count: int | None = None
+    columns_count: int | None = None
+    # Incremented on every change of the game details (see bump_version)
+    version: int = 1
+    # Time of the creation or of the last change
+    updated_at: datetime | None = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=Column(DateTime(timezone=True)),
+    )
+    # Set to NULL when the creator is deleted
+    creator_id: int | None = Field(
+        default=None,
+        sa_column_args=[ForeignKey("user.id", ondelete="SET NULL")],
+    )
 
     creator: User | None = Relationship(back_populates="created_games")
-    player_links: list[GameState] = Relationship(back_populates="game")
+    # Game states are deleted by the database along with the game
+    player_links: list[GameState] = Relationship(
+        back_populates="game",
+        sa_relationship_kwargs={
+            "cascade": "save-update, merge, delete",
+            "passive_deletes": True,
+        },
+    )
 
-    def update_difficulty(self):
-        # TODO: algorithm to calculate difficulty
-        if self.content is None:
-            self.difficulty = None
-        self.difficulty = randint(1, 5)
+    def update_difficulty(self, timeout: float = DIFFICULTY_SOLVER_TIMEOUT):
+        """Rate the difficulty within `timeout` seconds. Return False if the
+        solver ran out of time, the rating being provisional (see
+        app/difficulty.py).
+        """
+        # Clues must be up to date (see update_clues)
+        if self.clues is None:
+            self.difficulty = 1  # Nothing to solve
+            return True
+        stats = Solver.from_clues(self.clues, timeout=timeout).solve().stats
+        self.difficulty = get_difficulty(stats)
+        return not stats.timed_out
 
-    def update_clues(self):
-        def get_line_clues(line_content: LineContent):
-            clue_line: ClueLine = []
-            last_rgba = False
-            is_first_index = True
-            for rgba in line_content:
-                if (
-                    is_first_index is not True  # Not the firt cell
-                    and rgba != None
-                    and last_rgba == rgba  # Same color than previous cell
-                ):
-                    clue_line[-1]["count"] += 1  # Increment clue count
-                else:
-                    if rgba is not None:  # Add new clue
-                        clue_line.append(
-                            {
-                                "rgba": copy.copy(rgba),
-                                "count": 1,
-                            }
-                        )
-                    last_rgba = copy.copy(rgba)
-                    is_first_index = False
-            if len(clue_line) == 0:
-                return None
-            return clue_line
+    def update_uniqueness(self):
+        # Clues must be up to date (see update_clues)
+        self.uniqueness = check_uniqueness(self.clues)
 
+    @update_clues_duration.time()
+    def update_clues(self):
+        self.content_hash = get_content_hash(self.content)
         if self.content is None:
             self.clues = None
+            self.rows_count = None
+            self.columns_count = None
             return
+        grid = PaletteGrid.from_content(self.content)
+        self.rows_count = grid.rows_count
+        self.columns_count = grid.columns_count
+        self.clues = grid.get_clues()
 
-        # Get pivoted content for colums
-        columns_content: Content = []
-        for i in range(self.columns_count):
-            columns_content.append(list(map(lambda row: row[i], self.content)))
+    def bump_version(self):
+        # The ETag of the game details derives from the version
+        self.version += 1
+        self.updated_at = datetime.now(timezone.utc)
 
-        self.clues = [
-            list(map(get_line_clues, self.content)),
-            list(map(get_line_clues, columns_content)),
-        ]
+    @property
+    def has_stale_clues(self):
+        if self.content is not None and (
+            self.clues is None or self.rows_count is None
+        ):
+            return True
+        return self.content_hash != get_content_hash(self.content)
 
     @property
     def players_ids(self):
         return [game_state.user_id for game_state in self.player_links]
 
-    @property
-    def rows_count(self):
-        if self.content is None:
-            return None
-        return len(self.content)
 
-    @property
-    def columns_count(self):
-        if self.content is None:
-            return None
-        return max([len(row) for row in self.content])
+class Catalog(SQLModel, table=True):
+    """Single row holding the version of the games catalog, incremented
+    (in the same transaction) by every change visible in the games lists.
+    """
+
+    id: int = Field(default=1, primary_key=True)
+    version: int = Field(default=1, sa_column=Column(BigInteger))
+
+
+class GameImport(SQLModel, table=True):
+    """Progress of a bulk import (see app/games_import.py), committed along
+    with each batch of games so that an interrupted import can resume.
+    """
+
+    # Import ids are chosen by their creator (e.g. a file name): imports of
+    # different users have their own progress. 0 for the imports without a
+    # creator, made by `python -m app.database.import_games`.
+    creator_id: int = Field(default=0, primary_key=True)
+    id: str = Field(primary_key=True, max_length=255)
+    # Lines of the input consumed, imported or rejected
+    lines_count: int = 0
+    imported_count: int = 0
+    updated_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True))
+    )
+
+
+def get_catalog_version(session: Session) -> int | None:
+    return session.exec(
+        select(Catalog.version).where(Catalog.id == 1)
+    ).one_or_none()
+
+
+def bump_catalog_version(session: Session):
+    session.exec(
+        update(Catalog)
+        .where(Catalog.id == 1)
+        .values(version=Catalog.version + 1)
+    )
+
+
+def select_game_summaries(with_creator: bool = False):
+    """Select games loading only the columns needed by the summary models
+    (and their creator in the same query if `with_creator`).
+    """
+    statement = select(Game).options(
+        load_only(
+            Game.id,
+            Game.name,
+            Game.difficulty,
+            Game.rows_count,
+            Game.columns_count,
+            Game.creator_id,
+            Game.version,
+        )
+    )
+    if with_creator:
+        statement = statement.options(
+            joinedload(Game.creator).load_only(User.id, User.pseudo)
+        )
+    return statement
 
 
 class GameSummary(BaseModel):
@@ -89,6 +214,8 @@ class GameSummary(BaseModel):
     difficulty: int
     rows_count: int | None
     columns_count: int | None
+    # Of the thumbnail URL (see get_game_thumbnail)
+    version: int
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -102,6 +229,7 @@ class GameSummaryWithCreator(GameSummary):
 class GameDetails(GameSummaryWithCreator):
     content: Content | None
     clues: Clues | None
+    uniqueness: Uniqueness | None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -109,3 +237,234 @@ class GameDetails(GameSummaryWithCreator):
 class GameInput(BaseModel):
     name: str
     content: Content | None
+
+    @field_validator("content", mode="before")
+    @classmethod
+    def decode_compact_content(cls, value):
+        return decode_if_compact(value)
+
+    @field_validator("content")
+    @classmethod
+    def check_rows(cls, content: Content | None):
+        # Checked before the grid is built from it (see update_clues)
+        if content is None:
+            return content
+        if any(row is None for row in content):
+            raise ValueError("Content rows can't be null.")
+        if len({len(row) for row in content}) > 1:
+            raise ValueError(
+                "Content rows don't have the same amount of cells."
+            )
+        return content
+
+    @field_validator("content")
+    @classmethod
+    def check_colors(cls, content: Content | None):
+        if content is None:
+            return content
+        colors = {
+            tuple(cell)
+            for row in content
+            for cell in row
+            if isinstance(cell, list)
+        }
+        for color in colors:
+            if len(color) != 4:
+                raise ValueError(f"Color {list(color)} isn't RGBA.")
+            *channels, alpha = color
+            if not all(0 <= channel <= 255 for channel in channels) or not (
+                0 <= alpha <= 1
+            ):
+                raise ValueError(
+                    f"Color {list(color)} is out of range (0-255 channels, "
+                    "0-1 alpha)."
+                )
+        return content
+
+
+@dataclass
+class CachedGame:
+    """Game details (but the creator, whose pseudo can change) and goal grid,
+    kept in memory by `get_cached_game`.
+    """
+
+    id: int
+    version: int
+    name: str
+    difficulty: int
+    uniqueness: Uniqueness | None
+    rows_count: int | None
+    columns_count: int | None
+    clues: Clues | None
+    creator_id: int | None
+    compact_content: dict | None
+    content: Content | None  # Only kept when there is no compact content
+    # Goal as expected by GameState.update_is_completed
+    goal: PaletteGrid | Content | None
+    # JSON of the biggest fields, by name (see get_details_json)
+    serialized: dict[str, orjson.Fragment] = field(
+        default_factory=dict, repr=False
+    )
+
+    @classmethod
+    def from_row(cls, row):
+        content = row.content
+        compact_content = (
+            content if is_compact(content) else encode_content(content)
+        )
+        goal = content
+        if compact_content is not None:
+            content = None
+            goal = PaletteGrid.from_content(decode_content(compact_content))
+        return cls(
+            id=row.id,
+            version=row.version,
+            name=row.name,
+            difficulty=row.difficulty,
+            uniqueness=row.uniqueness,
+            rows_count=row.rows_count,
+            columns_count=row.columns_count,
+            clues=row.clues,
+            creator_id=row.creator_id,
+            compact_content=compact_content,
+            content=content,
+            goal=goal,
+        )
+
+    def get_content(self) -> Content | None:
+        if self.compact_content is not None:
+            return decode_content(self.compact_content)
+        return self.content
+
+    def _get_json(self, name: str, get_value):
+        # Serialized once per cached game (concurrent requests may both
+        # serialize it, with the same result)
+        value = self.serialized.get(name)
+        if value is None:
+            value = orjson.Fragment(orjson.dumps(get_value()))
+            self.serialized[name] = value
+        return value
+
+    def get_details_json(
+        self, creator: UserSummary | None, compact: bool = False
+    ) -> bytes:
+        """Serialized GameDetails (with the content in compact format if
+        `compact` and possible), skipping its validation: the content and
+        clues are serialized once and reused as is.
+        """
+        if compact and self.compact_content is not None:
+            content = self._get_json(
+                "compact_content", lambda: self.compact_content
+            )
+        else:
+            content = self._get_json("content", self.get_content)
+        return orjson.dumps(
+            {
+                "id": self.id,
+                "name": self.name,
+                "difficulty": self.difficulty,
+                "rows_count": self.rows_count,
+                "columns_count": self.columns_count,
+                "version": self.version,
+                "creator": None if creator is None else creator.model_dump(),
+                "content": content,
+                "clues": self._get_json("clues", lambda: self.clues),
+                "uniqueness": self.uniqueness,
+            }
+        )
+
+
+# Games by id, invalidated through the broadcast channel when they change
+game_cache = TTLCache(GAME_CACHE_SIZE, GAME_CACHE_TTL)
+GAME_CHANNEL = "picross_game"
+_invalidations_count = 0
+
+
+def _on_game_invalidated(message: str | None):
+    global _invalidations_count
+    _invalidations_count += 1
+    if message is None:
+        game_cache.clear()
+    else:
+        game_cache.delete(int(message))
+
+
+broadcast.subscribe(GAME_CHANNEL, _on_game_invalidated)
+
+
+def get_cached_game(id: int, session: Session, version: int | None = None):
+    """Return the game from the cache, loading it if it isn't there (or
+    isn't at the given `version`). Return None if the game doesn't exist.
+    """
+    versions = None if version is None else {id: version}
+    return get_cached_games([id], session, versions).get(id)
+
+
+def get_cached_games(
+    ids: list[int], session: Session, versions: dict[int, int] | None = None
+) -> dict[int, CachedGame]:
+    """Return the games found among `ids`, by id. The ones that aren't cached
+    (or aren't at their version in `versions`) are loaded in a single query.
+    """
+    games = {}
+    missing_ids = []
+    for id in ids:
+        cached_game = game_cache.get(id)
+        if cached_game is not None and (
+            versions is None or cached_game.version == versions.get(id)
+        ):
+            games[id] = cached_game
+        else:
+            missing_ids.append(id)
+    if len(missing_ids) == 0:
+        return games
+    invalidations_count = _invalidations_count
+    rows = session.exec(
+        select(
+            Game.id,
+            Game.version,
+            Game.name,
+            Game.difficulty,
+            Game.uniqueness,
+            Game.rows_count,
+            Game.columns_count,
+            Game.clues,
+            Game.creator_id,
+            # Stored value, compact when possible
+            type_coerce(Game.content, JSONB).label("content"),
+        ).where(Game.id.in_(missing_ids))
+    ).all()
+    for row in rows:
+        cached_game = CachedGame.from_row(row)
+        # Don't cache what an invalidation received meanwhile may have
+        # outdated
+        if invalidations_count == _invalidations_count:
+            game_cache.set(row.id, cached_game)
+        games[row.id] = cached_game
+    return games
+
+
+def get_current_games(
+    ids: list[int], session: Session
+) -> dict[int, CachedGame]:
+    """Like `get_cached_games`, but reading the games versions first: a game
+    changed through another worker is reloaded even if its invalidation
+    didn't reach this one (with the "local" broadcast backend).
+    """
+    versions = dict(
+        session.exec(
+            select(Game.id, Game.version).where(Game.id.in_(ids))
+        ).all()
+    )
+    return get_cached_games(list(versions), session, versions)
+
+
+def get_current_game(id: int, session: Session):
+    """Like `get_cached_game`, at the game's current version."""
+    return get_current_games([id], session).get(id)
+
+
+def invalidate_cached_game(id: int):
+    # Right away here, the other workers get it through the broadcast
+    _on_game_invalidated(str(id))
+    broadcast.publish(GAME_CHANNEL, str(id))
@@ -1,44 +1,161 @@
-from pydantic import BaseModel, ConfigDict
-from sqlalchemy import Column
-from sqlmodel import Field, Relationship, SQLModel
+from typing import Literal
+from pydantic import BaseModel, ConfigDict, field_validator
+from sqlalchemy import Column, ForeignKey, Index, null, update
 from sqlalchemy.dialects.postgresql import JSONB
-from . import Content
+from sqlmodel import Field, Relationship, Session, SQLModel
+from .. import metrics
+from .grid import PaletteGrid, is_mismatch
+from .compact import CompactContentType, decode_if_compact
+from . import Content, Rgba
+
+update_is_completed_duration = metrics.histogram(
+    "gamestate_update_is_completed_seconds",
+    "Duration of the game states completion updates.",
+)
 
 
 class GameState(SQLModel, table=True):
+    # Keyset pagination of the current user game states
+    __table_args__ = (
+        Index(
+            "ix_gamestate_user_id_is_completed_game_id",
+            "user_id",
+            "is_completed",
+            "game_id",
+        ),
+        Index("ix_gamestate_user_id_game_id", "user_id", "game_id"),
+    )
+
+    # Deleted along with their game or user (see the migrations)
     game_id: int | None = Field(
-        default=None, foreign_key="game.id", primary_key=True
+        default=None,
+        primary_key=True,
+        sa_column_args=[ForeignKey("game.id", ondelete="CASCADE")],
     )
     user_id: int | None = Field(
-        default=None, foreign_key="user.id", primary_key=True
+        default=None,
+        primary_key=True,
+        sa_column_args=[ForeignKey("user.id", ondelete="CASCADE")],
     )
     is_completed: bool = False
     current_content: Content | None = Field(
+        default=None, sa_column=Column(CompactContentType)
+    )
+    # Amount of cells not matching the goal content, per row
+    row_mismatches: list[int] | None = Field(
         default=None, sa_column=Column(JSONB)
     )
+    # Incremented on every write (see bump_version)
+    version: int = 1
 
     game: "Game" = Relationship(back_populates="player_links")  # type: ignore
     user: "User" = Relationship(  # type: ignore
         back_populates="played_game_links"
     )
 
-    def update_is_completed(self, goal_content: Content):
+    def bump_version(self):
+        # Incremented by the database, so that concurrent writes all count
+        # (the live copies of app/gamestate_writer.py check it)
+        self.version = GameState.version + 1
+
+    @update_is_completed_duration.time()
+    def update_is_completed(self, goal_content: Content | PaletteGrid):
+        """`goal_content` can be given as a grid, which saves its
+        conversion.
+        """
         self.is_completed = False
+        self.row_mismatches = None
         if self.current_content is None or goal_content is None:
             return False
-        if len(goal_content) != len(self.current_content):
+        if isinstance(goal_content, PaletteGrid):
+            goal = goal_content
+        else:
+            goal = PaletteGrid.from_content(goal_content)
+        if goal.rows_count != len(self.current_content):
             raise ValueError("Contents don't have the same amount of rows.")
-        for r, row in enumerate(goal_content):
-            if len(row) != len(self.current_content[r]):
-                raise ValueError(
-                    "Content rows don't have the same amount of cells."
+        current = PaletteGrid.from_content(
+            self.current_content, palette=list(goal.palette)
+        )
+        if goal.indices.shape != current.indices.shape:
+            raise ValueError(
+                "Content rows don't have the same amount of cells."
+            )
+        # Empty or false are both valid where the goal is empty
+        mismatches = goal.get_row_mismatches(current)
+        self.row_mismatches = mismatches.tolist()
+        self.is_completed = not mismatches.any()
+
+    def apply_changes(
+        self, changes: list["CellChange"], goal_content: Content | PaletteGrid
+    ):
+        """Apply cell `changes` to the current content, updating the
+        completion from the per row mismatch counters. Raise an IndexError
+        (leaving the game state unchanged) if a change is out of the grid.
+        """
+        content = self.current_content
+        for change in changes:
+            if (
+                content is None
+                or change.row >= len(content)
+                or content[change.row] is None
+                or change.col >= len(content[change.row])
+            ):
+                raise IndexError(
+                    f"Cell ({change.row}, {change.col}) is out of the grid."
                 )
-            for c, cell in enumerate(row):
-                if cell != self.current_content[r][c]:
-                    if cell is None and self.current_content[r][c] is False:
-                        continue  # Empty or false are both valid here
-                    return
-        self.is_completed = True
+        # Changed rows are copied so that the new content is a new object
+        content = list(content)
+        copied_rows = set()
+        mismatches = self.row_mismatches
+        goal_rows_count = None
+        if isinstance(goal_content, PaletteGrid):
+            goal_rows_count = goal_content.rows_count
+        elif goal_content is not None:
+            goal_rows_count = len(goal_content)
+        if (
+            mismatches is not None
+            and len(mismatches) == len(content) == goal_rows_count
+        ):
+            mismatches = list(mismatches)
+        else:
+            mismatches = None  # Recomputed below
+        for change in changes:
+            if change.row not in copied_rows:
+                content[change.row] = list(content[change.row])
+                copied_rows.add(change.row)
+            if mismatches is not None:
+                goal_cell = _get_goal_cell(
+                    goal_content, change.row, change.col
+                )
+                old_value = content[change.row][change.col]
+                mismatches[change.row] += is_mismatch(
+                    goal_cell, change.value
+                ) - is_mismatch(goal_cell, old_value)
+            content[change.row][change.col] = change.value
+        self.current_content = content
+        if mismatches is None:
+            self.update_is_completed(goal_content)
+        else:
+            self.row_mismatches = mismatches
+            self.is_completed = not any(mismatches)
+
+
+def reset_row_mismatches(session: Session, game_id: int):
+    """Drop the per row mismatch counters of the game's states, computed
+    against its previous content (they are recomputed by the next update).
+    Their live copies reload them on their next write.
+    """
+    session.exec(
+        update(GameState)
+        .where(GameState.game_id == game_id)
+        .values(row_mismatches=null(), version=GameState.version + 1)
+    )
+
+
+def _get_goal_cell(goal_content: Content | PaletteGrid, row: int, col: int):
+    if isinstance(goal_content, PaletteGrid):
+        return goal_content.palette[goal_content.indices[row, col]]
+    return goal_content[row][col]
 
 
 class GameStateCompletion(BaseModel):
@@ -51,9 +168,43 @@ class GameStateCompletion(BaseModel):
 class GameStateContentIn(BaseModel):
     current_content: Content | None
 
+    @field_validator("current_content", mode="before")
+    @classmethod
+    def decode_compact_content(cls, value):
+        return decode_if_compact(value)
+
     model_config = ConfigDict(from_attributes=True)
 
 
+class GameStateBatchItem(GameStateContentIn):
+    game_id: int
+
+
+class CellChange(BaseModel):
+    row: int = Field(ge=0)
+    col: int = Field(ge=0)
+    value: Rgba | bool | None
+
+
+class GameStateChanges(BaseModel):
+    changes: list[CellChange]
+
+
+class GameStateProgress(GameStateCompletion):
+    # Whether each row/column satisfies its clue
+    rows: list[bool]
+    columns: list[bool]
+
+
+class Hint(BaseModel):
+    row: int
+    col: int
+    value: Rgba | bool | None  # False: the cell must be crossed
+    # "mistake": the cell contradicts the solution, otherwise where the
+    # value was deduced from
+    reason: Literal["mistake", "row", "column", "deduction"]
+
+
 class GameStateContentOut(GameStateContentIn):
     game_id: int
     is_completed: bool = False
@@ -0,0 +1,165 @@
+import copy
+import numpy as np
+from . import ClueLine, Content
+
+
+# Characters encoding the palette indices in the compact format
+COMPACT_ALPHABET = (
+    "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"
+)
+_COMPACT_ENCODE_TABLE = np.frombuffer(COMPACT_ALPHABET.encode(), np.uint8)
+_COMPACT_DECODE_TABLE = np.full(256, 255, dtype=np.uint8)
+_COMPACT_DECODE_TABLE[_COMPACT_ENCODE_TABLE] = np.arange(
+    len(COMPACT_ALPHABET), dtype=np.uint8
+)
+
+
+def get_cell_key(cell):
+    # Rgba lists aren't hashable
+    return tuple(cell) if isinstance(cell, list) else cell
+
+
+def is_mismatch(goal_cell, cell):
+    """Whether `cell` doesn't match the goal's, crossed (False) cells
+    matching empty goal cells (but not the other way round).
+    """
+    if goal_cell is None and cell is False:
+        return False
+    return get_cell_key(goal_cell) != get_cell_key(cell)
+
+
+class PaletteGrid:
+    """Content stored as a palette of cell values and a 2D array of palette
+    indices, index 0 standing for empty (None) cells.
+    """
+
+    def __init__(self, palette: list, indices: np.ndarray):
+        self.palette = palette  # palette[0] is always None
+        self.indices = indices
+
+    @classmethod
+    def from_content(
+        cls,
+        content: Content,
+        palette: list | None = None,
+    ):
+        """Build the grid of `content`. An existing `palette` can be given
+        (and extended) so that indices are comparable across grids.
+        """
+        palette = [None] if palette is None else palette
+        # Cells are mapped to their index through their hashable key
+        lookup = {get_cell_key(value): i for i, value in enumerate(palette)}
+        get_index = lookup.get
+
+        width = len(content[0]) if len(content) > 0 else 0
+        rows = []
+        for row in content:
+            if len(row) != width:
+                raise ValueError(
+                    "Content rows don't have the same amount of cells."
+                )
+            row_indices = [
+                get_index(tuple(cell) if cell.__class__ is list else cell)
+                for cell in row
+            ]
+            if None in row_indices:  # Some colors aren't in the palette yet
+                for c, cell in enumerate(row):
+                    if row_indices[c] is None:
+                        key = get_cell_key(cell)
+                        if key not in lookup:
+                            lookup[key] = len(palette)
+                            palette.append(cell)
+                        row_indices[c] = lookup[key]
+            rows.append(row_indices)
+        dtype = np.uint8 if len(palette) <= 256 else np.uint16
+        indices = np.array(rows, dtype=dtype).reshape(len(content), width)
+        return cls(palette, indices)
+
+    @classmethod
+    def from_compact(cls, compact: dict):
+        """Build the grid of a compact content (see `to_compact`)."""
+        palette = compact["palette"]
+        rows = compact["rows"]
+        if len(palette) == 0 or palette[0] is not None:
+            raise ValueError("Compact content palette must start with null.")
+        width = len(rows[0]) if len(rows) > 0 else 0
+        if any(len(row) != width for row in rows):
+            raise ValueError(
+                "Content rows don't have the same amount of cells."
+            )
+        try:
+            buffer = np.frombuffer("".join(rows).encode("ascii"), np.uint8)
+        except UnicodeEncodeError:
+            raise ValueError("Invalid compact content cells.")
+        indices = _COMPACT_DECODE_TABLE[buffer]
+        if indices.size > 0 and indices.max() >= len(palette):
+            raise ValueError("Invalid compact content cells.")
+        return cls(list(palette), indices.reshape(len(rows), width))
+
+    def to_compact(self):
+        """Return the content as a palette and one string per row, each cell
+        being encoded as the character of its palette index. Return None if
+        the palette is too big to be encoded.
+        """
+        if len(self.palette) > len(COMPACT_ALPHABET):
+            return None
+        characters = _COMPACT_ENCODE_TABLE[self.indices]
+        return {
+            "palette": self.palette,
+            "rows": [row.tobytes().decode("ascii") for row in characters],
+        }
+
+    def to_content(self) -> Content:
+        # Cells share the palette values
+        palette = self.palette
+        return [[palette[i] for i in row] for row in self.indices.tolist()]
+
+    def get_row_mismatches(self, current: "PaletteGrid"):
+        """Amount of cells of `current` (built with this goal grid's palette,
+        see `from_content`) not matching the goal, per row (see
+        `is_mismatch`).
+        """
+        mismatches = self.indices != current.indices
+        for i, value in enumerate(current.palette):
+            if value is False:
+                mismatches &= (self.indices != 0) | (current.indices != i)
+        return mismatches.sum(axis=1)
+
+    @property
+    def rows_count(self):
+        return self.indices.shape[0]
+
+    @property
+    def columns_count(self):
+        return self.indices.shape[1]
+
+    def _get_lines_clues(self, indices: np.ndarray):
+        lines_count, length = indices.shape
+        clue_lines: list[ClueLine] = [None] * lines_count
+        if length == 0:
+            return clue_lines
+        # A run starts at the first cell of each line and at every change
+        starts = np.ones(indices.shape, dtype=bool)
+        starts[:, 1:] = indices[:, 1:] != indices[:, :-1]
+        lines, cells = np.nonzero(starts)
+        positions = lines * length + cells
+        counts = np.diff(positions, append=indices.size)
+        values = indices[lines, cells]
+        filled = values != 0
+        for line, value, count in zip(
+            lines[filled].tolist(),
+            values[filled].tolist(),
+            counts[filled].tolist(),
+        ):
+            clue = {"rgba": copy.copy(self.palette[value]), "count": count}
+            if clue_lines[line] is None:
+                clue_lines[line] = [clue]
+            else:
+                clue_lines[line].append(clue)
+        return clue_lines
+
+    def get_clues(self):
+        return [
+            self._get_lines_clues(self.indices),
+            self._get_lines_clues(np.ascontiguousarray(self.indices.T)),
+        ]
@@ -1,13 +1,20 @@
+from typing import Annotated
 import jwt
-from sqlalchemy.orm import joinedload
 from jwt.exceptions import InvalidTokenError
 from fastapi import Depends, HTTPException, status, Form
 from pydantic import BaseModel, ConfigDict
 from sqlmodel import Field, SQLModel, Relationship, Session, select
-from ..database import engine
+from ..database import SessionDep
 from .gamestate import GameState
 from ..security import cookie_scheme, TokenData
-from ..config import JWT_SECRET_KEY, JWT_ALGORITHM
+from ..broadcast import broadcast
+from ..cache import TTLCache
+from ..config import (
+    AUTH_CACHE_SIZE,
+    AUTH_CACHE_TTL,
+    JWT_SECRET_KEY,
+    JWT_ALGORITHM,
+)
 
 
 class User(SQLModel, table=True):
@@ -15,10 +22,19 @@ class User(SQLModel, table=True):
     pseudo: str = Field(unique=True)
     username: str | None = Field(unique=True)  # email
     password: str
+    # The database sets the games creator to NULL and deletes the game
+    # states along with the user
     created_games: list["Game"] = Relationship(  # type: ignore
         back_populates="creator",
+        sa_relationship_kwargs={"passive_deletes": "all"},
+    )
+    played_game_links: list[GameState] = Relationship(
+        back_populates="user",
+        sa_relationship_kwargs={
+            "cascade": "save-update, merge, delete",
+            "passive_deletes": True,
+        },
     )
-    played_game_links: list[GameState] = Relationship(back_populates="user")
 
     @property
     def created_games_ids(self):
@@ -48,6 +64,16 @@ class PublicUser(UserSummary):
     model_config = ConfigDict(from_attributes=True)
 
 
+class UserIdentity(BaseModel):
+    """Authenticated user, without any relationship loaded."""
+
+    id: int
+    pseudo: str
+    username: str | None
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+
 class PrivateUser(PublicUser):
     username: str | None
     played_games_ids: list[int]
@@ -55,20 +81,52 @@ class PrivateUser(PublicUser):
     model_config = ConfigDict(from_attributes=True)
 
 
-async def get_user(username: str):
-    with Session(engine) as session:
-        statement = (
-            select(User)
-            .options(
-                joinedload(User.played_game_links),
-                joinedload(User.created_games),
-            )
-            .where(User.username == username)
-        )
-        return session.exec(statement).unique().one_or_none()
+# Identities of the authenticated users, by username (the token subject)
+identity_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+IDENTITY_CHANNEL = "picross_user_identity"
+
+
+def _on_identity_invalidated(username: str | None):
+    if username is None:
+        identity_cache.clear()
+    else:
+        identity_cache.delete(username)
+
+
+broadcast.subscribe(IDENTITY_CHANNEL, _on_identity_invalidated)
+
 
+def get_user(username: str, session: Session):
+    statement = select(User).where(User.username == username)
+    return session.exec(statement).one_or_none()
 
-async def get_current_user_or_none(token: str = Depends(cookie_scheme)):
+
+def get_user_identity(username: str, session: Session):
+    identity = identity_cache.get(username)
+    if identity is not None:
+        return identity
+    statement = select(User.id, User.pseudo, User.username).where(
+        User.username == username
+    )
+    row = session.exec(statement).one_or_none()
+    if row is None:
+        return None
+    identity = UserIdentity(id=row.id, pseudo=row.pseudo, username=username)
+    identity_cache.set(username, identity)
+    return identity
+
+
+def invalidate_user_identity(username: str | None):
+    if username is None:
+        return
+    identity_cache.delete(username)
+    broadcast.publish(IDENTITY_CHANNEL, username)
+
+
+def get_token_user(token: str | None, session: Session):
+    """Identity of the user authenticated by the access `token`, if any."""
+    if token is None:
+        return None
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
         username: str = payload.get("sub")
@@ -77,17 +135,23 @@ async def get_current_user_or_none(token: str = Depends(cookie_scheme)):
         token_data = TokenData(username=username)
     except InvalidTokenError:
         return None
-    user = await get_user(token_data.username)
-    return user
+    return get_user_identity(token_data.username, session)
+
+
+def get_current_user_or_none(
+    session: SessionDep, token: str = Depends(cookie_scheme)
+):
+    return get_token_user(token, session)
 
 
-async def get_current_user(token: str = Depends(cookie_scheme)):
+def get_current_user(
+    user: Annotated[UserIdentity | None, Depends(get_current_user_or_none)],
+):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    user = await get_current_user_or_none(token)
     if user is None:
         raise credentials_exception
     return user
@@ -0,0 +1,149 @@
+"""Keyset (cursor) pagination of the list endpoints.
+
+Pages are ordered by a sort column and a unique tie-breaker column. The
+cursor returned in the `X-Next-Cursor` header encodes the sort key of the
+last item of the page, the next page being the items that come after it.
+NULL sort values come after the others (last in ascending order, first in
+descending order, as in the indexes).
+"""
+
+import base64
+import binascii
+from typing import Annotated, Literal
+import orjson
+from fastapi import HTTPException, Query, Response, status
+from sqlalchemy import (
+    BigInteger,
+    Integer,
+    String,
+    TypeDecorator,
+    and_,
+    or_,
+    tuple_,
+)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+type SortOrder = Literal["asc", "desc"]
+
+
+class PageParams:
+    def __init__(
+        self,
+        limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = (
+            DEFAULT_PAGE_SIZE
+        ),
+        cursor: str | None = None,
+        order: SortOrder = "asc",
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.order = order
+
+
+def encode_cursor(values: list):
+    return base64.urlsafe_b64encode(orjson.dumps(values)).decode("ascii")
+
+
+def is_column_value(column, value):
+    """Whether `value` can be compared to `column` (of a cursor, which can
+    be tampered with).
+    """
+    if value is None:
+        return column.expression.nullable
+    column_type = column.type
+    if isinstance(column_type, TypeDecorator):  # Such as SQLModel's strings
+        column_type = column_type.impl_instance
+    if isinstance(column_type, Integer):
+        bits = 64 if isinstance(column_type, BigInteger) else 32
+        return (
+            isinstance(value, int)
+            and not isinstance(value, bool)
+            and -(2 ** (bits - 1)) <= value < 2 ** (bits - 1)
+        )
+    if isinstance(column_type, String):
+        return isinstance(value, str)
+    return False
+
+
+def decode_cursor(cursor: str, sort_column, key_column):
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor))
+    except (binascii.Error, ValueError):
+        values = None
+    if (
+        not isinstance(values, list)
+        or len(values) != 2
+        or not is_column_value(sort_column, values[0])
+        or not is_column_value(key_column, values[1])
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor.",
+        )
+    return values
+
+
+def get_after_clause(sort_column, key_column, cursor_values, ascending):
+    """Condition on the rows coming after the cursor, NULL sort values
+    being greater than the others.
+    """
+    sort_value, key_value = cursor_values
+    if sort_value is None:
+        if ascending:
+            return and_(sort_column.is_(None), key_column > key_value)
+        return or_(
+            and_(sort_column.is_(None), key_column < key_value),
+            sort_column.is_not(None),
+        )
+    sort_key = tuple_(sort_column, key_column)
+    after = tuple_(sort_value, key_value)
+    if not ascending:
+        return sort_key < after
+    if sort_column.expression.nullable:
+        return or_(sort_key > after, sort_column.is_(None))
+    return sort_key > after
+
+
+def paginate(statement, sort_column, key_column, params: PageParams):
+    """Order `statement` by (`sort_column`, `key_column`) and restrict it to
+    the page described by `params`. One extra row is selected to know
+    whether there is a next page (see `get_page`).
+    """
+    ascending = params.order == "asc"
+    if params.cursor is not None:
+        cursor_values = decode_cursor(params.cursor, sort_column, key_column)
+        statement = statement.where(
+            get_after_clause(
+                sort_column, key_column, cursor_values, ascending
+            )
+        )
+    if ascending:
+        statement = statement.order_by(
+            sort_column.asc().nulls_last(), key_column
+        )
+    else:
+        statement = statement.order_by(
+            sort_column.desc().nulls_first(), key_column.desc()
+        )
+    return statement.limit(params.limit + 1)
+
+
+def get_page(
+    rows: list,
+    sort_attribute: str,
+    key_attribute: str,
+    params: PageParams,
+    response: Response,
+):
+    """Return the rows of the page, setting the next page cursor header."""
+    if len(rows) <= params.limit:
+        return rows
+    rows = rows[:params.limit]
+    last_row = rows[-1]
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+        [getattr(last_row, sort_attribute), getattr(last_row, key_attribute)]
+    )
+    return rows
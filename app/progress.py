@@ -0,0 +1,151 @@
+"""Progress of a game state (lines satisfying their clues) and hints.
+
+Both work line by line from per-line results memoized on the line content
+(`get_line_runs` here, `solve_line` in the solver): after a move, only the
+row and the column of the changed cell are computed again.
+"""
+
+from functools import lru_cache
+from itertools import groupby
+import numpy as np
+from .models import Content
+from .models.grid import PaletteGrid, get_cell_key
+from .solver import EMPTY, Solver, parse_clues, solve_line
+
+
+@lru_cache(maxsize=65536)
+def get_line_runs(line: bytes, dtype: str):
+    """Runs of the filled cells of a line of palette indices, as (index,
+    count) tuples: the clue of the line.
+    """
+    values = np.frombuffer(line, dtype=dtype).tolist()
+    return tuple(
+        (value, len(list(run))) for value, run in groupby(values) if value
+    )
+
+
+def _get_lines_runs(indices: np.ndarray):
+    dtype = indices.dtype.str
+    return [get_line_runs(line.tobytes(), dtype) for line in indices]
+
+
+def get_goal_grid(goal_content: Content | PaletteGrid):
+    if isinstance(goal_content, PaletteGrid):
+        return goal_content
+    # Raise a ValueError if the content isn't a grid
+    return PaletteGrid.from_content(goal_content)
+
+
+def get_current_grid(goal: PaletteGrid, content: Content):
+    """Grid of `content`, sharing the palette indices of the `goal` grid.
+    Crossed (False) cells and colors that aren't in the goal get indices
+    after the goal ones (unless the goal has crossed cells too).
+    """
+    current = PaletteGrid.from_content(content, palette=list(goal.palette))
+    if current.indices.shape != goal.indices.shape:
+        raise ValueError("Content and goal don't have the same size.")
+    return current
+
+
+def get_lines_progress(goal: PaletteGrid, content: Content):
+    """Return, for the rows and the columns, whether the line satisfies its
+    clue (crossed cells counting as empty).
+    """
+    current = get_current_grid(goal, content)
+    goal_size = len(goal.palette)
+    # Crossed cells are empty, and every color that isn't in the goal
+    # breaks the line the same way
+    lookup = np.arange(len(current.palette))
+    lookup[goal_size:] = goal_size
+    for i in range(goal_size, len(current.palette)):
+        if current.palette[i] is False:
+            lookup[i] = 0
+    indices = lookup.astype(current.indices.dtype)[current.indices]
+    rows = [
+        runs == goal_runs
+        for runs, goal_runs in zip(
+            _get_lines_runs(indices), _get_lines_runs(goal.indices)
+        )
+    ]
+    columns = [
+        runs == goal_runs
+        for runs, goal_runs in zip(
+            _get_lines_runs(np.ascontiguousarray(indices.T)),
+            _get_lines_runs(np.ascontiguousarray(goal.indices.T)),
+        )
+    ]
+    return rows, columns
+
+
+def find_hint(
+    goal: PaletteGrid, clues, content: Content, timeout: float | None = None
+):
+    """Return (row, column, value, reason) of the cell to play next, or None
+    if no cell is forced without guessing.
+
+    A cell contradicting the goal is pointed out first (reason "mistake").
+    Otherwise, the player's cells are taken as known and the other ones are
+    solved row by row, column by column (reason "row" or "column") and,
+    as a last resort, by propagating over the whole grid ("deduction").
+    """
+    current = get_current_grid(goal, content)
+    goal_size = len(goal.palette)
+    is_crossed = np.zeros(current.indices.shape, dtype=bool)
+    for i in range(goal_size, len(current.palette)):
+        if current.palette[i] is False:
+            is_crossed = current.indices == i
+    is_set = current.indices != 0
+    is_correct = np.where(
+        is_crossed, goal.indices == 0, current.indices == goal.indices
+    )
+    mistakes = np.argwhere(is_set & ~is_correct)
+    if len(mistakes) > 0:
+        r, c = mistakes[0].tolist()
+        return r, c, content[r][c], "mistake"
+
+    palette, rows, columns = parse_clues(clues)
+    # Solver values (bitmasks) of the goal palette indices and back
+    colors = {1 << k: rgba for k, rgba in enumerate(palette, start=1)}
+    color_bits = {get_cell_key(rgba): bit for bit, rgba in colors.items()}
+    index_bits = [EMPTY] + [
+        color_bits[get_cell_key(value)] for value in goal.palette[1:]
+    ]
+    full_domain = (1 << (len(palette) + 1)) - 1
+    # Cells set by the player (all correct here) are known
+    known_indices = np.where(is_crossed, 0, current.indices).tolist()
+    domains = [
+        [
+            index_bits[i] if cell_is_set else full_domain
+            for i, cell_is_set in zip(indices_row, is_set_row)
+        ]
+        for indices_row, is_set_row in zip(known_indices, is_set.tolist())
+    ]
+
+    def is_forced(domain, previous_domain):
+        return previous_domain == full_domain and domain.bit_count() == 1
+
+    def get_value(domain):
+        return False if domain == EMPTY else colors[domain]
+
+    for r, row in enumerate(domains):
+        solved = solve_line(rows[r], tuple(row))
+        for c, domain in enumerate(solved or ()):
+            if is_forced(domain, row[c]):
+                return r, c, get_value(domain), "row"
+    for c, column_clue in enumerate(columns):
+        column = tuple(row[c] for row in domains)
+        solved = solve_line(column_clue, column)
+        for r, domain in enumerate(solved or ()):
+            if is_forced(domain, column[r]):
+                return r, c, get_value(domain), "column"
+
+    solver = Solver(rows, columns, len(palette), timeout=timeout)
+    grid = solver.propagate([domain for row in domains for domain in row])
+    if grid is None:
+        return None
+    width = len(columns)
+    for index, domain in enumerate(grid):
+        r, c = divmod(index, width)
+        if is_forced(domain, domains[r][c]):
+            return r, c, get_value(domain), "deduction"
+    return None
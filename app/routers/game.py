@@ -1,15 +1,64 @@
-from typing import Annotated
-from fastapi import APIRouter, HTTPException, Depends, status
+from datetime import datetime
+from typing import Annotated, Literal
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Depends,
+    File,
+    Form,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
 from ..models.game import (
     Game,
     GameDetails,
     GameSummaryWithCreator,
     GameInput,
     GameSummary,
+    bump_catalog_version,
+    get_cached_game,
+    get_cached_games,
+    get_catalog_version,
+    invalidate_cached_game,
+    select_game_summaries,
+)
+from ..models.gamestate import reset_row_mismatches
+from ..models.user import User, UserIdentity, UserSummary, get_current_user
+from ..models.compact import (
+    COMPACT_MEDIA_TYPE,
+    accepts_compact,
+    get_json_response,
 )
-from ..models.user import User, get_current_user
 from sqlmodel import Session, select
-from ..database import engine
+from starlette.concurrency import run_in_threadpool
+from ..config import (
+    BATCH_MAX_SIZE,
+    IMAGE_GRID_MAX_SIZE,
+    IMAGE_MAX_PIXELS,
+    IMAGE_MAX_SIZE,
+    IMPORT_BATCH_SIZE,
+    THUMBNAIL_SIZE,
+)
+from ..database import SessionDep
+from ..difficulty import schedule_rating
+from ..export import get_streaming_response, select_exported_games
+from ..etag import (
+    IMMUTABLE_CACHE_CONTROL,
+    PRIVATE_CACHE_CONTROL,
+    PUBLIC_CACHE_CONTROL,
+    get_etag,
+    get_not_modified_response,
+    is_not_modified,
+    set_cache_headers,
+)
+from ..games_import import GameImporter, iter_lines
+from ..image import MAX_COLORS_COUNT, image_to_grid
+from ..models.grid import PaletteGrid
+from ..pagination import PageParams, get_page, paginate
+from ..thumbnail import get_thumbnail
 
 router = APIRouter()
 
@@ -24,92 +73,421 @@ def get_game(id: int, session: Session, exception_if_not_found: bool = False):
     return game
 
 
+def get_game_etag(
+    id: int, version: int, creator_pseudo: str | None, compact: bool
+):
+    # The details embed the creator's pseudo, which can change on its own
+    return get_etag("game", id, version, creator_pseudo, compact)
+
+
+def get_catalog_etag(request: Request, session: Session, *parts):
+    """ETag of a games list, None if the catalog version isn't available.
+    The version must be read before the list: if a change is committed in
+    between, the list is newer than its ETag, never older.
+    """
+    version = get_catalog_version(session)
+    if version is None:
+        return None
+    return get_etag(
+        "games",
+        version,
+        request.url.path,
+        sorted(request.query_params.multi_items()),
+        *parts,
+    )
+
+
+class GameListParams:
+    """Sorting and filtering of the games lists."""
+
+    def __init__(
+        self,
+        sort: Literal["id", "name", "difficulty"] = "id",
+        difficulty_min: int | None = None,
+        difficulty_max: int | None = None,
+        rows_min: int | None = None,
+        rows_max: int | None = None,
+        columns_min: int | None = None,
+        columns_max: int | None = None,
+        creator_id: int | None = None,
+    ):
+        self.sort = sort
+        self.bounds = [
+            (Game.difficulty, difficulty_min, difficulty_max),
+            (Game.rows_count, rows_min, rows_max),
+            (Game.columns_count, columns_min, columns_max),
+        ]
+        self.creator_id = creator_id
+
+    def filter(self, statement):
+        for column, min_value, max_value in self.bounds:
+            if min_value is not None:
+                statement = statement.where(column >= min_value)
+            if max_value is not None:
+                statement = statement.where(column <= max_value)
+        if self.creator_id is not None:
+            statement = statement.where(Game.creator_id == self.creator_id)
+        return statement
+
+    def apply(self, statement, page: PageParams):
+        return paginate(
+            self.filter(statement), getattr(Game, self.sort), Game.id, page
+        )
+
+
+GameListParamsDep = Annotated[GameListParams, Depends()]
+PageParamsDep = Annotated[PageParams, Depends()]
+
+
 @router.get("/games")
-async def get_all_games():
-    with Session(engine) as session:
-        games = session.exec(select(Game)).all()
-        return [GameSummaryWithCreator.model_validate(game) for game in games]
+def get_all_games(
+    request: Request,
+    response: Response,
+    params: GameListParamsDep,
+    page: PageParamsDep,
+    session: SessionDep,
+):
+    etag = get_catalog_etag(request, session)
+    if etag is not None:
+        if is_not_modified(request, etag):
+            return get_not_modified_response(etag)
+        set_cache_headers(response, etag)
+    statement = params.apply(select_game_summaries(with_creator=True), page)
+    games = get_page(
+        session.exec(statement).all(), params.sort, "id", page, response
+    )
+    return [GameSummaryWithCreator.model_validate(game) for game in games]
 
 
 @router.get("/games/me")
-async def get_current_user_games(
-    current_user: Annotated[User, Depends(get_current_user)],
+def get_current_user_games(
+    request: Request,
+    response: Response,
+    params: GameListParamsDep,
+    page: PageParamsDep,
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
 ):
-    with Session(engine) as session:
-        games = session.exec(
-            select(Game).where(Game.creator_id == current_user.id)
-        ).all()
-        return [GameSummary.model_validate(game) for game in games]
+    etag = get_catalog_etag(request, session, current_user.id)
+    if etag is not None:
+        if is_not_modified(request, etag):
+            return get_not_modified_response(etag, PRIVATE_CACHE_CONTROL)
+        set_cache_headers(response, etag, PRIVATE_CACHE_CONTROL)
+    statement = params.apply(
+        select_game_summaries().where(Game.creator_id == current_user.id),
+        page,
+    )
+    games = get_page(
+        session.exec(statement).all(), params.sort, "id", page, response
+    )
+    return [GameSummary.model_validate(game) for game in games]
+
+
+@router.get("/games/export")
+def export_games(
+    request: Request,
+    params: GameListParamsDep,
+    since: datetime | None = None,
+):
+    """All the games, with their content and clues, as JSON lines (ordered by
+    id, filtered as the games lists). `since` only keeps the games created
+    or changed after it. Contents are in the compact format if accepted.
+    """
+    statement = params.filter(select_exported_games(since))
+    return get_streaming_response(
+        statement, "content", accepts_compact(request)
+    )
 
 
 @router.get("/game/{id}")
-async def get_one_game(id: int):
-    with Session(engine) as session:
-        game = get_game(id, session, exception_if_not_found=True)
-        # TODO: remove when clues will be generated at game post/put
-        game.update_clues()
-        return GameDetails.model_validate(game)
+def get_one_game(id: int, request: Request, session: SessionDep):
+    compact = accepts_compact(request)
+    # Only the version and creator are read from the database, the rest of
+    # the details comes from the cache
+    row = session.exec(
+        select(Game.version, Game.creator_id, User.pseudo)
+        .outerjoin(User, Game.creator_id == User.id)
+        .where(Game.id == id)
+    ).one_or_none()
+    game = None if row is None else get_cached_game(id, session, row.version)
+    if game is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No game found for given id ({id}).",
+        )
+    etag = get_game_etag(id, row.version, row.pseudo, compact)
+    if is_not_modified(request, etag):
+        return get_not_modified_response(etag, vary="Accept")
+    creator = None
+    if row.creator_id is not None:
+        creator = UserSummary(id=row.creator_id, pseudo=row.pseudo)
+    response = Response(
+        game.get_details_json(creator, compact),
+        media_type=COMPACT_MEDIA_TYPE if compact else "application/json",
+        headers={"Vary": "Accept"},
+    )
+    set_cache_headers(response, etag)
+    return response
+
+
+@router.get("/game/{id}/thumbnail")
+def get_game_thumbnail(
+    id: int,
+    request: Request,
+    session: SessionDep,
+    version: int | None = None,
+):
+    """PNG of the game's content (see app/thumbnail.py). With the game's
+    current `version` (from the games lists), the URL changes along with
+    the game and the thumbnail is cached for good by the clients.
+    """
+    row = session.exec(
+        select(Game.version, Game.content_hash).where(Game.id == id)
+    ).one_or_none()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No game found for given id ({id}).",
+        )
+    # Rendered again only when the content changes, not on every version
+    content_key = row.content_hash or f"game-{id}-{row.version}"
+    key = f"{content_key}-{THUMBNAIL_SIZE}"
+    etag = get_etag("thumbnail", key)
+    cache_control = (
+        IMMUTABLE_CACHE_CONTROL
+        if version == row.version
+        else PUBLIC_CACHE_CONTROL
+    )
+    if is_not_modified(request, etag):
+        return get_not_modified_response(etag, cache_control)
+
+    def get_grid():
+        game = get_cached_game(id, session, row.version)
+        goal = None if game is None else game.goal
+        try:
+            if goal is not None and not isinstance(goal, PaletteGrid):
+                goal = PaletteGrid.from_content(goal)
+        except (TypeError, ValueError):
+            goal = None
+        if goal is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Game has no content to render.",
+            )
+        return goal
+
+    response = Response(get_thumbnail(key, get_grid), media_type="image/png")
+    set_cache_headers(response, etag, cache_control)
+    return response
+
+
+@router.get("/games/batch")
+def get_games_batch(
+    request: Request,
+    session: SessionDep,
+    id: Annotated[list[int], Query(min_length=1, max_length=BATCH_MAX_SIZE)],
+):
+    """Details of the games of the `id` query parameters (repeated), in the
+    given order. Games that don't exist are left out.
+    """
+    compact = accepts_compact(request)
+    ids = list(dict.fromkeys(id))
+    rows = {
+        row.id: row
+        for row in session.exec(
+            select(Game.id, Game.version, Game.creator_id, User.pseudo)
+            .outerjoin(User, Game.creator_id == User.id)
+            .where(Game.id.in_(ids))
+        ).all()
+    }
+    ids = [id for id in ids if id in rows]
+    etag = get_etag(
+        "games batch",
+        [(id, rows[id].version, rows[id].pseudo) for id in ids],
+        compact,
+    )
+    if is_not_modified(request, etag):
+        return get_not_modified_response(etag, vary="Accept")
+    games = get_cached_games(
+        ids, session, {id: rows[id].version for id in ids}
+    )
+    details = []
+    for id in ids:
+        # Deleted since the versions were read
+        if id not in games:
+            continue
+        row = rows[id]
+        creator = None
+        if row.creator_id is not None:
+            creator = UserSummary(id=row.creator_id, pseudo=row.pseudo)
+        details.append(games[id].get_details_json(creator, compact))
+    response = Response(
+        b"[" + b",".join(details) + b"]",
+        media_type=COMPACT_MEDIA_TYPE if compact else "application/json",
+        headers={"Vary": "Accept"},
+    )
+    set_cache_headers(response, etag)
+    return response
 
 
 @router.post("/game", status_code=status.HTTP_201_CREATED)
-async def create_game(
+def create_game(
     game_input: GameInput,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
 ):
     # TODO: protect against XSRF
+    return save_new_game(game_input, current_user, session)
+
+
+def save_new_game(
+    game_input: GameInput, current_user: UserIdentity, session: Session
+):
     game = Game.model_validate(game_input)
     game.creator_id = current_user.id  # Make current user the creator
     game.update_clues()
-    game.update_difficulty()
+    is_rated = game.update_difficulty()
+    game.update_uniqueness()
 
-    with Session(engine) as session:
-        session.add(game)
-        session.commit()
-        session.refresh(game)
-        return GameDetails.model_validate(game)
+    session.add(game)
+    bump_catalog_version(session)
+    session.commit()
+    session.refresh(game)
+    if not is_rated:
+        schedule_rating(game)
+    return get_json_response(
+        GameDetails.model_validate(game), status.HTTP_201_CREATED
+    )
+
+
+GridSizeForm = Annotated[int, Form(ge=1, le=IMAGE_GRID_MAX_SIZE)]
+
+
+@router.post("/game/from-image", status_code=status.HTTP_201_CREATED)
+def create_game_from_image(
+    image: Annotated[UploadFile, File()],
+    name: Annotated[str, Form()],
+    rows_count: GridSizeForm,
+    columns_count: GridSizeForm,
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
+    colors_count: Annotated[int, Form(ge=1, le=MAX_COLORS_COUNT)] = 4,
+    remove_background: Annotated[bool, Form()] = True,
+):
+    """Create a game from an uploaded image (multipart form), downsampled to
+    the grid size and quantized to `colors_count` colors (see app/image.py).
+    Transparent cells are left empty, as well as the background (the color
+    of the image border) if `remove_background`.
+    """
+    # TODO: protect against XSRF
+    data = image.file.read(IMAGE_MAX_SIZE + 1)
+    if len(data) > IMAGE_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image is bigger than {IMAGE_MAX_SIZE} bytes.",
+        )
+    try:
+        grid = image_to_grid(
+            data,
+            rows_count,
+            columns_count,
+            colors_count,
+            remove_background,
+            IMAGE_MAX_PIXELS,
+        )
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(error),
+        )
+    game_input = GameInput(name=name, content=grid.to_content())
+    return save_new_game(game_input, current_user, session)
+
+
+@router.post("/games/import")
+async def import_games(
+    request: Request,
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
+    import_id: Annotated[str | None, Query(max_length=255)] = None,
+    uniqueness: bool = False,
+):
+    """Import the games of the body, JSON lines (one `GameInput` per line),
+    created by the current user. The body is streamed and imported by
+    batches of IMPORT_BATCH_SIZE lines (see app/games_import.py). Sending
+    the same body with the same `import_id` resumes an interrupted import.
+    """
+    # TODO: protect against XSRF
+    try:
+        importer = await run_in_threadpool(
+            GameImporter, session, current_user.id, import_id, uniqueness
+        )
+        batch = []
+        async for line in iter_lines(request.stream()):
+            batch.append(line)
+            if len(batch) == IMPORT_BATCH_SIZE:
+                await run_in_threadpool(importer.import_lines, batch)
+                batch = []
+        await run_in_threadpool(importer.import_lines, batch)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(error)
+        )
+    return importer.get_result()
 
 
 @router.put("/game/{id}")
-async def update_game(
+def update_game(
     id: int,
     game_input: GameInput,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
 ):
     # TODO: protect against XSRF
     # Be careful, all Game fields must be provided otherwise default
     # ones will be used.
     # See https://fastapi.tiangolo.com/tutorial/body-updates/
-    with Session(engine) as session:
-        db_game = get_game(id, session, exception_if_not_found=True)
-        # Validate that user owns the game
-        if db_game.creator_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Current user is not allowed to modify this game.",
-            )
-        db_game.name = game_input.name
-        db_game.content = game_input.content
-        db_game.update_difficulty()
-        db_game.update_clues()
+    db_game = get_game(id, session, exception_if_not_found=True)
+    # Validate that user owns the game
+    if db_game.creator_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Current user is not allowed to modify this game.",
+        )
+    db_game.name = game_input.name
+    db_game.content = game_input.content
+    previous_content_hash = db_game.content_hash
+    db_game.update_clues()
+    is_rated = db_game.update_difficulty()
+    db_game.update_uniqueness()
+    db_game.bump_version()
 
-        session.add(db_game)
-        session.commit()
-        session.refresh(db_game)
-        return GameDetails.model_validate(db_game)
+    session.add(db_game)
+    if db_game.content_hash != previous_content_hash:
+        reset_row_mismatches(session, id)
+    bump_catalog_version(session)
+    session.commit()
+    invalidate_cached_game(id)
+    session.refresh(db_game)
+    if not is_rated:
+        schedule_rating(db_game)
+    return get_json_response(GameDetails.model_validate(db_game))
 
 
 @router.delete("/game/{id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_game(
+def delete_game(
     id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
 ):
     # TODO: protect against XSRF
-    with Session(engine) as session:
-        game = get_game(id, session, exception_if_not_found=True)
-        if game.creator_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Current user is not allowed to delete this game.",
-            )
-        session.delete(game)
-        session.commit()
+    game = get_game(id, session, exception_if_not_found=True)
+    if game.creator_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Current user is not allowed to delete this game.",
+        )
+    session.delete(game)
+    bump_catalog_version(session)
+    session.commit()
+    invalidate_cached_game(id)
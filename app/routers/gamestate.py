@@ -1,15 +1,56 @@
 from typing import Annotated
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Body,
+    Depends,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from pydantic import ValidationError
+from sqlalchemy import bindparam, cast, func, type_coerce, update
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.orm import load_only
+from sqlalchemy.types import Text
+from ..models.game import (
+    CachedGame,
+    Game,
+    get_current_game,
+    get_current_games,
+)
 from ..models.gamestate import (
+    CellChange,
     GameState,
+    GameStateBatchItem,
+    GameStateChanges,
     GameStateCompletion,
     GameStateContentIn,
     GameStateContentOut,
+    GameStateProgress,
+    Hint,
+)
+from ..models.grid import COMPACT_ALPHABET, get_cell_key, is_mismatch
+from ..models.user import UserIdentity, get_current_user, get_token_user
+from ..models.compact import (
+    accepts_compact,
+    get_compact_list_response,
+    get_compact_response,
+    get_json_list_response,
+    get_json_response,
 )
-from ..models.user import User, get_current_user
-from .game import get_game
 from sqlmodel import Session, select
-from ..database import engine
+from starlette.concurrency import run_in_threadpool
+from ..config import BATCH_MAX_SIZE, HINT_SOLVER_TIMEOUT, JWT_COOKIE_NAME
+from ..database import SessionDep
+from ..export import get_streaming_response, select_exported_game_states
+from ..gamestate_writer import load_game_state, writer
+from ..progress import find_hint, get_goal_grid, get_lines_progress
+from ..pagination import get_page, paginate
+from .game import PageParamsDep
 
 router = APIRouter()
 
@@ -40,93 +81,531 @@ def get_game_state(
     return game_state
 
 
+def get_goal_game(id: int, session: Session) -> CachedGame:
+    game = get_current_game(id, session)
+    if game is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No game found for given id ({id}).",
+        )
+    return game
+
+
+def get_played_game_state(id: int, user_id: int, session: Session):
+    # The game state being played over WebSocket is ahead of the database
+    live_game_state = writer.get(id, user_id)
+    if live_game_state is not None:
+        return live_game_state.game_state
+    return get_game_state(id, user_id, session, exception_if_not_found=True)
+
+
+def get_goal_and_content(game_state: GameState, game: CachedGame):
+    """Goal grid and current content, raising a 409 if they can't be
+    compared.
+    """
+    if game.goal is None or game_state.current_content is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Game or game state has no content.",
+        )
+    try:
+        return get_goal_grid(game.goal), game_state.current_content
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(error)
+        )
+
+
 @router.get("/gamestatescompletion")
-async def get_all_gamestates_completion_for_current_user(
-    current_user: Annotated[User, Depends(get_current_user)],
+def get_all_gamestates_completion_for_current_user(
+    response: Response,
+    page: PageParamsDep,
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
+    is_completed: bool | None = None,
 ):
-    with Session(engine) as session:
-        game_states = session.exec(
-            select(GameState).where(GameState.user_id == current_user.id)
-        ).all()
-        return [
-            GameStateCompletion.model_validate(game_state)
-            for game_state in game_states
-        ]
+    statement = select(GameState).options(
+        load_only(GameState.game_id, GameState.is_completed)
+    )
+    statement = statement.where(GameState.user_id == current_user.id)
+    if is_completed is not None:
+        statement = statement.where(GameState.is_completed == is_completed)
+    statement = paginate(statement, GameState.game_id, GameState.game_id, page)
+    game_states = get_page(
+        session.exec(statement).all(), "game_id", "game_id", page, response
+    )
+    return [
+        GameStateCompletion.model_validate(game_state)
+        for game_state in game_states
+    ]
+
+
+@router.get("/gamestates/export")
+def export_game_states(
+    request: Request,
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    is_completed: bool | None = None,
+):
+    """All the current user's game states as JSON lines, in the format of
+    `PUT /gamestates/batch` items. Contents are in the compact format if
+    accepted.
+    """
+    statement = select_exported_game_states(current_user.id, is_completed)
+    return get_streaming_response(
+        statement, "current_content", accepts_compact(request)
+    )
 
 
 @router.get("/gamestate/{id}")
-async def get_one_game_state(
+def get_one_game_state(
     id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    request: Request,
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
 ):
-    with Session(engine) as session:
-        game_state = get_game_state(
-            id, current_user.id, session, exception_if_not_found=True
+    game_state = get_game_state(
+        id, current_user.id, session, exception_if_not_found=True
+    )
+    game_state_out = GameStateContentOut.model_validate(game_state)
+    if accepts_compact(request):
+        return get_compact_response(game_state_out, "current_content")
+    return get_json_response(game_state_out)
+
+
+def get_game_states(game_ids: list[int], user_id: int, session: Session):
+    """Return the user's game states found among `game_ids`, by game id."""
+    game_states = session.exec(
+        select(GameState)
+        .where(GameState.user_id == user_id)
+        .where(GameState.game_id.in_(game_ids))
+    ).all()
+    return {game_state.game_id: game_state for game_state in game_states}
+
+
+@router.get("/gamestates/batch")
+def get_game_states_batch(
+    request: Request,
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
+    game_id: Annotated[
+        list[int], Query(min_length=1, max_length=BATCH_MAX_SIZE)
+    ],
+):
+    """Current user's game states of the `game_id` query parameters
+    (repeated), in the given order. Games without a state are left out.
+    """
+    game_ids = list(dict.fromkeys(game_id))
+    game_states = get_game_states(game_ids, current_user.id, session)
+    game_states_out = []
+    for id in game_ids:
+        # The game state being played over WebSocket is ahead of the
+        # database
+        live_game_state = writer.get(id, current_user.id)
+        game_state = (
+            game_states.get(id)
+            if live_game_state is None
+            else live_game_state.game_state
         )
-        return GameStateContentOut.model_validate(game_state)
+        if game_state is not None:
+            game_states_out.append(
+                GameStateContentOut.model_validate(game_state)
+            )
+    if accepts_compact(request):
+        return get_compact_list_response(game_states_out, "current_content")
+    return get_json_list_response(game_states_out)
 
 
-@router.post("/gamestate/{id}", status_code=status.HTTP_201_CREATED)
-async def create_game_state(
-    id: int,
-    game_state_input: GameStateContentIn,
-    current_user: Annotated[User, Depends(get_current_user)],
+@router.put("/gamestates/batch")
+def upsert_game_states_batch(
+    items: Annotated[
+        list[GameStateBatchItem],
+        Body(min_length=1, max_length=BATCH_MAX_SIZE),
+    ],
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
 ):
+    """Create or update the current user's game states in a single
+    transaction (none is written if one of them fails), returning their
+    completions in the given order.
+    """
     # TODO: protect against XSRF
-    with Session(engine) as session:
-        game_state = get_game_state(id, current_user.id, session)
-        if game_state is not None:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Game state already exists hence cannot be created.",
+    game_ids = [item.game_id for item in items]
+    if len(set(game_ids)) != len(game_ids):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Game ids must be unique.",
+        )
+    games = get_current_games(game_ids, session)
+    missing_ids = [id for id in game_ids if id not in games]
+    if missing_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No game found for given ids ({missing_ids}).",
+        )
+    game_states = get_game_states(game_ids, current_user.id, session)
+    for item in items:
+        game_state = game_states.get(item.game_id)
+        if game_state is None:
+            game_state = GameState(
+                game_id=item.game_id, user_id=current_user.id
             )
-        game_state = GameState.model_validate(game_state_input)
-        game_state.game_id = id
-        game_state.user_id = current_user.id
+            game_states[item.game_id] = game_state
+        else:
+            game_state.bump_version()
+        game_state.current_content = item.current_content
         # Update completion from goal game content
-        game = get_game(id, session, exception_if_not_found=True)
-        game_state.update_is_completed(game.content)
-        # Pust to DB
+        try:
+            game_state.update_is_completed(games[item.game_id].goal)
+        except ValueError as error:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Game {item.game_id}: {error}",
+            )
         session.add(game_state)
-        session.commit()
-        session.refresh(game_state)
-        return GameStateContentOut.model_validate(game_state)
+    session.commit()
+    return [
+        GameStateCompletion(
+            game_id=id, is_completed=game_states[id].is_completed
+        )
+        for id in game_ids
+    ]
+
+
+@router.get("/gamestate/{id}/progress", response_model=GameStateProgress)
+def get_game_state_progress(
+    id: int,
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
+):
+    game_state = get_played_game_state(id, current_user.id, session)
+    goal, content = get_goal_and_content(
+        game_state, get_goal_game(id, session)
+    )
+    try:
+        rows, columns = get_lines_progress(goal, content)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(error)
+        )
+    return GameStateProgress(
+        game_id=id,
+        is_completed=game_state.is_completed,
+        rows=rows,
+        columns=columns,
+    )
+
+
+@router.get("/gamestate/{id}/hint", response_model=Hint | None)
+def get_game_state_hint(
+    id: int,
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
+):
+    game_state = get_played_game_state(id, current_user.id, session)
+    game = get_goal_game(id, session)
+    goal, content = get_goal_and_content(game_state, game)
+    try:
+        hint = find_hint(goal, game.clues, content, HINT_SOLVER_TIMEOUT)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(error)
+        )
+    if hint is None:
+        return None
+    row, col, value, reason = hint
+    return Hint(row=row, col=col, value=value, reason=reason)
+
+
+@router.post("/gamestate/{id}", status_code=status.HTTP_201_CREATED)
+def create_game_state(
+    id: int,
+    game_state_input: GameStateContentIn,
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
+):
+    # TODO: protect against XSRF
+    game_state = get_game_state(id, current_user.id, session)
+    if game_state is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Game state already exists hence cannot be created.",
+        )
+    game_state = GameState.model_validate(game_state_input)
+    game_state.game_id = id
+    game_state.user_id = current_user.id
+    # Update completion from goal game content
+    game = get_goal_game(id, session)
+    game_state.update_is_completed(game.goal)
+    # Pust to DB
+    session.add(game_state)
+    session.commit()
+    session.refresh(game_state)
+    return get_json_response(
+        GameStateContentOut.model_validate(game_state),
+        status.HTTP_201_CREATED,
+    )
 
 
 @router.put("/gamestate/{id}")
-async def update_game_state(
+def update_game_state(
     id: int,
     game_state_input: GameStateContentIn,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
 ):
     # TODO: protect against XSRF
     # Be careful, all GameState fields must be provided otherwise default
     # ones will be used.
     # See https://fastapi.tiangolo.com/tutorial/body-updates/
-    with Session(engine) as session:
-        db_game_state = get_game_state(
-            id, current_user.id, session, exception_if_not_found=True
+    db_game_state = get_game_state(
+        id, current_user.id, session, exception_if_not_found=True
+    )
+    # Update completion from goal game content
+    game = get_goal_game(id, session)
+    db_game_state.current_content = game_state_input.current_content
+    db_game_state.update_is_completed(game.goal)
+    db_game_state.bump_version()
+    # Pust to DB
+    session.add(db_game_state)
+    session.commit()
+    session.refresh(db_game_state)
+    return get_json_response(
+        GameStateContentOut.model_validate(db_game_state)
+    )
+
+
+def get_out_of_grid_exception(change: CellChange):
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail=f"Cell ({change.row}, {change.col}) is out of the grid.",
+    )
+
+
+def patch_compact_game_state(
+    game_id: int, user_id: int, changes: list[CellChange], session: Session
+):
+    """Apply `changes` to the compact content of a game state directly in the
+    database, only reading and writing the rows being changed. Completion is
+    updated from the per row mismatch counters.
+
+    Return the game state completion, or None if the contents aren't stored
+    in the compact format (or the per row counters are missing).
+    """
+    state_content = type_coerce(GameState.current_content, JSONB)
+    goal_content = type_coerce(Game.content, JSONB)
+    rows = sorted({change.row for change in changes})
+    statement = (
+        select(
+            state_content["palette"],
+            goal_content["palette"],
+            func.jsonb_array_length(goal_content["rows"]),
+            GameState.row_mismatches,
+            *(state_content["rows"][r].astext for r in rows),
+            *(goal_content["rows"][r].astext for r in rows),
         )
-        # Update completion from goal game content
-        game = get_game(id, session, exception_if_not_found=True)
-        db_game_state.current_content = game_state_input.current_content
-        db_game_state.update_is_completed(game.content)
-        # Pust to DB
-        session.add(db_game_state)
-        session.commit()
-        session.refresh(db_game_state)
-        return GameStateContentOut.model_validate(db_game_state)
+        .select_from(GameState)
+        .join(Game, Game.id == GameState.game_id)
+        .where(GameState.game_id == game_id)
+        .where(GameState.user_id == user_id)
+        .with_for_update(of=GameState)
+    )
+    result = session.exec(statement).one_or_none()
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=(
+                "Current user has no game state for given game_id "
+                f"({game_id})."
+            ),
+        )
+    state_palette, goal_palette, rows_count, row_mismatches = result[:4]
+    if (
+        state_palette is None
+        or goal_palette is None
+        or row_mismatches is None
+        or len(row_mismatches) != rows_count
+    ):
+        return None
+    state_rows = {
+        r: list(row or "") for r, row in zip(rows, result[4:4 + len(rows)])
+    }
+    goal_rows = dict(zip(rows, result[4 + len(rows):]))
 
+    indices = {character: i for i, character in enumerate(COMPACT_ALPHABET)}
+    new_palette = list(state_palette)
+    palette_indices = {
+        get_cell_key(value): i for i, value in enumerate(new_palette)
+    }
+    for change in changes:
+        if change.row >= rows_count:
+            raise get_out_of_grid_exception(change)
+        state_row = state_rows[change.row]
+        if change.col >= len(state_row):
+            raise get_out_of_grid_exception(change)
+        key = get_cell_key(change.value)
+        if key not in palette_indices:
+            if len(new_palette) == len(COMPACT_ALPHABET):
+                return None  # Can't be stored in the compact format anymore
+            palette_indices[key] = len(new_palette)
+            new_palette.append(change.value)
 
-@router.delete("/gamestate/{id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_game_state(
+        goal_value = goal_palette[indices[goal_rows[change.row][change.col]]]
+        old_value = new_palette[indices[state_row[change.col]]]
+        row_mismatches[change.row] += is_mismatch(
+            goal_value, change.value
+        ) - is_mismatch(goal_value, old_value)
+        state_row[change.col] = COMPACT_ALPHABET[palette_indices[key]]
+
+    new_content = state_content
+    for r in rows:
+        new_content = func.jsonb_set(
+            new_content,
+            bindparam(None, ["rows", str(r)], type_=ARRAY(Text)),
+            cast(bindparam(None, "".join(state_rows[r]), type_=JSONB), JSONB),
+        )
+    if new_palette != state_palette:
+        new_content = func.jsonb_set(
+            new_content,
+            bindparam(None, ["palette"], type_=ARRAY(Text)),
+            cast(bindparam(None, new_palette, type_=JSONB), JSONB),
+        )
+    is_completed = not any(row_mismatches)
+    session.exec(
+        update(GameState)
+        .where(GameState.game_id == game_id)
+        .where(GameState.user_id == user_id)
+        .values(
+            current_content=new_content,
+            row_mismatches=row_mismatches,
+            is_completed=is_completed,
+            version=GameState.version + 1,
+        )
+    )
+    session.commit()
+    return GameStateCompletion(game_id=game_id, is_completed=is_completed)
+
+
+@router.patch("/gamestate/{id}")
+def patch_game_state(
     id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    game_state_changes: GameStateChanges,
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
 ):
     # TODO: protect against XSRF
-    with Session(engine) as session:
-        game_state = get_game_state(
-            id, current_user.id, session, exception_if_not_found=True
+    changes = game_state_changes.changes
+    if session.get_bind().dialect.name == "postgresql":
+        completion = patch_compact_game_state(
+            id, current_user.id, changes, session
+        )
+        if completion is not None:
+            return completion
+
+    # Contents not stored in the compact format: update the whole content
+    db_game_state = get_game_state(
+        id, current_user.id, session, exception_if_not_found=True
+    )
+    if db_game_state.current_content is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Game state has no content to apply changes to.",
+        )
+    game = get_goal_game(id, session)
+    try:
+        db_game_state.apply_changes(changes, game.goal)
+    except IndexError as error:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(error),
+        )
+    db_game_state.bump_version()
+    session.add(db_game_state)
+    session.commit()
+    return GameStateCompletion.model_validate(db_game_state)
+
+
+@router.websocket("/gamestate/{id}/ws")
+async def play_game_state(id: int, websocket: WebSocket, session: SessionDep):
+    """Apply the cell changes received as `GameStateChanges` messages,
+    answering each of them with the game state completion (or an error
+    detail). Changes are written to the database by batches (see
+    app/gamestate_writer.py).
+    """
+    user = await run_in_threadpool(
+        get_token_user, websocket.cookies.get(JWT_COOKIE_NAME), session
+    )
+
+    live_game_state = None
+    if user is not None:
+        live_game_state = await writer.open(
+            id, user.id, lambda: load_game_state(session, id, user.id)
         )
-        session.delete(game_state)
-        session.commit()
+    # Don't hold a database connection while playing
+    await run_in_threadpool(session.close)
+    if live_game_state is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    try:
+        await websocket.send_json(
+            {"game_id": id, "is_completed": live_game_state.is_completed}
+        )
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("text") is None:
+                # Binary frame, in the shape of the validation errors
+                await websocket.send_json(
+                    {
+                        "detail": [
+                            {
+                                "type": "text_frame",
+                                "loc": [],
+                                "msg": "Messages must be text frames",
+                            }
+                        ]
+                    }
+                )
+                continue
+            try:
+                changes = GameStateChanges.model_validate_json(
+                    message["text"]
+                )
+                is_completed = live_game_state.apply_changes(changes.changes)
+            except ValidationError as error:
+                await websocket.send_json(
+                    {
+                        "detail": error.errors(
+                            include_url=False,
+                            include_context=False,
+                            include_input=False,
+                        )
+                    }
+                )
+                continue
+            except IndexError as error:
+                await websocket.send_json({"detail": str(error)})
+                continue
+            await websocket.send_json(
+                {"game_id": id, "is_completed": is_completed}
+            )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await writer.close(live_game_state)
+
+
+@router.delete("/gamestate/{id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_game_state(
+    id: int,
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
+):
+    # TODO: protect against XSRF
+    game_state = get_game_state(
+        id, current_user.id, session, exception_if_not_found=True
+    )
+    session.delete(game_state)
+    session.commit()
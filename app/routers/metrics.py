@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from .. import metrics
+
+router = APIRouter(prefix="/internal")
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4"
+
+
+@router.get("/metrics")
+def get_metrics():
+    return metrics.collect()
+
+
+@router.get("/metrics/prometheus", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    return PlainTextResponse(
+        metrics.render_prometheus(), media_type=PROMETHEUS_MEDIA_TYPE
+    )
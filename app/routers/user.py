@@ -1,21 +1,37 @@
-from typing import Annotated
+from typing import Annotated, Literal
 from datetime import timedelta
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Request, status
 from fastapi.responses import Response
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import Session, select
+from sqlalchemy.orm import load_only, selectinload
+from sqlmodel import select
 from ..models.user import (
     User,
     UserRegisterInput,
     PrivateUser,
     PublicUser,
+    UserIdentity,
     get_current_user,
     get_user,
+    invalidate_user_identity,
 )
-from ..models.game import Game, GameSummaryWithCreator
-from ..database import engine
+from ..models.gamestate import GameState
+from ..models.game import (
+    Game,
+    GameSummaryWithCreator,
+    bump_catalog_version,
+    select_game_summaries,
+)
+from ..database import SessionDep
+from ..etag import (
+    get_not_modified_response,
+    is_not_modified,
+    set_cache_headers,
+)
+from ..pagination import get_page, paginate
+from .game import GameListParamsDep, PageParamsDep, get_catalog_etag
 from ..security import (
-    verify_password,
+    verify_and_update_password,
     create_access_token,
     get_password_hash,
 )
@@ -25,17 +41,31 @@ router = APIRouter()
 
 
 @router.post("/login")
-async def login_with_credentials(
-    form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+def login_with_credentials(
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    session: SessionDep,
 ):
-    user = await get_user(form_data.username)
+    user = get_user(form_data.username, session)
+    # Give the database connection back to the pool while the password is
+    # checked (the session reconnects if the hash has to be updated)
+    session.close()
     # Verify password
-    if user is None or not verify_password(form_data.password, user.password):
+    is_valid, new_hash = False, None
+    if user is not None:
+        is_valid, new_hash = verify_and_update_password(
+            form_data.password, user.password
+        )
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials.",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash is not None:
+        # Hash made with outdated parameters (e.g. BCRYPT_ROUNDS changed)
+        user.password = new_hash
+        session.add(user)
+        session.commit()
 
     # Create and send token
     expires = timedelta(minutes=JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -55,14 +85,14 @@ async def login_with_credentials(
 
 
 @router.get("/login")
-async def login_with_cookie(
-    current_user: Annotated[User, Depends(get_current_user)]
+def login_with_cookie(
+    current_user: Annotated[UserIdentity, Depends(get_current_user)]
 ):
     return current_user
 
 
 @router.get("/logout")
-async def logout(
+def logout(
     response: Response,
 ):
     response.delete_cookie(JWT_COOKIE_NAME)
@@ -71,41 +101,78 @@ async def logout(
 
 
 @router.get("/users")
-async def get_all_users():
-    with Session(engine) as session:
-        users = session.exec(select(User)).all()
-        # public_users = [user.to_public_user() for user in users]
-        return [PublicUser.model_validate(user) for user in users]
+def get_all_users(
+    response: Response,
+    page: PageParamsDep,
+    session: SessionDep,
+    sort: Literal["id", "pseudo"] = "id",
+):
+    statement = select(User).options(
+        load_only(User.id, User.pseudo),
+        selectinload(User.created_games).load_only(Game.id),
+    )
+    statement = paginate(statement, getattr(User, sort), User.id, page)
+    users = get_page(session.exec(statement).all(), sort, "id", page, response)
+    return [PublicUser.model_validate(user) for user in users]
 
 
 @router.get("/user/me", response_model=PrivateUser)
-async def get_user_me(
-    current_user: Annotated[User, Depends(get_current_user)]
+def get_user_me(
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
 ):
-    return current_user
+    user = session.get(
+        User,
+        current_user.id,
+        options=[
+            selectinload(User.created_games).load_only(Game.id),
+            selectinload(User.played_game_links).load_only(GameState.game_id),
+        ],
+    )
+    return PrivateUser.model_validate(user)
 
 
 @router.get("/user/{id}", response_model=PublicUser)
-async def get_one_user(id: int):
-    with Session(engine) as session:
-        user = session.get(User, id)
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"User '{id}' does not exist.",
-            )
-        return PublicUser.model_validate(user)
+def get_one_user(id: int, session: SessionDep):
+    user = session.get(
+        User,
+        id,
+        options=[selectinload(User.created_games).load_only(Game.id)],
+    )
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User '{id}' does not exist.",
+        )
+    return PublicUser.model_validate(user)
 
 
 @router.get("/user/{id}/games")
-async def get_games_created_by_user(id: int):
-    with Session(engine) as session:
-        games = session.exec(select(Game).where(Game.creator_id == id)).all()
-        return [GameSummaryWithCreator.model_validate(game) for game in games]
+def get_games_created_by_user(
+    id: int,
+    request: Request,
+    response: Response,
+    params: GameListParamsDep,
+    page: PageParamsDep,
+    session: SessionDep,
+):
+    etag = get_catalog_etag(request, session)
+    if etag is not None:
+        if is_not_modified(request, etag):
+            return get_not_modified_response(etag)
+        set_cache_headers(response, etag)
+    statement = params.apply(
+        select_game_summaries(with_creator=True).where(Game.creator_id == id),
+        page,
+    )
+    games = get_page(
+        session.exec(statement).all(), params.sort, "id", page, response
+    )
+    return [GameSummaryWithCreator.model_validate(game) for game in games]
 
 
 @router.post("/user", status_code=status.HTTP_201_CREATED)
-async def create_user(user: UserRegisterInput):
+def create_user(user: UserRegisterInput, session: SessionDep):
 
     def get_non_unique_user_exception(non_unique_field: str):
         return HTTPException(
@@ -113,64 +180,72 @@ async def create_user(user: UserRegisterInput):
             detail=f"User with this {non_unique_field} already exists.",
         )
 
-    user.password = get_password_hash(user.password)
+    # Validate that username (email) is unique
+    statement = select(User).where(User.username == user.username)
+    db_user = session.exec(statement).one_or_none()
+    if db_user is not None:
+        raise get_non_unique_user_exception("email")
 
-    with Session(engine) as session:
-        # Validate that username (email) is unique
-        statement = select(User).where(User.username == user.username)
-        db_user = session.exec(statement).one_or_none()
-        if db_user is not None:
-            raise get_non_unique_user_exception("email")
-
-        # Validate that pseudo is unique
-        statement = select(User).where(User.pseudo == user.pseudo)
-        db_user = session.exec(statement).one_or_none()
-        if db_user is not None:
-            raise get_non_unique_user_exception("pseudo")
-
-        # Create new user
-        user = User.model_validate(user)
-        session.add(user)
-        session.commit()
-        session.refresh(user)
-        return PrivateUser.model_validate(user)
+    # Validate that pseudo is unique
+    statement = select(User).where(User.pseudo == user.pseudo)
+    db_user = session.exec(statement).one_or_none()
+    if db_user is not None:
+        raise get_non_unique_user_exception("pseudo")
+
+    # Create new user (hashing last, it is the expensive part, without
+    # holding a database connection)
+    session.close()
+    user.password = get_password_hash(user.password)
+    user = User.model_validate(user)
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+    return PrivateUser.model_validate(user)
 
 
 @router.put("/user/{id}", response_model=PrivateUser)
-async def update_user(
+def update_user(
     id: int,
     user: User,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
 ):
     # TODO: protect against XSRF
     # Be careful, all user fields must be provided otherwise default
     # ones will be used.
     # See https://fastapi.tiangolo.com/tutorial/body-updates/
-    with Session(engine) as session:
-        db_user = session.get(User, id)
-        if db_user is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User does not exist.",
-            )
-        if current_user != db_user:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You are not allowed to modify this user.",
-            )
-        db_user.pseudo = user.pseudo
-        db_user.username = user.username
-        db_user.password = get_password_hash(user.password)
-        session.add(db_user)
-        session.commit()
-        session.refresh(db_user)
-        return PrivateUser.model_validate(db_user)
+    db_user = session.get(User, id)
+    if db_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User does not exist.",
+        )
+    if current_user.id != db_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not allowed to modify this user.",
+        )
+    # Hashing without holding a database connection
+    session.close()
+    password_hash = get_password_hash(user.password)
+    session.add(db_user)
+    if db_user.pseudo != user.pseudo:
+        bump_catalog_version(session)  # Games lists show the pseudo
+    db_user.pseudo = user.pseudo
+    db_user.username = user.username
+    db_user.password = password_hash
+    session.commit()
+    invalidate_user_identity(current_user.username)
+    invalidate_user_identity(db_user.username)
+    session.refresh(db_user)
+    return PrivateUser.model_validate(db_user)
 
 
 @router.delete("/user/{id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user(
+def delete_user(
     id: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[UserIdentity, Depends(get_current_user)],
+    session: SessionDep,
 ):
     # TODO: protect against XSRF
     if not current_user.id == id:
@@ -178,12 +253,14 @@ async def delete_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not allowed to delete this user.",
         )
-    with Session(engine) as session:
-        user = session.get(User, id)
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"User '{id}' does not exist.",
-            )
-        session.delete(user)
-        session.commit()
+    user = session.get(User, id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User '{id}' does not exist.",
+        )
+    session.delete(user)
+    # Games lists show the creators, set to NULL by the database
+    bump_catalog_version(session)
+    session.commit()
+    invalidate_user_identity(current_user.username)
@@ -1,21 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from threading import BoundedSemaphore, Lock
+from time import perf_counter
 import jwt
+from fastapi import HTTPException, status
 from fastapi.security import APIKeyCookie
 from passlib.context import CryptContext
 from pydantic import BaseModel
-from .config import JWT_SECRET_KEY, JWT_ALGORITHM, JWT_COOKIE_NAME
+from . import metrics
+from .config import (
+    JWT_SECRET_KEY,
+    JWT_ALGORITHM,
+    JWT_COOKIE_NAME,
+    BCRYPT_ROUNDS,
+    PASSWORD_POOL_SIZE,
+    PASSWORD_QUEUE_SIZE,
+)
 
 cookie_scheme = APIKeyCookie(name=JWT_COOKIE_NAME)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with other rounds are flagged for update on verification
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
 
+# Password hashing is slow on purpose: it runs in a small dedicated pool so
+# that a burst of logins can't take all the request threads. Requests beyond
+# the running and queued slots are rejected with a 503.
+_password_pool: ThreadPoolExecutor | None = None
+_password_slots = BoundedSemaphore(PASSWORD_POOL_SIZE + PASSWORD_QUEUE_SIZE)
+_password_pending = 0
+_password_pending_lock = Lock()
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+password_queue_wait = metrics.summary(
+    "password_queue_wait_seconds",
+    "Time spent by password operations waiting for a free worker.",
+)
+password_hash_duration = metrics.summary(
+    "password_hash_seconds", "Duration of the password hashings."
+)
+password_verify_duration = metrics.summary(
+    "password_verify_seconds", "Duration of the password verifications."
+)
+password_rejections = metrics.counter(
+    "password_rejections_total",
+    "Password operations rejected because the pool was saturated.",
+)
+metrics.gauge(
+    "password_pending",
+    "Password operations running or waiting for a worker.",
+    lambda: _password_pending,
+)
+
+
+def get_password_pool():
+    global _password_pool
+    if _password_pool is None:
+        _password_pool = ThreadPoolExecutor(
+            max_workers=PASSWORD_POOL_SIZE, thread_name_prefix="password"
+        )
+    return _password_pool
+
+
+def shutdown_password_pool():
+    global _password_pool
+    if _password_pool is not None:
+        _password_pool.shutdown(wait=False, cancel_futures=True)
+        _password_pool = None
+
+
+def _run_in_password_pool(duration: metrics.Summary, function, *args):
+    global _password_pending
+    if not _password_slots.acquire(blocking=False):
+        password_rejections.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, retry later.",
+            headers={"Retry-After": "1"},
+        )
+    with _password_pending_lock:
+        _password_pending += 1
+    submitted_at = perf_counter()
+
+    def run():
+        started_at = perf_counter()
+        password_queue_wait.observe(started_at - submitted_at)
+        try:
+            return function(*args)
+        finally:
+            duration.observe(perf_counter() - started_at)
+
+    try:
+        return get_password_pool().submit(run).result()
+    finally:
+        with _password_pending_lock:
+            _password_pending -= 1
+        _password_slots.release()
+
+
+def verify_and_update_password(plain_password, hashed_password):
+    """Return whether the password is valid and, if its hash was made with
+    outdated parameters, its new hash (None otherwise).
+    """
+    return _run_in_password_pool(
+        password_verify_duration,
+        pwd_context.verify_and_update,
+        plain_password,
+        hashed_password,
+    )
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return _run_in_password_pool(
+        password_hash_duration, pwd_context.hash, password
+    )
 
 
 class Token(BaseModel):
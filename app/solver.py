@@ -0,0 +1,333 @@
+"""Multicolor nonogram solver working from the clues built by
+`Game.update_clues()`.
+
+Every cell is represented by a bitmask of the values it can still take: bit 0
+stands for "empty" and bit `k` for the k-th color of the puzzle palette. Lines
+are solved with a left/right dynamic programming pass (memoized on the line
+clue and cell domains), the grid is solved by propagating line solutions until
+nothing changes and a depth-first search takes over when propagation stalls.
+"""
+
+from dataclasses import dataclass, field
+from enum import StrEnum
+from functools import lru_cache
+from time import perf_counter
+from .models import Clues
+
+EMPTY = 1  # Bitmask of the "empty" value
+
+type LineClue = tuple[tuple[int, int], ...]  # ((color index, count), ...)
+
+
+@dataclass
+class SolverStats:
+    rounds: int = 0  # Propagation rounds (one rows pass + one columns pass)
+    line_solves: int = 0
+    nodes: int = 0  # Search nodes (guesses) explored
+    max_depth: int = 0  # Deepest search branching level reached
+    exhausted: bool = False  # Search budget reached before completion
+    timed_out: bool = False  # The budget reached was the timeout
+    duration: float = 0  # Seconds
+
+
+@dataclass
+class SolveResult:
+    solutions: list[list[int]] = field(default_factory=list)  # Color indices
+    stats: SolverStats = field(default_factory=SolverStats)
+
+    @property
+    def is_solved(self):
+        return len(self.solutions) > 0
+
+
+class Uniqueness(StrEnum):
+    UNIQUE = "unique"
+    AMBIGUOUS = "ambiguous"
+    UNKNOWN = "unknown"  # Search budget exhausted
+
+
+def _color_key(rgba):
+    return tuple(rgba) if isinstance(rgba, list) else rgba
+
+
+def parse_clues(clues: Clues):
+    """Convert `Game.clues` into a palette and rows/columns line clues made
+    of (color index, count) tuples. Color indices start at 1, 0 being empty.
+    """
+    palette = []
+    indices = {}
+
+    def parse_line(clue_line) -> LineClue:
+        if clue_line is None:
+            return ()
+        parsed = []
+        for clue in clue_line:
+            key = _color_key(clue["rgba"])
+            if key not in indices:
+                palette.append(clue["rgba"])
+                indices[key] = len(palette)
+            parsed.append((indices[key], clue["count"]))
+        return tuple(parsed)
+
+    rows = [parse_line(clue_line) for clue_line in clues[0]]
+    columns = [parse_line(clue_line) for clue_line in clues[1]]
+    return palette, rows, columns
+
+
+@lru_cache(maxsize=65536)
+def solve_line(clue: LineClue, domains: tuple[int, ...]):
+    """Return the cell domains reduced to the values used by at least one
+    arrangement of `clue` compatible with `domains`, or None if there is no
+    such arrangement.
+    """
+    n = len(domains)
+    m = len(clue)
+    empty_ok = [domain & EMPTY for domain in domains]
+
+    # Blocks with their mandatory trailing gap (when the next block has the
+    # same color) and the range of cells they can start at
+    blocks = []
+    offset = 0
+    for j, (color, length) in enumerate(clue):
+        gap = 1 if j + 1 < m and clue[j + 1][0] == color else 0
+        blocks.append([1 << color, length, gap, offset])
+        offset += length + gap
+    slack = n - offset
+    if slack < 0:
+        return None
+
+    # fits[j][i]: block j (and its gap) can start at cell i
+    fits = []
+    forbidden = {}  # Prefix counts of the cells that can't take a color
+    for bit, length, gap, first in blocks:
+        if bit not in forbidden:
+            counts = [0] * (n + 1)
+            for i, domain in enumerate(domains):
+                counts[i + 1] = counts[i] + (0 if domain & bit else 1)
+            forbidden[bit] = counts
+        counts = forbidden[bit]
+        fits_j = [False] * (n + 1)
+        for i in range(first, first + slack + 1):
+            end = i + length
+            if counts[end] == counts[i] and (not gap or empty_ok[end]):
+                fits_j[i] = True
+        fits.append(fits_j)
+
+    # can_finish[j][i]: blocks j.. can be placed in cells i..
+    can_finish = [[False] * (n + 2) for _ in range(m + 1)]
+    row = can_finish[m]
+    row[n] = True
+    for i in range(n - 1, offset - 1, -1):
+        row[i] = bool(empty_ok[i]) and row[i + 1]
+    for j in range(m - 1, -1, -1):
+        row = can_finish[j]
+        next_row = can_finish[j + 1]
+        fits_j = fits[j]
+        _, length, gap, first = blocks[j]
+        step = length + gap
+        for i in range(first + slack, first - 1, -1):
+            row[i] = (empty_ok[i] and row[i + 1]) or (
+                fits_j[i] and next_row[i + step]
+            )
+
+    if not can_finish[0][0]:
+        return None
+
+    # Forward pass over the reachable states, marking the values used by the
+    # valid transitions in difference arrays
+    reachable = [[False] * (n + 2) for _ in range(m + 1)]
+    reachable[0][0] = True
+    empty_marks = [0] * (n + 2)
+    color_marks = {bit: [0] * (n + 2) for bit in forbidden}
+    for j in range(m):
+        row = reachable[j]
+        finish = can_finish[j]
+        next_row = reachable[j + 1]
+        next_finish = can_finish[j + 1]
+        fits_j = fits[j]
+        bit, length, gap, first = blocks[j]
+        step = length + gap
+        marks = color_marks[bit]
+        for i in range(first, first + slack + 1):
+            if not row[i] or not finish[i]:
+                continue
+            if empty_ok[i] and finish[i + 1]:
+                row[i + 1] = True
+                empty_marks[i] += 1
+                empty_marks[i + 1] -= 1
+            if fits_j[i] and next_finish[i + step]:
+                next_row[i + step] = True
+                marks[i] += 1
+                marks[i + length] -= 1
+                if gap:
+                    empty_marks[i + length] += 1
+                    empty_marks[i + step] -= 1
+    row = reachable[m]
+    for i in range(offset, n + 1):
+        if row[i] and can_finish[m][i]:
+            # Every following cell is empty
+            empty_marks[i] += 1
+            empty_marks[n] -= 1
+            break
+
+    result = [0] * n
+    for bit, diff in [(EMPTY, empty_marks), *color_marks.items()]:
+        running = 0
+        for i in range(n):
+            running += diff[i]
+            if running:
+                result[i] |= bit
+    return tuple(result)
+
+
+class Solver:
+    def __init__(
+        self,
+        rows: list[LineClue],
+        columns: list[LineClue],
+        colors_count: int,
+        max_nodes: int = 2000,
+        timeout: float | None = None,
+    ):
+        self.rows = rows
+        self.columns = columns
+        self.height = len(rows)
+        self.width = len(columns)
+        self.full_domain = (1 << (colors_count + 1)) - 1
+        self.max_nodes = max_nodes
+        self.timeout = timeout
+        self._deadline = None
+
+    @classmethod
+    def from_clues(cls, clues: Clues, **kwargs):
+        palette, rows, columns = parse_clues(clues)
+        return cls(rows, columns, len(palette), **kwargs)
+
+    def _is_out_of_time(self, stats):
+        if self._deadline is not None and perf_counter() > self._deadline:
+            stats.exhausted = True
+            stats.timed_out = True
+        return stats.exhausted
+
+    def _propagate(self, grid, dirty_rows, dirty_columns, stats):
+        width = self.width
+        height = self.height
+        while dirty_rows or dirty_columns:
+            stats.rounds += 1
+            for r in sorted(dirty_rows):
+                if self._is_out_of_time(stats):
+                    return False
+                line = tuple(grid[r * width:(r + 1) * width])
+                solved = solve_line(self.rows[r], line)
+                stats.line_solves += 1
+                if solved is None:
+                    return False
+                for c in range(width):
+                    if solved[c] != line[c]:
+                        grid[r * width + c] = solved[c]
+                        dirty_columns.add(c)
+            dirty_rows = set()
+            for c in sorted(dirty_columns):
+                if self._is_out_of_time(stats):
+                    return False
+                line = tuple(grid[c::width])
+                solved = solve_line(self.columns[c], line)
+                stats.line_solves += 1
+                if solved is None:
+                    return False
+                for r in range(height):
+                    if solved[r] != line[r]:
+                        grid[r * width + c] = solved[r]
+                        dirty_rows.add(r)
+            dirty_columns = set()
+        return True
+
+    def _search(self, grid, depth, result, max_solutions):
+        stats = result.stats
+        stats.max_depth = max(stats.max_depth, depth)
+        # Branch on the undecided cell having the fewest possible values
+        best = None
+        for index, domain in enumerate(grid):
+            if domain & (domain - 1):
+                options = domain.bit_count()
+                if best is None or options < best[1]:
+                    best = (index, options)
+                    if options == 2:
+                        break
+        if best is None:
+            result.solutions.append(
+                [domain.bit_length() - 1 for domain in grid]
+            )
+            return
+
+        index = best[0]
+        domain = grid[index]
+        while domain:
+            bit = domain & -domain
+            domain ^= bit
+            if stats.nodes >= self.max_nodes:
+                stats.exhausted = True
+            if self._is_out_of_time(stats):
+                return
+            stats.nodes += 1
+            branch = grid.copy()
+            branch[index] = bit
+            row, column = divmod(index, self.width)
+            if self._propagate(branch, {row}, {column}, stats):
+                self._search(branch, depth + 1, result, max_solutions)
+            if len(result.solutions) >= max_solutions or stats.exhausted:
+                return
+
+    def propagate(self, grid: list[int]):
+        """Reduce the cell domains of `grid` (row-major bitmasks) by solving
+        its lines until nothing changes, without guessing. Return the new
+        grid, or None if it is contradictory or `timeout` is reached.
+        """
+        if self.timeout is not None:
+            self._deadline = perf_counter() + self.timeout
+        grid = list(grid)
+        rows = set(range(self.height))
+        columns = set(range(self.width))
+        if self._propagate(grid, rows, columns, SolverStats()):
+            return grid
+        return None
+
+    def solve(self, max_solutions: int = 1):
+        """Look for up to `max_solutions` solutions. The search stops early
+        (with `stats.exhausted` set) when `max_nodes` or `timeout` is reached.
+        """
+        start = perf_counter()
+        if self.timeout is not None:
+            self._deadline = start + self.timeout
+        result = SolveResult()
+        grid = [self.full_domain] * (self.width * self.height)
+        if self._propagate(
+            grid, set(range(self.height)), set(range(self.width)), result.stats
+        ):
+            self._search(grid, 0, result, max_solutions)
+        result.stats.duration = perf_counter() - start
+        return result
+
+
+def get_difficulty(stats: SolverStats):
+    """Map the solver effort onto the 1 (easiest) to 5 (hardest) scale."""
+    if stats.exhausted or stats.max_depth > 1:
+        return 5
+    if stats.nodes > 0:
+        return 4  # Needed a single level of guessing
+    if stats.rounds <= 2:
+        return 1
+    if stats.rounds <= 5:
+        return 2
+    return 3
+
+
+def get_uniqueness(clues: Clues, timeout: float, max_nodes: int = 100000):
+    """Look for a second solution to tell whether the puzzle is unique."""
+    solver = Solver.from_clues(clues, max_nodes=max_nodes, timeout=timeout)
+    result = solver.solve(max_solutions=2)
+    if len(result.solutions) >= 2:
+        return Uniqueness.AMBIGUOUS
+    if len(result.solutions) == 1 and not result.stats.exhausted:
+        return Uniqueness.UNIQUE
+    return Uniqueness.UNKNOWN
@@ -0,0 +1,146 @@
+"""Thumbnails of the games: PNG images of their content, one square of
+pixels per cell, kept in a size-bounded cache on disk.
+
+The cache directory can be shared by the worker processes. Each worker
+counts what it writes, and when the total may exceed the limit, scans the
+directory and deletes the least recently used files (their modification
+time is refreshed on every hit).
+"""
+
+import logging
+import os
+import secrets
+from io import BytesIO
+from pathlib import Path
+from threading import Lock
+import numpy as np
+from PIL import Image
+from . import metrics
+from .config import (
+    THUMBNAIL_CACHE_DIR,
+    THUMBNAIL_CACHE_MAX_SIZE,
+    THUMBNAIL_SIZE,
+)
+from .models.grid import PaletteGrid
+
+logger = logging.getLogger(__name__)
+
+thumbnail_cache_hits = metrics.counter(
+    "thumbnail_cache_hits_total", "Thumbnails read from the disk cache."
+)
+thumbnail_cache_misses = metrics.counter(
+    "thumbnail_cache_misses_total", "Thumbnails rendered."
+)
+
+
+def render_thumbnail(grid: PaletteGrid, max_size: int = THUMBNAIL_SIZE):
+    """PNG of `grid`, cells being squares of the biggest size keeping the
+    image within `max_size` pixels (one pixel per cell for bigger grids).
+    Empty cells are transparent.
+    """
+    colors = np.zeros((len(grid.palette), 4), dtype=np.uint8)
+    for i, value in enumerate(grid.palette):
+        if isinstance(value, list):
+            # Games saved before their colors were validated may have
+            # missing or out of range values
+            r, g, b = [*value[:3], 0, 0, 0][:3]
+            a = value[3] if len(value) > 3 else 1
+            colors[i] = np.clip(np.rint([r, g, b, a * 255]), 0, 255)
+    pixels = colors[grid.indices]
+    scale = max(1, max_size // max(grid.rows_count, grid.columns_count, 1))
+    if scale > 1:
+        pixels = pixels.repeat(scale, axis=0).repeat(scale, axis=1)
+    output = BytesIO()
+    Image.fromarray(pixels, "RGBA").save(output, "PNG", optimize=True)
+    return output.getvalue()
+
+
+class DiskCache:
+    """Files cache of at most `max_size` bytes (0 to disable), evicting the
+    least recently used entries. Keys must be valid file names.
+    """
+
+    # Share of max_size left after an eviction, so that it doesn't run on
+    # every write
+    EVICTION_RATIO = 0.9
+
+    def __init__(self, directory: str | Path, max_size: int):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self._size: int | None = None  # Unknown until the directory is read
+        self._lock = Lock()
+
+    def _get_path(self, key: str):
+        return self.directory / f"{key}.png"
+
+    def get(self, key: str) -> bytes | None:
+        if self.max_size <= 0:
+            return None
+        path = self._get_path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # Most recently used
+        except FileNotFoundError:  # Possibly evicted by another worker
+            return None
+        return data
+
+    def set(self, key: str, data: bytes):
+        if self.max_size <= 0:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Written then renamed, so that readers never get a partial file
+        temporary_path = self.directory / f".{secrets.token_hex(8)}.tmp"
+        temporary_path.write_bytes(data)
+        os.replace(temporary_path, self._get_path(key))
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data)
+            if self._size is None or self._size > self.max_size:
+                self._size = self._evict()
+
+    def _evict(self):
+        """Delete the least recently used files until the cache is back to
+        EVICTION_RATIO of its maximum size, returning its size.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".png"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        if size <= self.max_size:
+            return size
+        entries.sort()
+        for _, entry_size, path in entries:
+            if size <= self.max_size * self.EVICTION_RATIO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        return size
+
+
+thumbnail_cache = DiskCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_SIZE)
+
+
+def get_thumbnail(key: str, get_grid):
+    """Thumbnail cached as `key`, rendered from the grid returned by
+    `get_grid` on cache misses.
+    """
+    data = thumbnail_cache.get(key)
+    if data is not None:
+        thumbnail_cache_hits.inc()
+        return data
+    thumbnail_cache_misses.inc()
+    data = render_thumbnail(get_grid())
+    try:
+        thumbnail_cache.set(key, data)
+    except OSError as error:  # Served anyway
+        logger.warning("Thumbnail not cached: %s", error)
+    return data
@@ -0,0 +1,51 @@
+"""Uniqueness verification of the puzzles.
+
+Small grids are checked inline, bigger ones are sent to a process pool so
+that the CPU-heavy search never runs on the request threads.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from .config import (
+    UNIQUENESS_INLINE_MAX_CELLS,
+    UNIQUENESS_POOL_SIZE,
+    UNIQUENESS_TIMEOUT,
+)
+from .models import Clues
+from .solver import Uniqueness, get_uniqueness
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=UNIQUENESS_POOL_SIZE,
+            # Forking a multi-threaded server process is unsafe
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def check_uniqueness(clues: Clues | None):
+    if clues is None:
+        return None
+    cells_count = len(clues[0]) * len(clues[1])
+    if cells_count <= UNIQUENESS_INLINE_MAX_CELLS:
+        return get_uniqueness(clues, UNIQUENESS_TIMEOUT)
+    # The solver stops by itself after UNIQUENESS_TIMEOUT, the extra delay
+    # only covers the time spent waiting for a free worker.
+    future = get_pool().submit(get_uniqueness, clues, UNIQUENESS_TIMEOUT)
+    try:
+        return future.result(timeout=2 * UNIQUENESS_TIMEOUT)
+    except TimeoutError:
+        future.cancel()
+        return Uniqueness.UNKNOWN
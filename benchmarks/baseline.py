@@ -0,0 +1,117 @@
+"""Stored benchmark results (benchmarks/baselines/*.json) and comparison with
+them: a change making things slower, or running more queries, shows up when
+running the benchmarks and in the diff of the baselines it updates.
+
+Timings are only compared with baselines recorded on the same environment
+(Python version, machine), query counts always are.
+"""
+
+import argparse
+import os
+import platform
+from pathlib import Path
+import orjson
+
+BASELINES_DIR = Path(__file__).parent / "baselines"
+
+# Metrics not depending on the machine running the benchmark
+EXACT_METRICS = {"queries"}
+# Metrics for which lower values are regressions
+HIGHER_IS_BETTER = {"throughput"}
+
+type Results = dict[str, dict[str, float]]
+
+
+def get_environment():
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def load_baseline(name: str):
+    path = BASELINES_DIR / f"{name}.json"
+    if not path.exists():
+        return None
+    return orjson.loads(path.read_bytes())
+
+
+def save_baseline(name: str, results: Results):
+    BASELINES_DIR.mkdir(exist_ok=True)
+    (BASELINES_DIR / f"{name}.json").write_bytes(
+        orjson.dumps(
+            {"environment": get_environment(), "results": results},
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS,
+        )
+        + b"\n"
+    )
+
+
+def compare(results: Results, baseline: dict, tolerances: dict[str, float]):
+    """Return the regressions of `results` compared with `baseline`, as
+    (case, metric, value, baseline value) tuples. A metric regresses when it
+    is worse by more than its tolerance (a ratio of the baseline value).
+    """
+    same_environment = baseline["environment"] == get_environment()
+    regressions = []
+    for case, values in results.items():
+        baseline_values = baseline["results"].get(case, {})
+        for metric, value in values.items():
+            baseline_value = baseline_values.get(metric)
+            if baseline_value is None or metric not in tolerances:
+                continue
+            if metric not in EXACT_METRICS and not same_environment:
+                continue
+            tolerance = tolerances[metric]
+            if metric in HIGHER_IS_BETTER:
+                is_regression = value < baseline_value * (1 - tolerance)
+            else:
+                is_regression = value > baseline_value * (1 + tolerance)
+            if is_regression:
+                regressions.append((case, metric, value, baseline_value))
+    return regressions
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--save",
+        action="store_true",
+        help="store the results as the new baseline",
+    )
+
+
+def report(
+    name: str,
+    results: Results,
+    tolerances: dict[str, float],
+    args: argparse.Namespace,
+):
+    """Compare `results` with the `name` baseline (or store them with
+    --save) and return the process exit code: 1 if there are regressions.
+    """
+    if args.save:
+        save_baseline(name, results)
+        print(f"\nBaseline saved to {BASELINES_DIR / f"{name}.json"}.")
+        return 0
+    baseline = load_baseline(name)
+    if baseline is None:
+        print("\nNo baseline to compare with (see --save).")
+        return 0
+    if baseline["environment"] != get_environment():
+        print(
+            "\nBaseline recorded on another environment "
+            f"({baseline["environment"]}): only query counts are compared."
+        )
+    regressions = compare(results, baseline, tolerances)
+    if len(regressions) == 0:
+        print("\nNo regression compared with the baseline.")
+        return 0
+    print("\nRegressions compared with the baseline:")
+    for case, metric, value, baseline_value in regressions:
+        print(
+            f"  {case}: {metric} {value:.3f} "
+            f"(baseline {baseline_value:.3f})"
+        )
+    return 1
@@ -0,0 +1,121 @@
+"""Clue generation and completion check benchmark, comparing the former
+nested lists implementation with the NumPy palette grid.
+
+Run from the project's root with `python -m benchmarks.grid`.
+"""
+
+import copy
+import random
+from timeit import Timer
+from app.models.game import Game
+from app.models.gamestate import GameState
+from app.models.grid import PaletteGrid
+
+COLORS = [
+    [0, 0, 0, 1.0],
+    [255, 0, 0, 1.0],
+    [0, 128, 255, 1.0],
+    [255, 200, 0, 1.0],
+]
+SIZES = [10, 50, 200]
+
+
+def legacy_get_clues(content):
+    def get_line_clues(line_content):
+        clue_line = []
+        last_rgba = False
+        is_first_index = True
+        for rgba in line_content:
+            if (
+                is_first_index is not True
+                and rgba != None
+                and last_rgba == rgba
+            ):
+                clue_line[-1]["count"] += 1
+            else:
+                if rgba is not None:
+                    clue_line.append({"rgba": copy.copy(rgba), "count": 1})
+                last_rgba = copy.copy(rgba)
+                is_first_index = False
+        if len(clue_line) == 0:
+            return None
+        return clue_line
+
+    columns_content = []
+    for i in range(max([len(row) for row in content])):
+        columns_content.append(list(map(lambda row: row[i], content)))
+    return [
+        list(map(get_line_clues, content)),
+        list(map(get_line_clues, columns_content)),
+    ]
+
+
+def legacy_is_completed(current_content, goal_content):
+    for r, row in enumerate(goal_content):
+        for c, cell in enumerate(row):
+            if cell != current_content[r][c]:
+                if cell is None and current_content[r][c] is False:
+                    continue
+                return False
+    return True
+
+
+def make_content(size: int):
+    return [
+        [random.choice(COLORS) if random.random() < 0.6 else None
+         for _ in range(size)]
+        for _ in range(size)
+    ]
+
+
+def best_time(function, repeat=5):
+    timer = Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1000
+
+
+def main():
+    random.seed(0)
+    print(
+        f"{"size":>9} {"clues (legacy)":>15} {"clues (numpy)":>14} "
+        f"{"completion (legacy)":>20} {"completion (numpy)":>19} "
+        f"{"completion (numpy, encoded goal)":>33}"
+    )
+    for size in SIZES:
+        content = make_content(size)
+        # Solved state, with crossed (False) cells: the worst case for the
+        # completion check that has to go through every cell
+        current_content = [
+            [False if cell is None else copy.copy(cell) for cell in row]
+            for row in content
+        ]
+        game = Game(name="benchmark", content=content)
+        game_state = GameState(current_content=current_content)
+
+        game.update_clues()
+        assert game.clues == legacy_get_clues(content)
+        game_state.update_is_completed(content)
+        assert game_state.is_completed
+        goal = PaletteGrid.from_content(content)
+        assert legacy_is_completed(current_content, content)
+
+        print(
+            f"{f"{size}x{size}":>9} "
+            f"{best_time(lambda: legacy_get_clues(content)):>12.3f} ms "
+            f"{best_time(
+                lambda: PaletteGrid.from_content(content).get_clues()
+            ):>11.3f} ms "
+            f"{best_time(
+                lambda: legacy_is_completed(current_content, content)
+            ):>17.3f} ms "
+            f"{best_time(
+                lambda: game_state.update_is_completed(content)
+            ):>16.3f} ms "
+            f"{best_time(
+                lambda: game_state.update_is_completed(goal)
+            ):>30.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
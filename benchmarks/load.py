@@ -0,0 +1,317 @@
+"""End-to-end load scenario: concurrent virtual users logging in, browsing
+the catalog, opening games and playing them with rapid PATCH updates. The
+app runs in-process (httpx's ASGI transport, no network nor server) against
+the configured database.
+
+Use a local, throwaway database: the migrations are applied to it, and the
+scenario's users and games are deleted at the end.
+
+Reports the latency percentiles and the (median) queries per request of
+each operation and the overall throughput, compared with
+benchmarks/baselines/load.json (see benchmarks/baseline.py).
+
+Run from the project's root with `python -m benchmarks.load` (`--save` to
+update the baseline).
+"""
+
+import argparse
+import asyncio
+import random
+import secrets
+import sys
+from collections import defaultdict
+from contextvars import ContextVar
+from statistics import median, quantiles
+from time import perf_counter
+import httpx
+from sqlalchemy import event
+from app.config import JWT_COOKIE_NAME
+from app.database import engine
+from app.database.migrate import migrate
+from app.main import app
+from app.pagination import NEXT_CURSOR_HEADER
+from .baseline import add_arguments, report
+from .micro import make_content
+
+USERS_COUNT = 20  # Concurrent virtual users
+GAMES_COUNT = 40
+GAME_SIZE = 15
+COLORS_COUNT = 4
+PAGE_SIZE = 20
+OPENED_GAMES_COUNT = 3  # Per user
+MOVES_COUNT = 20  # Per opened game
+TOLERANCES = {
+    "p50_ms": 0.3,
+    "p95_ms": 0.5,
+    "queries": 0,  # Any additional query is a regression
+    "throughput": 0.3,
+}
+
+# Statements run for the request being measured
+_queries_count: ContextVar[list[int] | None] = ContextVar(
+    "queries_count", default=None
+)
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def count_query(connection, cursor, statement, parameters, context, many):
+    # Handlers run in worker threads with a copy of the request's context,
+    # sharing the list
+    queries_count = _queries_count.get()
+    if queries_count is not None:
+        queries_count[0] += 1
+
+
+class Recorder:
+    def __init__(self):
+        self.durations: dict[str, list[float]] = defaultdict(list)
+        self.queries: dict[str, list[int]] = defaultdict(list)
+
+    async def request(
+        self,
+        client: httpx.AsyncClient,
+        operation: str | None,
+        method: str,
+        url: str,
+        **kwargs,
+    ):
+        """Send the request, recording it under `operation` (unless None)."""
+        queries_count = [0]
+        token = _queries_count.set(queries_count)
+        start = perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        finally:
+            duration = perf_counter() - start
+            _queries_count.reset(token)
+        if response.is_error:
+            raise RuntimeError(
+                f"{method} {url}: {response.status_code} {response.text}"
+            )
+        if operation is not None:
+            self.durations[operation].append(duration)
+            self.queries[operation].append(queries_count[0])
+        return response
+
+    def get_results(self, wall_duration: float):
+        results = {}
+        for operation, durations in self.durations.items():
+            if len(durations) > 1:
+                percentiles = quantiles(durations, n=100, method="inclusive")
+            else:
+                percentiles = durations * 99
+            results[operation] = {
+                "requests": len(durations),
+                "p50_ms": percentiles[49] * 1000,
+                "p95_ms": percentiles[94] * 1000,
+                "p99_ms": percentiles[98] * 1000,
+                # Median: cache misses depend on the concurrent requests order
+                "queries": median(self.queries[operation]),
+            }
+        requests_count = sum(map(len, self.durations.values()))
+        results["total"] = {
+            "requests": requests_count,
+            "throughput": requests_count / wall_duration,
+        }
+        return results
+
+
+def get_client():
+    # https: the authentication cookie is a secure one
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="https://testserver",
+    )
+
+
+async def sign_up(recorder: Recorder, client: httpx.AsyncClient, name: str):
+    """Create the user and log it in, returning its id and password."""
+    password = secrets.token_hex(16)
+    user = {"pseudo": name, "username": f"{name}@example.com"}
+    response = await recorder.request(
+        client, None, "POST", "/user", json={**user, "password": password}
+    )
+    return response.json()["id"], password
+
+
+async def log_in(
+    recorder: Recorder,
+    client: httpx.AsyncClient,
+    operation: str | None,
+    name: str,
+    password: str,
+):
+    response = await recorder.request(
+        client,
+        operation,
+        "POST",
+        "/login",
+        data={"username": f"{name}@example.com", "password": password},
+    )
+    client.cookies.set(JWT_COOKIE_NAME, response.cookies[JWT_COOKIE_NAME])
+
+
+async def play(recorder: Recorder, name: str, password: str, seed: int):
+    """Scenario of a virtual user."""
+    generator = random.Random(seed)
+    async with get_client() as client:
+        await log_in(recorder, client, "login", name, password)
+
+        response = await recorder.request(
+            client,
+            "browse games",
+            "GET",
+            "/games",
+            params={"limit": PAGE_SIZE},
+        )
+        game_ids = [game["id"] for game in response.json()]
+        response = await recorder.request(
+            client,
+            "browse games",
+            "GET",
+            "/games",
+            params={
+                "limit": PAGE_SIZE,
+                "cursor": response.headers[NEXT_CURSOR_HEADER],
+            },
+        )
+        game_ids.extend(game["id"] for game in response.json())
+        await recorder.request(
+            client,
+            "browse games batch",
+            "GET",
+            "/games/batch",
+            params={"id": game_ids[:PAGE_SIZE]},
+        )
+        await recorder.request(
+            client,
+            "browse gamestates batch",
+            "GET",
+            "/gamestates/batch",
+            params={"game_id": game_ids[:PAGE_SIZE]},
+        )
+
+        for game_id in generator.sample(game_ids, OPENED_GAMES_COUNT):
+            response = await recorder.request(
+                client, "open game", "GET", f"/game/{game_id}"
+            )
+            game = response.json()
+            rows_count, columns_count = (
+                game["rows_count"],
+                game["columns_count"],
+            )
+            await recorder.request(
+                client,
+                "create gamestate",
+                "POST",
+                f"/gamestate/{game_id}",
+                json={
+                    "current_content": [
+                        [None] * columns_count for _ in range(rows_count)
+                    ]
+                },
+            )
+            # Playing the right cells, as if solving the puzzle
+            for _ in range(MOVES_COUNT):
+                r = generator.randrange(rows_count)
+                c = generator.randrange(columns_count)
+                value = game["content"][r][c]
+                await recorder.request(
+                    client,
+                    "patch gamestate",
+                    "PATCH",
+                    f"/gamestate/{game_id}",
+                    json={
+                        "changes": [{"row": r, "col": c, "value": value}]
+                    },
+                )
+
+
+async def run():
+    random.seed(0)
+    migrate(engine)
+    prefix = f"load-{secrets.token_hex(4)}"
+    recorder = Recorder()
+    async with app.router.lifespan_context(app), get_client() as creator:
+        creator_id, creator_password = await sign_up(
+            recorder, creator, prefix
+        )
+        game_ids = []
+        players = []
+        try:
+            await log_in(recorder, creator, None, prefix, creator_password)
+            for i in range(GAMES_COUNT):
+                response = await recorder.request(
+                    creator,
+                    None,
+                    "POST",
+                    "/game",
+                    json={
+                        "name": f"{prefix}-{i}",
+                        "content": make_content(GAME_SIZE, COLORS_COUNT),
+                    },
+                )
+                game_ids.append(response.json()["id"])
+            for i in range(USERS_COUNT):
+                async with get_client() as client:
+                    name = f"{prefix}-{i}"
+                    user_id, password = await sign_up(recorder, client, name)
+                    players.append((name, user_id, password))
+
+            start = perf_counter()
+            await asyncio.gather(
+                *(
+                    play(recorder, name, password, seed)
+                    for seed, (name, _, password) in enumerate(players)
+                )
+            )
+            wall_duration = perf_counter() - start
+        finally:
+            await clean_up(recorder, creator, creator_id, game_ids, players)
+    return recorder.get_results(wall_duration)
+
+
+async def clean_up(
+    recorder: Recorder,
+    creator: httpx.AsyncClient,
+    creator_id: int,
+    game_ids: list[int],
+    players: list[tuple[str, int, str]],
+):
+    # Game states are deleted along with their user
+    for name, user_id, password in players:
+        async with get_client() as client:
+            await log_in(recorder, client, None, name, password)
+            await recorder.request(client, None, "DELETE", f"/user/{user_id}")
+    for game_id in game_ids:
+        await recorder.request(creator, None, "DELETE", f"/game/{game_id}")
+    await recorder.request(creator, None, "DELETE", f"/user/{creator_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_arguments(parser)
+    args = parser.parse_args()
+    results = asyncio.run(run())
+    print(
+        f"{"operation":<24} {"requests":>8} {"p50 ms":>8} {"p95 ms":>8} "
+        f"{"p99 ms":>8} {"queries":>7}"
+    )
+    for operation, values in results.items():
+        if operation == "total":
+            continue
+        print(
+            f"{operation:<24} {values["requests"]:>8} "
+            f"{values["p50_ms"]:>8.2f} {values["p95_ms"]:>8.2f} "
+            f"{values["p99_ms"]:>8.2f} {values["queries"]:>7.2f}"
+        )
+    total = results["total"]
+    print(
+        f"\n{total["requests"]} requests, "
+        f"{total["throughput"]:.0f} requests/s"
+    )
+    return report("load", results, TOLERANCES, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Hot paths micro-benchmarks across grid sizes and colors counts: clues
+generation (`Game.update_clues`), completion check against the cached goal
+grid (`GameState.update_is_completed`) and game details serialization (cache
+miss of `CachedGame.get_details_json`).
+
+Results are compared with benchmarks/baselines/micro.json (see
+benchmarks/baseline.py).
+
+Run from the project's root with `python -m benchmarks.micro` (`--save` to
+update the baseline).
+"""
+
+import argparse
+import random
+import sys
+from types import SimpleNamespace
+from app.models.game import CachedGame, Game
+from app.models.gamestate import GameState
+from app.models.grid import PaletteGrid
+from app.models.user import UserSummary
+from .baseline import add_arguments, report
+from .grid import best_time
+
+SIZES = [10, 25, 50, 100]
+COLORS_COUNTS = [1, 4, 12]
+DENSITY = 0.6
+# Micro-benchmarks are noisy: only bigger slowdowns are regressions
+TOLERANCES = {"ms": 0.3}
+
+
+def make_content(size: int, colors_count: int):
+    colors = [
+        [random.randrange(256) for _ in range(3)] + [1.0]
+        for _ in range(colors_count)
+    ]
+    return [
+        [random.choice(colors) if random.random() < DENSITY else None
+         for _ in range(size)]
+        for _ in range(size)
+    ]
+
+
+def run():
+    random.seed(0)
+    creator = UserSummary(id=1, pseudo="benchmark")
+    results = {}
+    for size in SIZES:
+        for colors_count in COLORS_COUNTS:
+            content = make_content(size, colors_count)
+            game = Game(id=1, name="benchmark", content=content)
+            game.update_clues()
+            game.update_difficulty()
+            row = SimpleNamespace(**game.model_dump())
+            # Solved state with crossed cells: the completion check has to go
+            # through every cell
+            game_state = GameState(
+                current_content=[
+                    [False if cell is None else cell for cell in content_row]
+                    for content_row in content
+                ]
+            )
+            goal = PaletteGrid.from_content(content)
+            game_state.update_is_completed(goal)
+            assert game_state.is_completed
+
+            grid = f"{size}x{size} {colors_count} color(s)"
+            for name, function in [
+                ("clues", game.update_clues),
+                ("completion", lambda: game_state.update_is_completed(goal)),
+                (
+                    "details json",
+                    lambda: CachedGame.from_row(row).get_details_json(
+                        creator
+                    ),
+                ),
+            ]:
+                results[f"{name} {grid}"] = {"ms": best_time(function)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_arguments(parser)
+    args = parser.parse_args()
+    results = run()
+    print(f"{"case":<40} {"ms":>9}")
+    for case, values in results.items():
+        print(f"{case:<40} {values["ms"]:>9.3f}")
+    return report("micro", results, TOLERANCES, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Game details serialization benchmark: the model returned to FastAPI (and
+encoded by `jsonable_encoder`) with the former default stdlib `json` and the
+orjson responses, the model dumped to an orjson response and the cached game
+(see `CachedGame.get_details_json`), on a miss and a hit.
+
+Run from the project's root with `python -m benchmarks.serialization`.
+"""
+
+import random
+from types import SimpleNamespace
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from app.models.compact import get_json_response
+from app.models.game import CachedGame, Game, GameDetails
+from app.models.user import User, UserSummary
+from .grid import best_time
+
+SIZES = [25, 100]
+COLORS_COUNT = 12
+
+
+def make_content(size: int):
+    colors = [
+        [random.randrange(256) for _ in range(3)] + [1.0]
+        for _ in range(COLORS_COUNT)
+    ]
+    return [
+        [random.choice(colors) if random.random() < 0.6 else None
+         for _ in range(size)]
+        for _ in range(size)
+    ]
+
+
+def render(response_class, game: Game):
+    # What FastAPI does with a returned model
+    return response_class(jsonable_encoder(GameDetails.model_validate(game)))
+
+
+def dump(game: Game):
+    return get_json_response(GameDetails.model_validate(game))
+
+
+def main():
+    random.seed(0)
+    print(
+        f"{"size":>9} {"encoder + json":>15} {"encoder + orjson":>17} "
+        f"{"dump + orjson":>14} {"cache miss":>11} {"cache hit":>10}"
+    )
+    creator = UserSummary(id=1, pseudo="benchmark")
+    for size in SIZES:
+        game = Game(id=1, name="benchmark", content=make_content(size))
+        game.update_clues()
+        game.update_difficulty()
+        game.uniqueness = None
+        game.creator = User(**creator.model_dump())
+        row = SimpleNamespace(**game.model_dump())
+
+        cached_game = CachedGame.from_row(row)
+        body = render(JSONResponse, game).body
+        assert render(ORJSONResponse, game).body == body
+        assert dump(game).body == body
+        assert cached_game.get_details_json(creator) == body
+
+        print(
+            f"{f"{size}x{size}":>9} "
+            f"{best_time(lambda: render(JSONResponse, game)):>12.3f} ms "
+            f"{best_time(lambda: render(ORJSONResponse, game)):>14.3f} ms "
+            f"{best_time(lambda: dump(game)):>11.3f} ms "
+            f"{best_time(
+                lambda: CachedGame.from_row(row).get_details_json(creator)
+            ):>8.3f} ms "
+            f"{best_time(
+                lambda: cached_game.get_details_json(creator)
+            ):>7.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
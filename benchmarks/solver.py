@@ -0,0 +1,72 @@
+"""Solver benchmark: time needed to rate the difficulty of a new puzzle.
+
+Run from the project's root with `python -m benchmarks.solver`.
+"""
+
+import random
+from statistics import median
+from app.config import DIFFICULTY_SOLVER_TIMEOUT
+from app.models.game import Game
+from app.solver import Solver, get_difficulty, solve_line
+
+COLORS = [
+    [0, 0, 0, 1.0],
+    [255, 0, 0, 1.0],
+    [0, 128, 255, 1.0],
+    [255, 200, 0, 1.0],
+]
+SIZES = [10, 25, 50]
+COLORS_COUNTS = [1, 4]
+DENSITIES = [0.7, 0.5]  # Denser grids are usually solved by propagation only
+RUNS = 5
+
+
+def make_content(size: int, colors_count: int, density: float):
+    return [
+        [
+            random.choice(COLORS[:colors_count])
+            if random.random() < density
+            else None
+            for _ in range(size)
+        ]
+        for _ in range(size)
+    ]
+
+
+def main():
+    random.seed(0)
+    print(f"Solver timeout: {DIFFICULTY_SOLVER_TIMEOUT * 1000:.0f} ms")
+    print(
+        f"{"size":>7} {"colors":>6} {"density":>7} "
+        f"{"median ms":>9} {"max ms":>7} {"rounds":>6} {"nodes":>5} "
+        f"{"difficulty":>10}"
+    )
+    for size in SIZES:
+        for colors_count in COLORS_COUNTS:
+            for density in DENSITIES:
+                durations = []
+                for _ in range(RUNS):
+                    game = Game(
+                        name="benchmark",
+                        content=make_content(size, colors_count, density),
+                    )
+                    game.update_clues()
+                    solve_line.cache_clear()  # Measure cold runs
+                    stats = (
+                        Solver.from_clues(
+                            game.clues, timeout=DIFFICULTY_SOLVER_TIMEOUT
+                        )
+                        .solve()
+                        .stats
+                    )
+                    durations.append(stats.duration * 1000)
+                print(
+                    f"{f"{size}x{size}":>7} {colors_count:>6} {density:>7} "
+                    f"{median(durations):>9.1f} {max(durations):>7.1f} "
+                    f"{stats.rounds:>6} {stats.nodes:>5} "
+                    f"{get_difficulty(stats):>10}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Helpers shared by the tests."""
+
+import secrets
+from contextlib import contextmanager
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.config import JWT_COOKIE_NAME
+from app.database import engine
+from app.models.game import game_cache
+from app.models.user import identity_cache
+
+
+@contextmanager
+def count_queries(prefix: str = ""):
+    """Count the statements (starting with `prefix`) run in the block, in a
+    one-item list.
+    """
+    queries_count = [0]
+
+    def count(connection, cursor, statement, parameters, context, many):
+        if statement.startswith(prefix):
+            queries_count[0] += 1
+
+    # Starting from cold caches, so that every request reads what it needs
+    game_cache.clear()
+    identity_cache.clear()
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        yield queries_count
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+
+def sign_up(client: TestClient, name: str):
+    """Create the user `name` and log it in, returning its details."""
+    password = secrets.token_hex(16)
+    username = f"{name}@example.com"
+    response = client.post(
+        "/user",
+        json={"pseudo": name, "username": username, "password": password},
+    )
+    assert response.status_code == 201, response.text
+    response = client.post(
+        "/login", data={"username": username, "password": password}
+    )
+    assert response.status_code == 200, response.text
+    client.cookies.set(JWT_COOKIE_NAME, response.cookies[JWT_COOKIE_NAME])
+    return client.get("/user/me").json()
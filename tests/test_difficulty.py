@@ -0,0 +1,96 @@
+"""Tests of the difficulty ratings made off the request path
+(app/difficulty.py).
+"""
+
+import secrets
+import time
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from sqlmodel import Session
+from app.database import engine
+from app.database.migrate import migrate
+from app.difficulty import rate_difficulty, save_difficulty, schedule_rating
+from app.main import app
+from app.models.game import Game, get_catalog_version
+from .helpers import sign_up
+
+K = [0, 0, 0, 1.0]
+R = [255, 0, 0, 1.0]
+# Solved by its rows alone: rated 1
+CONTENT = [[K, K, K], [R, R, R], [None, None, None]]
+
+
+@pytest.fixture(scope="module")
+def client():
+    migrate(engine)
+    with TestClient(app, base_url="https://testserver") as client:
+        user = sign_up(client, f"test-{secrets.token_hex(4)}")
+        yield client
+        client.delete(f"/user/{user["id"]}")
+
+
+@pytest.fixture
+def game(client: TestClient):
+    """Game rated 5, as when its inline rating timed out."""
+    response = client.post(
+        "/game", json={"name": "test-difficulty", "content": CONTENT}
+    )
+    assert response.status_code == 201, response.text
+    game_id = response.json()["id"]
+    with Session(engine) as session:
+        session.exec(
+            update(Game).where(Game.id == game_id).values(difficulty=5)
+        )
+        session.commit()
+        game = session.get(Game, game_id)
+        session.expunge(game)
+    yield game
+    client.delete(f"/game/{game_id}")
+
+
+def load(game_id: int):
+    with Session(engine) as session:
+        return session.get(Game, game_id)
+
+
+def get_version():
+    with Session(engine) as session:
+        return get_catalog_version(session)
+
+
+def test_rate_difficulty(game: Game):
+    assert rate_difficulty(game.clues, timeout=5) == 1
+    assert rate_difficulty(game.clues, timeout=0) == 5
+
+
+def test_save_difficulty(client: TestClient, game: Game):
+    catalog_version = get_version()
+    # Warm up the cache, which must be invalidated
+    assert client.get(f"/game/{game.id}").json()["difficulty"] == 5
+    save_difficulty(game.id, game.content_hash, 1)
+    saved = load(game.id)
+    assert saved.difficulty == 1
+    assert saved.version == game.version + 1
+    assert get_version() == catalog_version + 1
+    assert client.get(f"/game/{game.id}").json()["difficulty"] == 1
+    # Same rating: nothing written
+    save_difficulty(game.id, game.content_hash, 1)
+    assert load(game.id).version == game.version + 1
+
+
+def test_save_difficulty_of_changed_game(game: Game):
+    # Rated from a content that has been replaced meanwhile
+    save_difficulty(game.id, "0" * 64, 1)
+    saved = load(game.id)
+    assert saved.difficulty == 5
+    assert saved.version == game.version
+
+
+def test_schedule_rating(game: Game):
+    schedule_rating(game)
+    # Rated in the solver process pool
+    deadline = time.monotonic() + 30
+    while load(game.id).difficulty != 1:
+        assert time.monotonic() < deadline, "Game not rated"
+        time.sleep(0.05)
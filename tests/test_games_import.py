@@ -0,0 +1,78 @@
+"""Tests of the resumable bulk imports of games (app/games_import.py)."""
+
+import secrets
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+from sqlmodel import Session
+from app.database import engine
+from app.database.migrate import migrate
+from app.main import app
+from app.models.game import GameImport
+from .helpers import sign_up
+
+CONTENT = [[[0, 0, 0, 1.0], None], [None, [255, 0, 0, 1.0]]]
+IMPORT_ID = "games.jsonl"
+
+
+@pytest.fixture(scope="module")
+def clients():
+    """Clients of two users."""
+    migrate(engine)
+    clients = [
+        TestClient(app, base_url="https://testserver") for _ in range(2)
+    ]
+    users = []
+    try:
+        for client in clients:
+            client.__enter__()
+            users.append(sign_up(client, f"test-{secrets.token_hex(4)}"))
+            client.user = users[-1]
+        yield clients
+    finally:
+        for client, user in zip(clients, users):
+            for game in client.get("/games/me").json():
+                client.delete(f"/game/{game["id"]}")
+            client.delete(f"/user/{user["id"]}")
+            client.__exit__(None, None, None)
+        with Session(engine) as session:
+            session.exec(
+                delete(GameImport).where(
+                    GameImport.creator_id.in_([user["id"] for user in users])
+                )
+            )
+            session.commit()
+
+
+def import_games(client: TestClient, games_count: int):
+    lines = [
+        orjson.dumps({"name": f"import-{i}", "content": CONTENT})
+        for i in range(games_count)
+    ]
+    response = client.post(
+        "/games/import",
+        params={"import_id": IMPORT_ID},
+        content=b"\n".join(lines),
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_imports_are_per_user(clients: list[TestClient]):
+    first, second = clients
+    result = import_games(first, 2)
+    assert result["imported_count"] == 2
+    # Same id, but not the same import
+    result = import_games(second, 3)
+    assert result["resumed_lines_count"] == 0
+    assert result["imported_count"] == 3
+    # Resumed: the lines were imported by the previous run
+    result = import_games(second, 3)
+    assert result["resumed_lines_count"] == 3
+    assert result["imported_count"] == 0
+    result = import_games(first, 3)
+    assert result["resumed_lines_count"] == 2
+    assert result["imported_count"] == 1
+    assert len(first.get("/games/me").json()) == 3
+    assert len(second.get("/games/me").json()) == 3
@@ -0,0 +1,111 @@
+"""Tests of the game states HTTP endpoints."""
+
+import secrets
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+from app.database import engine
+from app.database.migrate import migrate
+from app.main import app
+from app.models.game import game_cache
+from app.models.gamestate import GameState
+from .helpers import sign_up
+
+K = [0, 0, 0, 1.0]
+R = [255, 0, 0, 1.0]
+
+
+@pytest.fixture(scope="module")
+def client():
+    migrate(engine)
+    with TestClient(app, base_url="https://testserver") as client:
+        user = sign_up(client, f"test-{secrets.token_hex(4)}")
+        yield client
+        client.delete(f"/user/{user["id"]}")
+
+
+def get_row_mismatches(game_id: int):
+    with Session(engine) as session:
+        return session.exec(
+            select(GameState.row_mismatches).where(
+                GameState.game_id == game_id
+            )
+        ).one()
+
+
+def patch(client: TestClient, game_id: int, row: int, col: int, value):
+    response = client.patch(
+        f"/gamestate/{game_id}",
+        json={"changes": [{"row": row, "col": col, "value": value}]},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["is_completed"]
+
+
+def test_patch_after_game_change(client: TestClient):
+    goal = [[K, None], [None, K]]
+    response = client.post("/game", json={"name": "test", "content": goal})
+    assert response.status_code == 201, response.text
+    game_id = response.json()["id"]
+    try:
+        response = client.post(
+            f"/gamestate/{game_id}", json={"current_content": goal}
+        )
+        assert response.json()["is_completed"]
+        assert get_row_mismatches(game_id) == [0, 0]
+
+        # The counters were computed against the former content
+        new_goal = [[K, K], [None, K]]
+        response = client.put(
+            f"/game/{game_id}", json={"name": "test", "content": new_goal}
+        )
+        assert response.status_code == 200, response.text
+        assert get_row_mismatches(game_id) is None
+
+        # Recomputed against the new content, then updated in place
+        assert not patch(client, game_id, 0, 0, K)
+        assert get_row_mismatches(game_id) == [1, 0]
+        assert patch(client, game_id, 0, 1, K)
+        assert not patch(client, game_id, 1, 0, R)
+        assert patch(client, game_id, 1, 0, False)
+        response = client.get(f"/gamestate/{game_id}")
+        assert response.json()["is_completed"]
+    finally:
+        client.delete(f"/game/{game_id}")
+
+
+def test_stale_cached_game(client: TestClient):
+    goal = [[K, None], [None, K]]
+    response = client.post("/game", json={"name": "test", "content": goal})
+    assert response.status_code == 201, response.text
+    game_id = response.json()["id"]
+    try:
+        response = client.post(
+            f"/gamestate/{game_id}", json={"current_content": goal}
+        )
+        assert response.json()["is_completed"]
+        stale_game = game_cache.get(game_id)
+        assert stale_game is not None
+
+        new_goal = [[K, K], [None, K]]
+        response = client.put(
+            f"/game/{game_id}", json={"name": "test", "content": new_goal}
+        )
+        assert response.status_code == 200, response.text
+        # As in a worker the invalidation didn't reach
+        game_cache.set(game_id, stale_game)
+
+        response = client.put(
+            f"/gamestate/{game_id}", json={"current_content": new_goal}
+        )
+        assert response.json()["is_completed"]
+        game_cache.set(game_id, stale_game)
+        response = client.put(
+            "/gamestates/batch",
+            json=[{"game_id": game_id, "current_content": goal}],
+        )
+        assert response.json() == [
+            {"game_id": game_id, "is_completed": False}
+        ]
+    finally:
+        client.delete(f"/game/{game_id}")
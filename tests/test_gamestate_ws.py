@@ -0,0 +1,201 @@
+"""Tests of the game states played over WebSocket, and of their batched
+writes (app/gamestate_writer.py).
+
+Flushes are run by the tests rather than every GAMESTATE_FLUSH_INTERVAL, so
+that they are deterministic.
+"""
+
+import secrets
+import time
+from contextlib import contextmanager
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+from app.config import JWT_COOKIE_NAME
+from app.database import engine
+from app.database.migrate import migrate
+from app.gamestate_writer import writer
+from app.main import app
+from app.models.gamestate import GameState
+from .helpers import count_queries, sign_up
+
+K = [0, 0, 0, 1.0]
+R = [255, 0, 0, 1.0]
+GOAL = [[K, None, R], [None, K, None]]
+EMPTY = [[None, None, None], [None, None, None]]
+WRITE_PREFIX = "UPDATE gamestate"
+
+
+@pytest.fixture(scope="module")
+def client():
+    migrate(engine)
+    interval = writer.interval
+    writer.interval = 3600  # Only the tests flush
+    try:
+        with TestClient(app, base_url="https://testserver") as client:
+            user = sign_up(client, f"test-{secrets.token_hex(4)}")
+            client.user = user
+            try:
+                yield client
+            finally:
+                # Game states are deleted along with their user
+                client.delete(f"/user/{user["id"]}")
+    finally:
+        writer.interval = interval
+
+
+@pytest.fixture
+def game_id(client: TestClient):
+    response = client.post(
+        "/game", json={"name": "test-ws", "content": GOAL}
+    )
+    assert response.status_code == 201, response.text
+    game_id = response.json()["id"]
+    response = client.post(
+        f"/gamestate/{game_id}", json={"current_content": EMPTY}
+    )
+    assert response.status_code == 201, response.text
+    yield game_id
+    client.delete(f"/game/{game_id}")
+
+
+@contextmanager
+def connect(client: TestClient, game_id: int):
+    # The cookie jar only sends the secure cookie over https (the one set
+    # by sign_up has no domain)
+    token = client.cookies.get(JWT_COOKIE_NAME, domain="")
+    cookie = f"{JWT_COOKIE_NAME}={token}"
+    with client.websocket_connect(
+        f"/gamestate/{game_id}/ws", headers={"cookie": cookie}
+    ) as websocket:
+        yield websocket
+        # The test client cancels the handler when leaving: wait for it to
+        # close the live game state (and write it if it was the last
+        # connection) first
+        key = (game_id, client.user["id"])
+        live_game_state = writer.get(*key)
+        connections_count = live_game_state.connections_count
+        websocket.close()
+        deadline = time.monotonic() + 5
+        while live_game_state.connections_count == connections_count or (
+            live_game_state.connections_count == 0
+            and writer.get(*key) is not None
+        ):
+            assert time.monotonic() < deadline, "Connection not closed"
+            time.sleep(0.01)
+
+
+def play(websocket, row: int, col: int, value):
+    websocket.send_json(
+        {"changes": [{"row": row, "col": col, "value": value}]}
+    )
+    return websocket.receive_json()
+
+
+def flush(client: TestClient):
+    with count_queries(WRITE_PREFIX) as writes_count:
+        client.portal.call(writer.flush)
+    return writes_count[0]
+
+
+def load(game_id: int):
+    with Session(engine) as session:
+        return session.exec(
+            select(GameState).where(GameState.game_id == game_id)
+        ).one()
+
+
+def test_changes_are_coalesced(client: TestClient, game_id: int):
+    with connect(client, game_id) as websocket:
+        assert websocket.receive_json() == {
+            "game_id": game_id,
+            "is_completed": False,
+        }
+        play(websocket, 0, 0, K)
+        play(websocket, 0, 2, R)
+        assert play(websocket, 1, 1, K)["is_completed"]
+        assert load(game_id).version == 1
+        assert flush(client) == 1
+        game_state = load(game_id)
+        assert game_state.current_content == GOAL
+        assert game_state.is_completed
+        assert game_state.version == 2
+        # Nothing left to write
+        assert flush(client) == 0
+
+
+def test_written_when_last_connection_closes(
+    client: TestClient, game_id: int
+):
+    with connect(client, game_id) as first:
+        first.receive_json()
+        with connect(client, game_id) as second:
+            second.receive_json()
+            play(second, 0, 0, K)
+        assert load(game_id).current_content == EMPTY
+        play(first, 1, 1, K)
+    game_state = load(game_id)
+    assert game_state.current_content == [[K, None, None], [None, K, None]]
+    assert writer.get(game_id, client.user["id"]) is None
+
+
+def test_stale_version_is_rebased(client: TestClient, game_id: int):
+    with connect(client, game_id) as websocket:
+        websocket.receive_json()
+        play(websocket, 0, 0, K)
+        # Written over HTTP meanwhile, bumping the version
+        response = client.put(
+            f"/gamestate/{game_id}",
+            json={"current_content": [[None, None, R], [None, K, None]]},
+        )
+        assert response.status_code == 200, response.text
+        assert load(game_id).version == 2
+        # Stale write, then the write of the rebased state
+        assert flush(client) == 2
+        game_state = load(game_id)
+        assert game_state.current_content == GOAL
+        assert game_state.is_completed
+        assert game_state.version == 3
+
+
+def test_failed_write_is_retried(
+    client: TestClient, game_id: int, monkeypatch: pytest.MonkeyPatch
+):
+    write = writer._write
+    calls = []
+
+    def fail_once(values):
+        calls.append(values)
+        if len(calls) == 1:
+            raise ConnectionError("Database unavailable")
+        return write(values)
+
+    monkeypatch.setattr(writer, "_write", fail_once)
+    with connect(client, game_id) as websocket:
+        websocket.receive_json()
+        play(websocket, 0, 0, K)
+        client.portal.call(writer.flush)
+        assert load(game_id).current_content == EMPTY
+        play(websocket, 1, 1, K)
+        client.portal.call(writer.flush)
+        assert len(calls) == 2
+        assert load(game_id).current_content == [
+            [K, None, None],
+            [None, K, None],
+        ]
+
+
+def test_invalid_messages(client: TestClient, game_id: int):
+    with connect(client, game_id) as websocket:
+        websocket.receive_json()
+        websocket.send_bytes(b'{"changes": []}')
+        assert websocket.receive_json()["detail"][0]["type"] == "text_frame"
+        websocket.send_text("{")
+        detail = websocket.receive_json()["detail"]
+        assert detail[0]["type"] == "json_invalid"
+        assert "out of the grid" in play(websocket, 2, 0, K)["detail"]
+        # Still playing
+        assert play(websocket, 0, 0, K) == {
+            "game_id": game_id,
+            "is_completed": False,
+        }
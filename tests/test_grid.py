@@ -0,0 +1,121 @@
+"""Tests of the NumPy palette grids (app/models/grid.py) against the former
+nested lists implementation, kept by benchmarks/grid.py: clues and
+completions must be the same.
+"""
+
+import random
+import pytest
+from app.models.game import Game
+from app.models.gamestate import CellChange, GameState
+from app.models.grid import PaletteGrid
+from benchmarks.grid import legacy_get_clues, legacy_is_completed
+
+K = [0, 0, 0, 1.0]
+R = [255, 0, 0, 1.0]
+B = [0, 128, 255, 0.5]
+CELLS = [None, False, K, R, B]
+
+CONTENTS = [
+    [[None, None, None], [None, None, None]],
+    [[K, K, None, K], [None, None, None, None], [R, R, K, K]],
+    [[K], [K], [None], [R]],
+    [[K, None, R, R, B, B, B]],
+    [[False, False, K], [K, False, None], [None, None, False]],
+    [[], []],
+]
+
+
+def make_contents(count: int, seed: int = 0):
+    """Random contents of various shapes, `CONTENTS` first."""
+    generator = random.Random(seed)
+    contents = list(CONTENTS)
+    for _ in range(count):
+        rows_count = generator.randint(1, 8)
+        columns_count = generator.randint(1, 8)
+        contents.append(
+            [
+                [generator.choice(CELLS) for _ in range(columns_count)]
+                for _ in range(rows_count)
+            ]
+        )
+    return contents
+
+
+def make_current(goal, generator: random.Random):
+    """Game state content close to the `goal`, possibly completing it."""
+    current = []
+    for row in goal:
+        current_row = []
+        for cell in row:
+            if generator.random() < 0.1:
+                cell = generator.choice(CELLS)
+            elif cell is None and generator.random() < 0.5:
+                cell = False
+            current_row.append(cell)
+        current.append(current_row)
+    return current
+
+
+@pytest.mark.parametrize("content", make_contents(200))
+def test_clues(content):
+    assert PaletteGrid.from_content(content).get_clues() == legacy_get_clues(
+        content
+    )
+    game = Game(name="test", content=content)
+    game.update_clues()
+    assert game.clues == legacy_get_clues(content)
+    assert (game.rows_count, game.columns_count) == (
+        len(content),
+        len(content[0]),
+    )
+
+
+@pytest.mark.parametrize("goal", make_contents(200, seed=1))
+def test_completion(goal):
+    generator = random.Random(repr(goal))
+    for current in [goal, make_current(goal, generator)]:
+        expected = legacy_is_completed(current, goal)
+        for goal_content in (goal, PaletteGrid.from_content(goal)):
+            game_state = GameState(current_content=current)
+            game_state.update_is_completed(goal_content)
+            assert game_state.is_completed == expected
+
+
+@pytest.mark.parametrize("goal", make_contents(50, seed=2))
+def test_completion_after_changes(goal):
+    """Completions updated from the per row mismatch counters."""
+    if len(goal[0]) == 0:
+        return
+    generator = random.Random(repr(goal))
+    goal_grid = PaletteGrid.from_content(goal)
+    game_state = GameState(current_content=make_current(goal, generator))
+    game_state.update_is_completed(goal_grid)
+    for _ in range(50):
+        row = generator.randrange(len(goal))
+        col = generator.randrange(len(goal[0]))
+        # Mostly playing the goal, so that some states complete it
+        value = (
+            goal[row][col]
+            if generator.random() < 0.7
+            else generator.choice(CELLS)
+        )
+        game_state.apply_changes(
+            [CellChange(row=row, col=col, value=value)], goal_grid
+        )
+        assert game_state.is_completed == legacy_is_completed(
+            game_state.current_content, goal
+        )
+
+
+def test_crossed_cells():
+    # Crossed cells match empty goal cells, not the other way round
+    for current, goal, expected in [
+        ([[K, False]], [[K, None]], True),
+        ([[K, None]], [[K, False]], False),
+        ([[K, False]], [[K, False]], True),
+        ([[None, None]], [[K, None]], False),
+    ]:
+        game_state = GameState(current_content=current)
+        game_state.update_is_completed(goal)
+        assert game_state.is_completed == expected
+        assert legacy_is_completed(current, goal) == expected
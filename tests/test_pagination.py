@@ -0,0 +1,132 @@
+"""Tests of the keyset pagination of the lists (app/pagination.py)."""
+
+import secrets
+import pytest
+from fastapi import Response
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from sqlmodel import Session, select
+from app.database import engine
+from app.database.migrate import migrate
+from app.main import app
+from app.models.game import Game
+from app.pagination import (
+    NEXT_CURSOR_HEADER,
+    PageParams,
+    encode_cursor,
+    get_page,
+    paginate,
+)
+from .helpers import sign_up
+
+CONTENT = [[[0, 0, 0, 1.0], None], [None, [255, 0, 0, 1.0]]]
+# Difficulties and rows counts of the games (None: not backfilled)
+DIFFICULTIES = [3, 1, 3, 5, 1, 2, 3]
+ROWS_COUNTS = [None, 2, None, 4, 2, None, 1]
+
+
+@pytest.fixture(scope="module")
+def client():
+    migrate(engine)
+    with TestClient(app, base_url="https://testserver") as client:
+        user = sign_up(client, f"test-{secrets.token_hex(4)}")
+        client.game_ids = []
+        try:
+            with Session(engine) as session:
+                for difficulty, rows_count in zip(DIFFICULTIES, ROWS_COUNTS):
+                    response = client.post(
+                        "/game", json={"name": "test-page", "content": CONTENT}
+                    )
+                    assert response.status_code == 201, response.text
+                    game_id = response.json()["id"]
+                    client.game_ids.append(game_id)
+                    session.exec(
+                        update(Game)
+                        .where(Game.id == game_id)
+                        .values(difficulty=difficulty, rows_count=rows_count)
+                    )
+                session.commit()
+            yield client
+        finally:
+            for game_id in client.game_ids:
+                client.delete(f"/game/{game_id}")
+            client.delete(f"/user/{user["id"]}")
+
+
+def get_expected_ids(client: TestClient, values: list, ascending: bool):
+    """Game ids ordered by `values` then id, NULL values after the
+    others.
+    """
+    keys = [
+        (value is None, 0 if value is None else value, game_id)
+        for value, game_id in zip(values, client.game_ids)
+    ]
+    return [key[2] for key in sorted(keys, reverse=not ascending)]
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_walk(client: TestClient, order: str):
+    ids = []
+    params = {"sort": "difficulty", "order": order, "limit": 2}
+    while True:
+        response = client.get("/games/me", params=params)
+        assert response.status_code == 200, response.text
+        ids.extend(game["id"] for game in response.json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+        params["cursor"] = cursor
+    assert ids == get_expected_ids(client, DIFFICULTIES, order == "asc")
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_walk_null_values(client: TestClient, order: str):
+    # difficulty is NOT NULL in the schema: walking the games by their
+    # rows count, NULL until backfilled
+    ids = []
+    params = PageParams(limit=2, order=order)
+    with Session(engine) as session:
+        while True:
+            statement = select(Game).where(Game.id.in_(client.game_ids))
+            statement = paginate(statement, Game.rows_count, Game.id, params)
+            response = Response()
+            rows = get_page(
+                session.exec(statement).all(),
+                "rows_count",
+                "id",
+                params,
+                response,
+            )
+            ids.extend(game.id for game in rows)
+            cursor = response.headers.get(NEXT_CURSOR_HEADER)
+            if cursor is None:
+                break
+            params.cursor = cursor
+    assert ids == get_expected_ids(client, ROWS_COUNTS, order == "asc")
+
+
+@pytest.mark.parametrize(
+    "url, sort, cursor",
+    [
+        ("/games", "difficulty", "not base64!"),
+        ("/games", "difficulty", encode_cursor({"difficulty": 1})),
+        ("/games", "difficulty", encode_cursor([1])),
+        ("/games", "difficulty", encode_cursor(["1", 1])),
+        ("/games", "difficulty", encode_cursor([1, 2**40])),
+        ("/games", "difficulty", encode_cursor([True, 1])),
+        ("/games", "name", encode_cursor([1, 1])),
+        ("/games", "id", encode_cursor([None, None])),
+        ("/users", "pseudo", encode_cursor([None, 1])),
+    ],
+)
+def test_invalid_cursor(client: TestClient, url: str, sort: str, cursor):
+    response = client.get(url, params={"sort": sort, "cursor": cursor})
+    assert response.status_code == 400, response.text
+
+
+def test_valid_cursor(client: TestClient):
+    response = client.get(
+        "/games",
+        params={"sort": "name", "cursor": encode_cursor(["test-page", 0])},
+    )
+    assert response.status_code == 200, response.text
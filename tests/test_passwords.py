@@ -0,0 +1,99 @@
+"""Tests of the password hashings, which run without holding a database
+connection (see app/security.py).
+"""
+
+import secrets
+import pytest
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+from sqlalchemy import update
+from sqlmodel import Session
+from app import security
+from app.config import BCRYPT_ROUNDS
+from app.database import engine
+from app.database.migrate import migrate
+from app.main import app
+from app.models.user import User, identity_cache
+
+PASSWORD = secrets.token_hex(16)
+
+
+@pytest.fixture(scope="module")
+def client():
+    migrate(engine)
+    with TestClient(app, base_url="https://testserver") as client:
+        yield client
+
+
+@pytest.fixture
+def checked_out_counts(monkeypatch: pytest.MonkeyPatch):
+    """Connections checked out of the pool by each password operation."""
+    counts = []
+    run_in_password_pool = security._run_in_password_pool
+
+    def run_and_count(*args):
+        counts.append(engine.pool.checkedout())
+        return run_in_password_pool(*args)
+
+    monkeypatch.setattr(security, "_run_in_password_pool", run_and_count)
+    return counts
+
+
+@pytest.fixture
+def user(client: TestClient):
+    name = f"test-{secrets.token_hex(4)}"
+    user = {"pseudo": name, "username": f"{name}@example.com"}
+    response = client.post("/user", json={**user, "password": PASSWORD})
+    assert response.status_code == 201, response.text
+    user["id"] = response.json()["id"]
+    yield user
+    client.delete(f"/user/{user["id"]}")
+
+
+def login(client: TestClient, user: dict, password: str = PASSWORD):
+    return client.post(
+        "/login", data={"username": user["username"], "password": password}
+    )
+
+
+def get_stored_hash(user: dict):
+    with Session(engine) as session:
+        return session.get(User, user["id"]).password
+
+
+def test_sign_up_and_login(client: TestClient, checked_out_counts: list):
+    name = f"test-{secrets.token_hex(4)}"
+    user = {"pseudo": name, "username": f"{name}@example.com"}
+    response = client.post("/user", json={**user, "password": PASSWORD})
+    assert response.status_code == 201, response.text
+    user["id"] = response.json()["id"]
+    try:
+        assert login(client, user).status_code == 200
+        assert login(client, user, "wrong password").status_code == 401
+        response = client.put(
+            f"/user/{user["id"]}", json={**user, "password": PASSWORD}
+        )
+        assert response.status_code == 200, response.text
+    finally:
+        client.delete(f"/user/{user["id"]}")
+    assert checked_out_counts == [0, 0, 0, 0]
+
+
+def test_outdated_hash_is_updated(
+    client: TestClient, user: dict, checked_out_counts: list
+):
+    outdated_context = CryptContext(
+        schemes=["bcrypt"], bcrypt__rounds=BCRYPT_ROUNDS - 1
+    )
+    with Session(engine) as session:
+        session.exec(
+            update(User)
+            .where(User.id == user["id"])
+            .values(password=outdated_context.hash(PASSWORD))
+        )
+        session.commit()
+    identity_cache.clear()
+    assert login(client, user).status_code == 200
+    assert checked_out_counts == [0]
+    assert get_stored_hash(user).startswith(f"$2b${BCRYPT_ROUNDS:02}$")
+    assert login(client, user).status_code == 200
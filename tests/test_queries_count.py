@@ -0,0 +1,114 @@
+"""Regression tests of the number of SQL statements run by the list and
+details endpoints, which must not depend on the amount of rows returned.
+
+They run against the configured database (use a local, throwaway one): the
+migrations are applied to it, and the users and games created by the tests
+are deleted at the end.
+
+Run from the project's root with `python -m pytest`.
+"""
+
+import secrets
+import pytest
+from fastapi.testclient import TestClient
+from app.database import engine
+from app.database.migrate import migrate
+from app.main import app
+from .helpers import count_queries, sign_up
+
+GAMES_COUNT = 6
+CONTENT = [[[0, 0, 0, 1.0], None], [None, [255, 0, 0, 1.0]]]
+
+
+@pytest.fixture(scope="module")
+def client():
+    migrate(engine)
+    # https: the authentication cookie is a secure one
+    with TestClient(app, base_url="https://testserver") as client:
+        name = f"test-{secrets.token_hex(4)}"
+        user = sign_up(client, name)
+        game_ids = []
+        try:
+            for i in range(GAMES_COUNT):
+                response = client.post(
+                    "/game", json={"name": f"{name}-{i}", "content": CONTENT}
+                )
+                assert response.status_code == 201, response.text
+                game_id = response.json()["id"]
+                game_ids.append(game_id)
+                response = client.post(
+                    f"/gamestate/{game_id}",
+                    json={"current_content": CONTENT},
+                )
+                assert response.status_code == 201, response.text
+            client.user = user
+            client.game_ids = game_ids
+            yield client
+        finally:
+            # Game states are deleted along with their game and user
+            for game_id in game_ids:
+                client.delete(f"/game/{game_id}")
+            client.delete(f"/user/{user["id"]}")
+
+
+def get_queries_counts(client: TestClient, url: str, params: dict):
+    """Statements run by `url` returning 1 and GAMES_COUNT rows."""
+    counts = []
+    for limit in (1, GAMES_COUNT):
+        with count_queries() as queries_count:
+            response = client.get(url, params={**params, "limit": limit})
+        assert response.status_code == 200, response.text
+        assert len(response.json()) == limit
+        counts.append(queries_count[0])
+    return counts
+
+
+@pytest.mark.parametrize(
+    "url, expected_count",
+    [
+        # Catalog version (of the ETag) and games with their creator
+        ("/games", 2),
+        # Same, and the current user
+        ("/games/me", 3),
+        ("/user/{user_id}/games", 2),
+        # Current user and game states
+        ("/gamestatescompletion", 2),
+    ],
+)
+def test_lists(client: TestClient, url: str, expected_count: int):
+    user_id = client.user["id"]
+    params = {"creator_id": user_id} if url == "/games" else {}
+    counts = get_queries_counts(
+        client, url.format(user_id=user_id), params
+    )
+    assert counts == [expected_count, expected_count]
+
+
+def test_users(client: TestClient):
+    with count_queries() as queries_count:
+        response = client.get(f"/user/{client.user["id"]}")
+    assert response.status_code == 200, response.text
+    assert len(response.json()["created_games_ids"]) == GAMES_COUNT
+    # User, and the ids of its games
+    assert queries_count[0] == 2
+
+
+def test_game_details(client: TestClient):
+    with count_queries() as queries_count:
+        response = client.get(f"/game/{client.game_ids[0]}")
+    assert response.status_code == 200, response.text
+    # Game, and its creator
+    assert queries_count[0] == 2
+
+
+def test_batches(client: TestClient):
+    batches = [("/games/batch", "id"), ("/gamestates/batch", "game_id")]
+    for url, name in batches:
+        counts = []
+        for ids in (client.game_ids[:1], client.game_ids):
+            with count_queries() as queries_count:
+                response = client.get(url, params={name: ids})
+            assert response.status_code == 200, response.text
+            assert len(response.json()) == len(ids)
+            counts.append(queries_count[0])
+        assert counts[0] == counts[1], url
@@ -0,0 +1,21 @@
+"""Regression test of the query plans: every query run by the routes must
+be served by an index (see app/database/explain_check.py).
+"""
+
+from fastapi.testclient import TestClient
+from app.database import engine
+from app.database.explain_check import PlanChecker, call_routes
+from app.database.migrate import migrate
+from app.main import app
+
+
+def test_no_sequential_scans():
+    migrate(engine)
+    with PlanChecker(engine) as checker, TestClient(app) as client:
+        call_routes(client, engine)
+    assert checker.statements_count > 0
+    seq_scans = "\n".join(
+        f"{", ".join(sorted(tables))}: {statement}"
+        for statement, tables in checker.seq_scans.items()
+    )
+    assert not checker.seq_scans, f"Sequential scans of\n{seq_scans}"
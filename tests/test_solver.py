@@ -0,0 +1,101 @@
+"""Tests of the nonogram solver (app/solver.py): line solving, uniqueness
+and difficulty.
+"""
+
+import pytest
+from app.models.game import Game
+from app.solver import (
+    EMPTY,
+    Solver,
+    Uniqueness,
+    get_difficulty,
+    get_uniqueness,
+    solve_line,
+)
+
+# Cell domains (bitmasks) with up to two colors
+A = 1 << 1
+B = 1 << 2
+ANY = EMPTY | A | B
+
+K = [0, 0, 0, 1.0]
+R = [255, 0, 0, 1.0]
+
+
+def get_clues(content):
+    game = Game(name="test", content=content)
+    game.update_clues()
+    return game.clues
+
+
+@pytest.mark.parametrize(
+    "clue, domains, expected",
+    [
+        # Overlap of the possible positions
+        (((1, 3),), (ANY,) * 5, (EMPTY | A,) * 2 + (A,) + (EMPTY | A,) * 2),
+        (((1, 5),), (ANY,) * 5, (A,) * 5),
+        ((), (ANY,) * 3, (EMPTY,) * 3),
+        # Same color blocks are separated by an empty cell
+        (((1, 2), (1, 2)), (ANY,) * 5, (A, A, EMPTY, A, A)),
+        # Different colors may touch
+        (((1, 2), (2, 2)), (ANY,) * 4, (A, A, B, B)),
+        (
+            ((1, 1), (2, 1)),
+            (ANY,) * 3,
+            (EMPTY | A, EMPTY | A | B, EMPTY | B),
+        ),
+        # Known cells
+        (((1, 1),), (ANY, A, ANY), (EMPTY, A, EMPTY)),
+        (((1, 2),), (ANY, EMPTY, ANY, ANY), (EMPTY, EMPTY, A, A)),
+        # Contradictions
+        (((1, 3),), (ANY,) * 2, None),
+        (((1, 1),), (EMPTY,) * 3, None),
+        (((1, 2), (1, 1)), (ANY,) * 3, None),
+    ],
+)
+def test_solve_line(clue, domains, expected):
+    assert solve_line(clue, domains) == expected
+
+
+def test_unique_grid():
+    content = [
+        [K, K, None],
+        [None, R, R],
+        [K, None, R],
+    ]
+    clues = get_clues(content)
+    assert get_uniqueness(clues, timeout=5) == Uniqueness.UNIQUE
+    result = Solver.from_clues(clues).solve()
+    colors = [None, K, R]
+    assert [
+        colors[index] for index in result.solutions[0]
+    ] == [cell for row in content for cell in row]
+
+
+def test_ambiguous_grid():
+    # The other diagonal has the same clues
+    clues = get_clues([[K, None], [None, K]])
+    assert get_uniqueness(clues, timeout=5) == Uniqueness.AMBIGUOUS
+
+
+def test_budget_exceeded():
+    clues = get_clues([[K, None], [None, K]])
+    # Stopped after the first solution
+    assert get_uniqueness(clues, timeout=5, max_nodes=1) == Uniqueness.UNKNOWN
+    result = Solver.from_clues(clues, timeout=0).solve()
+    assert not result.is_solved
+    assert result.stats.exhausted and result.stats.timed_out
+    assert get_uniqueness(clues, timeout=0) == Uniqueness.UNKNOWN
+
+
+def test_difficulty():
+    def rate(content, **kwargs):
+        solver = Solver.from_clues(get_clues(content), **kwargs)
+        return get_difficulty(solver.solve().stats)
+
+    # Solved by the rows alone
+    assert rate([[K, K, K], [R, R, R], [None, None, None]]) == 1
+    # A single guess
+    assert rate([[K, None], [None, K]]) == 4
+    # Out of time
+    assert rate([[K, K, K], [R, R, R]], timeout=0) == 5